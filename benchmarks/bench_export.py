@@ -0,0 +1,274 @@
+"""Times each stage of an export over synthetic collections of increasing size.
+
+    python benchmarks/bench_export.py --notes 1000 10000 100000 --output results.json
+    python benchmarks/bench_export.py --compare before.json --output after.json
+
+Collections are generated by synth.py and kept in --data-dir, so later runs (e.g. on another
+commit) time the same data. Every (size, grouping, predictive days, format) case times these stages:
+
+- query: reading and classifying the deck's cards and notes
+- first_review_sort: building the first-review index and ordering every bucket by it
+- row_extraction: splitting note fields into rows for every exported card
+- new_card_prediction: picking the new cards for each predicted day
+- interval_forecast: projecting every review card's interval over the predicted days (NumPy if installed)
+- write: building the sections and writing all files, rows already extracted
+- total: an uninstrumented VocabularyExporter.export() from scratch
+- unchanged: the same export repeated, every file already up to date and left alone
+- delta: a delta export on the day after another one, with no reviews in between (status grouping only)
+
+Each stage reports the fastest of --repeat runs in milliseconds. With --memory, one more export per case
+runs under tracemalloc and its peak Python allocation is reported as peak_mb.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from plugin.collection import SqliteCollection  # noqa: E402
+from plugin.delta import DELTA_RECORD_NAME, DeltaRecord, delta_record_key  # noqa: E402
+from plugin.exporter import VocabularyExporter, get_interval_forecast, get_new_cards_by_day  # noqa: E402
+from plugin.models import ExportSettings  # noqa: E402
+from plugin.snapshot import CardSnapshot, get_first_review_index  # noqa: E402
+from plugin.writers import WRITERS  # noqa: E402
+from synth import generate_collection  # noqa: E402
+
+FIELDS = ["Word", "Word Meaning", "Front", "Back", "Kanji", "Meaning"]
+GROUPINGS = ["none", "status"]
+PREDICTIVE_DAYS = [0, 7, 30]
+STAGES = [
+    "query",
+    "first_review_sort",
+    "row_extraction",
+    "new_card_prediction",
+    "interval_forecast",
+    "write",
+    "total",
+    "unchanged",
+    "delta",
+]
+MAX_REVLOG = 5_000_000
+
+
+def collection_path(data_dir: str, notes: int, revlog: int, deck_depth: int) -> str:
+    path = os.path.join(data_dir, f"synth_{notes}n_{revlog}r_{deck_depth}d.anki2")
+    if not os.path.exists(path):
+        print(f"generating {os.path.basename(path)}...", file=sys.stderr)
+        generate_collection(path, notes=notes, revlog=revlog, deck_depth=deck_depth)
+    return path
+
+
+def best_of(repeat: int, run: Callable[[], Dict[str, float]]) -> Dict[str, float]:
+    best: Dict[str, float] = {}
+    for _ in range(repeat):
+        for stage, ms in run().items():
+            best[stage] = min(ms, best.get(stage, ms))
+    return best
+
+
+def peak_memory_mb(col: SqliteCollection, settings: ExportSettings, out_dir: str) -> float:
+    clear_directory(out_dir)
+    tracemalloc.start()
+    try:
+        result = VocabularyExporter(settings, col).export(out_dir)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if not result.success:
+        raise RuntimeError(result.error_message)
+    return peak / (1024 * 1024)
+
+
+def time_stages(col: SqliteCollection, settings: ExportSettings, out_dir: str) -> Dict[str, float]:
+    stages: Dict[str, float] = {}
+
+    def timed(stage: str, fn: Callable):
+        start = time.perf_counter()
+        result = fn()
+        stages[stage] = (time.perf_counter() - start) * 1000
+        return result
+
+    snapshot = CardSnapshot(col, settings.deck, settings.fields, settings.collapse_siblings, buckets=settings.buckets)
+    timed("query", snapshot.fetch)
+    timed("first_review_sort", lambda: snapshot.sort(get_first_review_index(col, settings.deck)))
+
+    def row_extraction() -> None:
+        for cid in snapshot.card_ids:
+            snapshot.row(cid)
+
+    timed("row_extraction", row_extraction)
+
+    exporter = VocabularyExporter(settings, col)
+    exporter._snapshot = snapshot
+    if settings.predictive_days > 0 and settings.grouping == "status":
+        exporter._new_cards_by_day = timed(
+            "new_card_prediction", lambda: get_new_cards_by_day(col, settings.deck, settings.predictive_days)
+        )
+    else:
+        stages["new_card_prediction"] = 0.0
+    if settings.predictive_days > 0:
+        timed("interval_forecast", lambda: get_interval_forecast(col, snapshot, settings.predictive_days, 0.9))
+    else:
+        stages["interval_forecast"] = 0.0
+
+    # files left by an earlier run would be skipped as unchanged, so these two write everything
+    clear_directory(out_dir)
+    result = timed("write", lambda: exporter._perform_export(out_dir, None))
+    if not result.success:
+        raise RuntimeError(result.error_message)
+
+    clear_directory(out_dir)
+    result = timed("total", lambda: VocabularyExporter(settings, col).export(out_dir))
+    if not result.success:
+        raise RuntimeError(result.error_message)
+    stages["cards"] = result.total_cards
+    stages["files"] = len(result.files)
+    stages["bytes"] = sum(os.path.getsize(os.path.join(out_dir, name)) for name in result.files)
+
+    result = timed("unchanged", lambda: VocabularyExporter(settings, col).export(out_dir))
+    if result.files_created or result.files_updated:
+        raise RuntimeError("repeating the export rewrote files")
+
+    if settings.grouping == "status":
+        delta_settings = replace(settings, delta_export=True)
+        VocabularyExporter(delta_settings, col).export(out_dir)
+        # the first delta lists every card; dating it a day back makes the next one compare against it
+        record = DeltaRecord(
+            os.path.join(out_dir, DELTA_RECORD_NAME), col.path, delta_record_key(settings.deck, settings.buckets)
+        )
+        record.start_day("yesterday")
+        record.save()
+        result = timed("delta", lambda: VocabularyExporter(delta_settings, col).export(out_dir))
+        if not result.success or result.total_cards:
+            raise RuntimeError("a delta without reviews listed cards")
+    else:
+        stages["delta"] = 0.0
+    return stages
+
+
+def clear_directory(path: str) -> None:
+    for name in os.listdir(path):
+        os.remove(os.path.join(path, name))
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(previous: dict, results: List[dict]) -> None:
+    keys = ("notes", "revlog", "grouping", "predictive_days", "format")
+    defaults = {"format": "markdown"}
+    before = {tuple(case.get(key, defaults.get(key)) for key in keys): case["stages"] for case in previous["results"]}
+    print(f"\ncompared with {previous.get('commit') or 'previous run'}:")
+    for case in results:
+        old = before.get(tuple(case[key] for key in keys))
+        if old is None:
+            continue
+        changes = []
+        for stage in STAGES + ["peak_mb"]:
+            if old.get(stage) and stage in case["stages"]:
+                changes.append(f"{stage} {case['stages'][stage] / old[stage] - 1:+.0%}")
+        label = f"{case['notes']:>7} {case['grouping']:>6} {case['predictive_days']:>3}d {case['format']:>8}"
+        print(f"{label}  " + ", ".join(changes))
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark export stages over synthetic collections.")
+    parser.add_argument("--notes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--revlog-per-note", type=int, default=20, help=f"revlog rows per note, at most {MAX_REVLOG}")
+    parser.add_argument("--deck-depth", type=int, default=4)
+    parser.add_argument("--grouping", nargs="+", choices=GROUPINGS, default=GROUPINGS)
+    parser.add_argument("--predictive-days", type=int, nargs="+", default=PREDICTIVE_DAYS)
+    parser.add_argument("--format", nargs="+", choices=sorted(WRITERS), default=["markdown"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "vocab_export_bench"))
+    parser.add_argument("--output", default="bench_export.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    parser.add_argument("--memory", action="store_true", help="also measure each case's peak memory (slower)")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> None:
+    args = parse_args(argv)
+    os.makedirs(args.data_dir, exist_ok=True)
+    out_dir = tempfile.mkdtemp(prefix="vocab_export_bench_out")
+
+    results = []
+    header = " ".join(f"{stage[:10]:>10}" for stage in STAGES)
+    print(f"{'notes':>7} {'revlog':>8} {'group':>6} {'days':>4} {'format':>8} {'cards':>7} {header}")
+    try:
+        for notes in args.notes:
+            revlog = min(notes * args.revlog_per_note, MAX_REVLOG)
+            col = SqliteCollection(collection_path(args.data_dir, notes, revlog, args.deck_depth))
+            try:
+                for grouping, days, output_format in itertools.product(
+                    args.grouping, args.predictive_days, args.format
+                ):
+                    if grouping == "none" and days > 0:
+                        continue
+                    settings = ExportSettings(
+                        fields=FIELDS, grouping=grouping, predictive_days=days, format=output_format
+                    )
+                    stages = best_of(args.repeat, lambda: time_stages(col, settings, out_dir))
+                    if args.memory:
+                        stages["peak_mb"] = peak_memory_mb(col, settings, out_dir)
+                    case = {
+                        "notes": notes,
+                        "revlog": revlog,
+                        "grouping": grouping,
+                        "predictive_days": days,
+                        "format": output_format,
+                    }
+                    results.append({**case, "stages": stages})
+                    print(
+                        f"{notes:>7} {revlog:>8} {grouping:>6} {days:>4} {output_format:>8} {stages['cards']:>7} "
+                        + " ".join(f"{stages[s]:>10.1f}" for s in STAGES)
+                        + (f" {stages['peak_mb']:>8.1f} MB" if args.memory else "")
+                    )
+            finally:
+                col.close()
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nresults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
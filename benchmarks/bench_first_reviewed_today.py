@@ -0,0 +1,86 @@
+"""Shows that finding the cards first reviewed today costs the same regardless of revlog history.
+
+Run with `python benchmarks/bench_first_reviewed_today.py`. Each row keeps the deck size and the
+number of reviews done today fixed and grows only the older review history.
+"""
+
+import importlib.util
+import random
+import sqlite3
+import time
+from pathlib import Path
+
+spec = importlib.util.spec_from_file_location("queries", Path(__file__).parent.parent / "plugin" / "queries.py")
+queries = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(queries)
+
+# the correlated subquery this replaced, kept here for comparison
+LEGACY_QUERY = """
+    SELECT DISTINCT r.cid
+    FROM revlog r
+    JOIN cards c ON r.cid = c.id
+    WHERE c.did = ? AND r.id >= ?
+    AND r.id = (SELECT MIN(id) FROM revlog WHERE cid = r.cid)
+"""
+
+CARDS = 50_000
+REVIEWS_TODAY = 500
+FIRST_SEEN_TODAY = 250
+HISTORY_SIZES = [10_000, 100_000, 1_000_000, 3_000_000]
+REPEATS = 20
+DAY_START = 1_700_000_000_000
+
+
+def build_collection(history: int) -> sqlite3.Connection:
+    db = sqlite3.connect(":memory:")
+    db.executescript(
+        """
+        CREATE TABLE cards (id integer primary key, nid integer not null, did integer not null,
+            ord integer not null, mod integer not null, usn integer not null, type integer not null,
+            queue integer not null, due integer not null, ivl integer not null, factor integer not null,
+            reps integer not null, lapses integer not null, left integer not null, odue integer not null,
+            odid integer not null, flags integer not null, data text not null);
+        CREATE TABLE revlog (id integer primary key, cid integer not null, usn integer not null,
+            ease integer not null, ivl integer not null, lastIvl integer not null, factor integer not null,
+            time integer not null, type integer not null);
+        CREATE INDEX ix_revlog_cid ON revlog (cid);
+        """
+    )
+    total_cards = CARDS + FIRST_SEEN_TODAY
+    db.executemany(
+        "INSERT INTO cards VALUES (?, 0, 1, 0, 0, 0, 2, 2, 0, 10, 2500, 0, 0, 0, 0, 0, 0, '')",
+        ((cid,) for cid in range(1, total_cards + 1)),
+    )
+
+    rng = random.Random(history)
+    old = ((DAY_START - 1 - i * 37, rng.randint(1, CARDS)) for i in range(history))
+    db.executemany("INSERT INTO revlog VALUES (?, ?, 0, 3, 1, 0, 2500, 1000, 1)", old)
+    today = [
+        (DAY_START + i, CARDS + 1 + i if i < FIRST_SEEN_TODAY else rng.randint(1, CARDS))
+        for i in range(REVIEWS_TODAY)
+    ]
+    db.executemany("INSERT INTO revlog VALUES (?, ?, 0, 3, 1, 0, 2500, 1000, 1)", today)
+    db.execute("ANALYZE")
+    return db
+
+
+def time_query(db: sqlite3.Connection, sql: str, *args) -> tuple[float, int]:
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        result = db.execute(sql, args).fetchall()
+    return (time.perf_counter() - start) / REPEATS * 1000, len(result)
+
+
+def main() -> None:
+    query = queries.FIRST_REVIEWED_TODAY_QUERY.format(where="c.did IN (1)")
+    print(f"{'revlog rows':>12} {'query ms':>10} {'legacy ms':>10} {'cards':>6}")
+    for history in HISTORY_SIZES:
+        db = build_collection(history)
+        ms, found = time_query(db, query, DAY_START, DAY_START)
+        legacy_ms, _ = time_query(db, LEGACY_QUERY, 1, DAY_START)
+        print(f"{history + REVIEWS_TODAY:>12} {ms:>10.2f} {legacy_ms:>10.2f} {found:>6}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Measures what loading the add-on package costs, and checks the exporter stays out of it.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 20 --max-ms 5
+
+Each run imports the package in a fresh interpreter with -X importtime and takes the package's
+cumulative import time. The export modules (the dialog, exporter and everything they import) are supposed to
+load on first use only; the script fails if any of them were imported at startup, or if the startup
+import took longer than --max-ms. Outside Anki (no aqt) only the package's own code is timed.
+"""
+
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "plugin"
+DEFERRED = [
+    "auto_export",
+    "batch",
+    "cache",
+    "config",
+    "delta",
+    "dialog",
+    "exporter",
+    "forecast",
+    "manifest",
+    "metrics",
+    "normalize",
+    "snapshot",
+    "writers",
+]
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """Cumulative import time in microseconds of every module importing `module` loaded."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times: Dict[str, int] = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:") :].split("|"))
+        if cumulative.isdigit():
+            times[name] = int(cumulative)
+    return times
+
+
+def module_level_imports(path: str) -> List[str]:
+    """Package modules imported by the file's top-level code, including under `if mw is not None:`."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    names: List[str] = []
+    pending: List[ast.stmt] = list(tree.body)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        if isinstance(node, ast.ImportFrom) and node.level == 1:
+            names.extend([node.module] if node.module else [alias.name for alias in node.names])
+        for field in ("body", "orelse", "finalbody", "handlers"):
+            pending.extend(getattr(node, field, []))
+    return names
+
+
+def measure(module: str, repeat: int) -> Tuple[float, List[str]]:
+    runs = []
+    loaded: List[str] = []
+    for _ in range(repeat):
+        times = import_times(module)
+        runs.append(times[module] / 1000)
+        loaded = sorted(name for name in times if name.startswith(f"{PACKAGE}."))
+    return statistics.median(runs), loaded
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10, help="fresh interpreters per measurement, median reported")
+    parser.add_argument("--max-ms", type=float, help="fail if loading the package takes longer than this")
+    args = parser.parse_args(argv)
+
+    startup_ms, loaded = measure(PACKAGE, args.repeat)
+    exporter_ms, _ = measure(f"{PACKAGE}.exporter", args.repeat)
+    print(f"{PACKAGE} at startup: {startup_ms:.1f} ms, loaded {', '.join(loaded) or 'no submodules'}")
+    print(f"{PACKAGE}.exporter on first use: {exporter_ms:.1f} ms")
+
+    eager = {name for name in loaded if name.split(".")[1] in DEFERRED}
+    # without aqt the add-on's Anki-only imports don't run, so also check what its top-level code would import
+    for name in module_level_imports(os.path.join(ROOT, PACKAGE, "__init__.py")):
+        if name.split(".")[0] in DEFERRED:
+            eager.add(f"{PACKAGE}.{name}")
+    if eager:
+        print(f"imported at startup but meant to load on first use: {', '.join(sorted(eager))}", file=sys.stderr)
+        return 1
+    if args.max_ms is not None and startup_ms > args.max_ms:
+        print(f"startup import took {startup_ms:.1f} ms, over the {args.max_ms:g} ms budget", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,202 @@
+"""Generates synthetic Anki collections (schema 18) for benchmarking.
+
+    python benchmarks/synth.py /tmp/bench.anki2 --notes 50000 --revlog 1000000
+
+Decks form a tree of the given depth and breadth; every deck gets its own deck config so per-deck
+new card limits apply. Card states are spread over new, (re)learning and review cards with
+intervals across all maturity buckets, and the revlog is spread over the past `history_days`.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Tuple
+
+SCHEMA = """
+CREATE TABLE col (id integer PRIMARY KEY, crt integer NOT NULL, mod integer NOT NULL, scm integer NOT NULL,
+    ver integer NOT NULL, dty integer NOT NULL, usn integer NOT NULL, ls integer NOT NULL, conf text NOT NULL,
+    models text NOT NULL, decks text NOT NULL, dconf text NOT NULL, tags text NOT NULL);
+CREATE TABLE notes (id integer PRIMARY KEY, guid text NOT NULL, mid integer NOT NULL, mod integer NOT NULL,
+    usn integer NOT NULL, tags text NOT NULL, flds text NOT NULL, sfld integer NOT NULL, csum integer NOT NULL,
+    flags integer NOT NULL, data text NOT NULL);
+CREATE TABLE cards (id integer PRIMARY KEY, nid integer NOT NULL, did integer NOT NULL, ord integer NOT NULL,
+    mod integer NOT NULL, usn integer NOT NULL, type integer NOT NULL, queue integer NOT NULL, due integer NOT NULL,
+    ivl integer NOT NULL, factor integer NOT NULL, reps integer NOT NULL, lapses integer NOT NULL,
+    left integer NOT NULL, odue integer NOT NULL, odid integer NOT NULL, flags integer NOT NULL, data text NOT NULL);
+CREATE TABLE revlog (id integer PRIMARY KEY, cid integer NOT NULL, usn integer NOT NULL, ease integer NOT NULL,
+    ivl integer NOT NULL, lastIvl integer NOT NULL, factor integer NOT NULL, time integer NOT NULL,
+    type integer NOT NULL);
+CREATE TABLE decks (id integer PRIMARY KEY NOT NULL, name text NOT NULL, mtime_secs integer NOT NULL,
+    usn integer NOT NULL, common blob NOT NULL, kind blob NOT NULL);
+CREATE TABLE deck_config (id integer PRIMARY KEY NOT NULL, name text NOT NULL, mtime_secs integer NOT NULL,
+    usn integer NOT NULL, config blob NOT NULL);
+CREATE TABLE notetypes (id integer NOT NULL PRIMARY KEY, name text NOT NULL, mtime_secs integer NOT NULL,
+    usn integer NOT NULL, config blob NOT NULL);
+CREATE TABLE fields (ntid integer NOT NULL, ord integer NOT NULL, name text NOT NULL, config blob NOT NULL,
+    PRIMARY KEY (ntid, ord)) WITHOUT ROWID;
+CREATE TABLE config (KEY text NOT NULL PRIMARY KEY, usn integer NOT NULL, mtime_secs integer NOT NULL,
+    val blob NOT NULL) WITHOUT ROWID;
+CREATE INDEX ix_notes_usn ON notes (usn);
+CREATE INDEX ix_cards_usn ON cards (usn);
+CREATE INDEX ix_revlog_usn ON revlog (usn);
+CREATE INDEX ix_cards_nid ON cards (nid);
+CREATE INDEX ix_cards_sched ON cards (did, queue, due);
+CREATE INDEX ix_revlog_cid ON revlog (cid);
+CREATE INDEX ix_notes_csum ON notes (csum);
+CREATE INDEX ix_notes_mid ON notes (mid);
+"""
+
+NOTE_TYPES: Dict[str, List[str]] = {
+    "Vocab": ["Word", "Word Meaning", "Reading", "Sentence"],
+    "Basic": ["Front", "Back"],
+    "Basic (and reversed card)": ["Front", "Back"],
+    "Kanji": ["Kanji", "Meaning", "Onyomi", "Kunyomi", "Examples"],
+}
+
+DAY_MS = 86_400_000
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _proto_field(number: int, value) -> bytes:
+    if isinstance(value, bytes):
+        return _varint(number << 3 | 2) + _varint(len(value)) + value
+    return _varint(number << 3) + _varint(value)
+
+
+def _deck_names(depth: int, breadth: int) -> List[str]:
+    names = ["Default"]
+    level = ["Languages"]
+    names.extend(level)
+    for _ in range(depth - 1):
+        level = [f"{parent}::Sub{i}" for parent in level for i in range(breadth)]
+        names.extend(level)
+    return names
+
+
+def _field_value(rng: random.Random, field: str, index: int) -> str:
+    value = f"{field.lower()}_{index}"
+    roll = rng.random()
+    if roll < 0.1:
+        value = f"<b>{value}</b>&nbsp;{field}"
+    elif roll < 0.2:
+        value = f'{value}, "quoted", with commas'
+    elif roll < 0.25:
+        value = f"{value}<br>second line\nthird line"
+    return value
+
+
+def generate_collection(
+    path: str,
+    notes: int = 10_000,
+    revlog: int = 100_000,
+    deck_depth: int = 3,
+    deck_breadth: int = 3,
+    history_days: int = 730,
+    seed: int = 1,
+) -> str:
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    now_ms = int(time.time() * 1000)
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    db.execute("INSERT INTO col VALUES (1, 0, ?, 0, 18, 0, 0, 0, '', '', '', '', '')", (now_ms,))
+    db.execute("INSERT INTO config VALUES ('rollover', 0, 0, '4')")
+
+    deck_ids: List[int] = []
+    for index, name in enumerate(_deck_names(deck_depth, deck_breadth)):
+        did = index + 1
+        deck_ids.append(did)
+        config = _proto_field(9, rng.choice([5, 10, 20, 30]))
+        db.execute("INSERT INTO deck_config VALUES (?, ?, 0, 0, ?)", (did, name, config))
+        kind = _proto_field(1, _proto_field(1, did))
+        db.execute("INSERT INTO decks VALUES (?, ?, 0, 0, x'', ?)", (did, name.replace("::", "\x1f"), kind))
+
+    note_types: List[Tuple[int, List[str], int]] = []
+    for index, (name, fields) in enumerate(NOTE_TYPES.items()):
+        mid = 1_000 + index
+        templates = 2 if "reversed" in name else 1
+        note_types.append((mid, fields, templates))
+        db.execute("INSERT INTO notetypes VALUES (?, ?, 0, 0, x'')", (mid, name))
+        for ord, field in enumerate(fields):
+            db.execute("INSERT INTO fields VALUES (?, ?, ?, x'')", (mid, ord, field))
+
+    card_rows = []
+    note_rows = []
+    reviewed_cards: List[int] = []
+    next_cid = now_ms - history_days * DAY_MS
+    for index in range(notes):
+        nid = next_cid
+        mid, fields, templates = rng.choice(note_types)
+        flds = "\x1f".join(_field_value(rng, field, index) for field in fields)
+        note_rows.append((nid, f"g{index}", mid, index, 0, "", flds, fields[0], 0, 0, ""))
+        did = rng.choice(deck_ids)
+        for ord in range(templates):
+            cid = next_cid
+            next_cid += 1
+            card_type, queue, ivl, due = _card_state(rng, index)
+            card_rows.append((cid, nid, did, ord, index, 0, card_type, queue, due, ivl, 2500, 0, 0, 0, 0, 0, 0, ""))
+            if card_type != 0:
+                reviewed_cards.append(cid)
+    db.executemany("INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", note_rows)
+    db.executemany("INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", card_rows)
+
+    if reviewed_cards:
+        db.executemany(
+            "INSERT INTO revlog VALUES (?, ?, 0, 3, 1, 0, 2500, 5000, 1)",
+            _revlog_rows(rng, reviewed_cards, revlog, now_ms - history_days * DAY_MS, now_ms),
+        )
+
+    db.commit()
+    db.execute("ANALYZE")
+    db.close()
+    return path
+
+
+def _card_state(rng: random.Random, index: int) -> Tuple[int, int, int, int]:
+    roll = rng.random()
+    if roll < 0.3:
+        return 0, 0, 0, index
+    if roll < 0.37:
+        return 1, rng.choice([1, 3]), 0, 0
+    if roll < 0.4:
+        return 3, 1, rng.randint(1, 30), 0
+    return 2, rng.choice([2, 2, 2, 2, -1]), int(rng.lognormvariate(3, 1.2)) + 1, 0
+
+
+def _revlog_rows(
+    rng: random.Random, card_ids: List[int], count: int, start_ms: int, end_ms: int
+) -> Iterator[Tuple[int, int]]:
+    # ids must be unique, so spread them evenly over the history with a little jitter
+    step = max((end_ms - start_ms) // max(count, 1), 1)
+    for index in range(count):
+        yield start_ms + index * step + rng.randrange(step), rng.choice(card_ids)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic Anki collection.")
+    parser.add_argument("path")
+    parser.add_argument("--notes", type=int, default=10_000)
+    parser.add_argument("--revlog", type=int, default=100_000)
+    parser.add_argument("--deck-depth", type=int, default=3)
+    parser.add_argument("--deck-breadth", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    generate_collection(args.path, args.notes, args.revlog, args.deck_depth, args.deck_breadth, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
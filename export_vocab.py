@@ -0,0 +1,132 @@
+"""Export vocabulary straight from a collection.anki2 file, without starting Anki.
+
+    python export_vocab.py ~/.local/share/Anki2/User\\ 1/collection.anki2 exports/ --deck Japanese
+
+Settings are read from the add-on config (plugin/config.json by default, or an installed add-on's
+meta.json via --config), so the same config produces the same files as the export dialog.
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import date
+
+from plugin.batch import BatchExporter
+from plugin.collection import SqliteCollection
+from plugin.exporter import VocabularyExporter
+from plugin.metrics import format_metrics
+from plugin.models import ExportSettings
+from plugin.normalize import FURIGANA_MODES
+from plugin.writers import WRITERS, get_writer
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plugin", "config.json")
+
+
+def load_config(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    # an installed add-on keeps the user's config under "config" in meta.json
+    return config.get("config", config)
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Export known vocabulary from an Anki collection file.")
+    parser.add_argument("collection", help="path to collection.anki2")
+    parser.add_argument("export_dir", help="directory to write the export into")
+    parser.add_argument("--deck", help="deck to export, including subdecks (default: all decks)")
+    parser.add_argument("--decks", nargs="+", help="export each of these decks into its own folder")
+    parser.add_argument("--all-decks", action="store_true", help="export every top-level deck into its own folder")
+    parser.add_argument("--output", help="output file for single-file exports (default: vocab_<date> plus extension)")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="add-on config.json or meta.json to read")
+    parser.add_argument("--fields", nargs="+", help="fields to export, overriding the config")
+    parser.add_argument("--grouping", choices=["none", "status"], help="grouping, overriding the config")
+    parser.add_argument("--format", choices=sorted(WRITERS), help="output format, overriding the config")
+    parser.add_argument(
+        "--normalize",
+        choices=FURIGANA_MODES,
+        help="strip HTML from fields; furigana kept as brackets or reduced to kanji/reading",
+    )
+    parser.add_argument("--predictive-days", type=int, help="days of new cards to predict, overriding the config")
+    parser.add_argument(
+        "--forecast",
+        type=float,
+        metavar="SUCCESS_RATE",
+        help="in predicted files, move review cards by their projected interval, assuming this recall rate (e.g. 0.9)",
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="only list cards newly learned, promoted or lapsed since the last export to this folder",
+    )
+    parser.add_argument("--metrics", action="store_true", help="print per-stage timings and query counts")
+    parser.add_argument("--no-cache", action="store_true", help="don't read or update the export cache in user_files")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+
+    config = load_config(args.config)
+    if args.fields:
+        config["fields"] = args.fields
+    if args.grouping:
+        config["grouping"] = args.grouping
+    if args.format:
+        config["format"] = args.format
+    if args.predictive_days is not None:
+        config["predictive_days"] = args.predictive_days
+    if args.forecast is not None:
+        config["forecast_intervals"] = True
+        config["forecast_success_rate"] = args.forecast
+    if args.delta:
+        config["delta_export"] = True
+    if args.normalize:
+        config["normalize_fields"] = True
+        config["furigana"] = args.normalize
+    try:
+        settings = ExportSettings.from_config(config, deck=args.deck)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    settings.collect_metrics = settings.collect_metrics or args.metrics
+    settings.use_cache = settings.use_cache and not args.no_cache
+    if args.decks or args.all_decks:
+        settings.batch_decks = args.decks or []
+        settings.batch_all_decks = args.all_decks
+
+    if not settings.fields:
+        print("Please select at least one field (--fields or the config's \"fields\").", file=sys.stderr)
+        return 1
+
+    os.makedirs(args.export_dir, exist_ok=True)
+    output_path = None
+    if settings.predictive_days == 0 and not settings.is_batch and not settings.delta_export:
+        ext = get_writer(settings.format).extension
+        output_path = os.path.join(args.export_dir, args.output or f"vocab_{date.today().isoformat()}{ext}")
+
+    col = SqliteCollection(args.collection)
+    try:
+        exporter_class = BatchExporter if settings.is_batch else VocabularyExporter
+        result = exporter_class(settings, col).export(args.export_dir, output_path)
+    finally:
+        col.close()
+
+    if not result.success:
+        print(result.error_message or "Export failed.", file=sys.stderr)
+        if not result.files:
+            return 1
+
+    print(f"Exported {result.total_cards} cards to {len(result.files)} file(s) in {result.export_directory}")
+    statuses = {name: "created" for name in result.files_created}
+    statuses.update((name, "updated") for name in result.files_updated)
+    statuses.update((name, "unchanged") for name in result.files_unchanged)
+    for filename in result.files:
+        print(f"- {filename} ({statuses[filename]})")
+    if result.metrics is not None:
+        print(format_metrics(result.metrics))
+    return 0 if result.success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
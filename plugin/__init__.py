@@ -1,6 +1,28 @@
-from aqt import mw, gui_hooks
-from aqt.qt import QAction
-from .dialog import show_export_dialog
+import time
+
+_load_started = time.perf_counter()
+
+try:
+    from aqt import mw, gui_hooks
+except ImportError:
+    # imported outside Anki, e.g. by export_vocab.py
+    mw = None
+
+if mw is not None:
+    from aqt.qt import QAction
+
+# seconds this add-on added to Anki's startup ("startup"), to opening the dialog the first time ("dialog_import"),
+# and to the main thread after the last sync ("sync_hook") and at profile close ("profile_close_hook")
+load_timings = {}
+
+
+def show_export_dialog(deck_name=None) -> None:
+    # the dialog pulls in the exporter and most of Qt's widgets, so it's imported the first time it's opened
+    started = time.perf_counter()
+    from .dialog import show_export_dialog
+
+    load_timings.setdefault("dialog_import", time.perf_counter() - started)
+    show_export_dialog(deck_name)
 
 
 def setup_menu():
@@ -20,4 +42,32 @@ def on_deck_browser_options_menu(menu, deck_id: int) -> None:
     action.triggered.connect(lambda: show_export_dialog(deck_name))
 
 
-gui_hooks.deck_browser_will_show_options_menu.append(on_deck_browser_options_menu)
+def on_sync_did_finish() -> None:
+    # cheap until auto-export is turned on: the exporter is only imported for it
+    started = time.perf_counter()
+    from .config import get_config
+
+    if get_config().get("auto_export", False):
+        from .auto_export import get_auto_exporter
+
+        get_auto_exporter(mw).schedule()
+    load_timings["sync_hook"] = time.perf_counter() - started
+
+
+def on_profile_will_close() -> None:
+    started = time.perf_counter()
+    from .config import get_config
+
+    if get_config().get("auto_export", False):
+        from .auto_export import get_auto_exporter
+
+        get_auto_exporter(mw).export_on_close()
+    load_timings["profile_close_hook"] = time.perf_counter() - started
+
+
+if mw is not None:
+    gui_hooks.deck_browser_will_show_options_menu.append(on_deck_browser_options_menu)
+    gui_hooks.sync_did_finish.append(on_sync_did_finish)
+    gui_hooks.profile_will_close.append(on_profile_will_close)
+
+load_timings["startup"] = time.perf_counter() - _load_started
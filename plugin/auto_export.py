@@ -0,0 +1,187 @@
+"""Exports with the dialog's last saved settings after syncs and when the profile closes.
+
+Syncs restart a timer, so a burst of them leads to one export once things have been quiet for
+"auto_export_delay" seconds. At profile close an export starts right away if the collection or the
+settings changed since the last auto-export, whether or not a sync happened. Every export runs in the
+background, and nothing is read when neither the collection nor the settings changed.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from .batch import BatchExporter
+from .cache import CACHE_DIR
+from .collection import AnkiCollection, Collection
+from .exporter import VocabularyExporter
+from .metrics import log_export_metrics
+from .models import ExportResult, ExportSettings
+from .writers import get_writer
+
+try:
+    from aqt.operations import QueryOp
+    from aqt.qt import QTimer
+    from aqt.utils import tooltip
+
+    from .config import get_config
+except ImportError:
+    # run_auto_export() also works outside Anki
+    QueryOp = QTimer = tooltip = get_config = None
+
+STATE_FILE = os.path.join(CACHE_DIR, "auto_export_state.json")
+
+
+class AutoExportState:
+    """The collection mod and settings of each collection's last auto-export, kept across sessions."""
+
+    def __init__(self, path: str = STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        # collection path -> {"mod", "config"}
+        self._exports: Dict[str, Dict] = self._read()
+
+    def _read(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                exports = json.load(f)
+            return exports if isinstance(exports, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def is_current(self, collection_path: str, mod: int, fingerprint: str) -> bool:
+        with self._lock:
+            return self._exports.get(collection_path) == {"mod": mod, "config": fingerprint}
+
+    def update(self, collection_path: str, mod: int, fingerprint: str) -> None:
+        with self._lock:
+            self._exports[collection_path] = {"mod": mod, "config": fingerprint}
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "w", encoding="utf-8") as f:
+                    json.dump(self._exports, f)
+            except OSError:
+                # the next session exports once more
+                pass
+
+
+def config_fingerprint(config: dict) -> str:
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def get_auto_export_target(config: dict, settings: ExportSettings) -> Tuple[Optional[str], Optional[str]]:
+    """(export directory, output file or None for multi-file exports), as the dialog would pick them."""
+    export_dir = config.get("auto_export_dir") or config.get("last_export_dir")
+    if not export_dir:
+        return None, None
+    if settings.predictive_days > 0 or settings.is_batch or settings.delta_export:
+        return export_dir, None
+    ext = get_writer(settings.format).extension
+    return export_dir, os.path.join(export_dir, f"vocab_{date.today().isoformat()}{ext}")
+
+
+def run_auto_export(col: Collection, config: dict, state: AutoExportState) -> Optional[ExportResult]:
+    """Exports with the saved settings; None when the collection and settings are unchanged or never set up."""
+    mod = col.mod
+    fingerprint = config_fingerprint(config)
+    if state.is_current(col.path, mod, fingerprint):
+        return None
+
+    settings = ExportSettings.from_config(config, deck=config.get("last_deck"))
+    export_dir, output_path = get_auto_export_target(config, settings)
+    if export_dir is None or not settings.fields:
+        return None
+
+    os.makedirs(export_dir, exist_ok=True)
+    exporter_class = BatchExporter if settings.is_batch else VocabularyExporter
+    result = exporter_class(settings, col).export(export_dir, output_path)
+    if result.success:
+        state.update(col.path, mod, fingerprint)
+    return result
+
+
+class AutoExporter:
+    def __init__(self, mw):
+        self._mw = mw
+        self._state = AutoExportState()
+        self._timer = QTimer(mw)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._start)
+        self._running = False
+        # a trigger arrived while an export was running
+        self._again = False
+        # when the profile started closing, while its export is pending or running
+        self._closing_since: Optional[float] = None
+
+    def schedule(self) -> None:
+        # restarting the timer folds every trigger within the delay into one export
+        self._timer.start(int(get_config().get("auto_export_delay", 10) * 1000))
+
+    def export_on_close(self) -> None:
+        """Starts an export in the background if anything changed since the last one; closing doesn't wait for it."""
+        self._timer.stop()
+        col = self._mw.col
+        if col is None:
+            return
+        collection = AnkiCollection(col)
+        if self._state.is_current(collection.path, collection.mod, config_fingerprint(get_config())):
+            return
+        self._closing_since = time.perf_counter()
+        self._start()
+
+    def _start(self) -> None:
+        if self._running:
+            self._again = True
+            return
+        if self._mw.col is None:
+            return
+        config = get_config()
+        trigger = "sync" if self._closing_since is None else "close"
+        self._running = True
+
+        def export(col) -> Optional[ExportResult]:
+            return run_auto_export(AnkiCollection(col), config, self._state)
+
+        op = QueryOp(parent=self._mw, op=export, success=lambda result: self._finished(config, trigger, result))
+        op.failure(lambda error: self._failed(trigger, error))
+        op.run_in_background()
+
+    def _finished(self, config: dict, trigger: str, result: Optional[ExportResult]) -> None:
+        if result is not None and not result.success and not result.cancelled:
+            tooltip(f"Vocabulary auto-export failed: {result.error_message}")
+        if result is not None and config.get("log_metrics", False):
+            context = {}
+            if trigger == "close":
+                # how long after the profile started closing the export was done
+                context["close_delay"] = round(time.perf_counter() - self._closing_since, 3)
+            log_export_metrics(result, f"auto_export_{trigger}", **context)
+        self._done(trigger)
+
+    def _failed(self, trigger: str, error: Exception) -> None:
+        tooltip(f"Vocabulary auto-export failed: {error}")
+        self._done(trigger)
+
+    def _done(self, trigger: str) -> None:
+        self._running = False
+        if trigger == "close":
+            self._closing_since = None
+        if self._again:
+            self._again = False
+            if self._closing_since is not None:
+                # the profile is closing: no time to wait for the timer
+                self._start()
+            else:
+                self.schedule()
+
+
+_auto_exporter: Optional[AutoExporter] = None
+
+
+def get_auto_exporter(mw) -> AutoExporter:
+    global _auto_exporter
+    if _auto_exporter is None:
+        _auto_exporter = AutoExporter(mw)
+    return _auto_exporter
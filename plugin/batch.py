@@ -0,0 +1,174 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Dict, List, Optional, Set, Tuple
+
+from .collection import Collection
+from .exporter import (
+    ExportCancelled,
+    VocabularyExporter,
+    get_cards_first_reviewed_today_for_filter,
+    get_normalizer,
+)
+from .models import ExportResult, ExportSettings
+from .queries import DECKS_WITH_CARDS_QUERY
+from .snapshot import CardSnapshot, FirstReviewIndex, deck_ids_filter
+
+_INVALID_PATH_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+
+def deck_folder_name(deck_name: str) -> str:
+    name = _INVALID_PATH_CHARS.sub("_", deck_name.replace("::", " - ")).strip(" .")
+    return name or "_"
+
+
+def get_batch_decks(col: Collection, settings: ExportSettings) -> List[Tuple[str, List[int]]]:
+    """(deck name, ids of the deck and its subdecks) for every deck in the batch."""
+    if settings.batch_all_decks:
+        with_cards = set(col.db.list(DECKS_WITH_CARDS_QUERY))
+        top_level = {deck.name.split("::")[0] for deck in col.decks() if deck.id in with_cards and not deck.filtered}
+        names = sorted(top_level, key=str.casefold)
+    else:
+        names = list(dict.fromkeys(settings.batch_decks))
+
+    decks = []
+    for name in names:
+        deck_id = col.deck_id(name)
+        deck = col.deck(deck_id) if deck_id is not None else None
+        if deck is not None:
+            decks.append((deck.name, col.deck_and_child_ids(deck_id)))
+    return decks
+
+
+class BatchExporter(VocabularyExporter):
+    """Exports several decks into one folder each, reading the collection once for all of them."""
+
+    def _export(self, export_dir: str, output_path: Optional[str]) -> ExportResult:
+        decks = get_batch_decks(self.col, self.settings)
+        if not decks:
+            return ExportResult(success=False, error_message="None of the selected decks exist.")
+
+        deck_groups = [set(deck_ids) for _, deck_ids in decks]
+        # deltas only read each deck's recently reviewed cards, so there is no shared snapshot to build
+        snapshot: Optional[CardSnapshot] = None
+        views: List[Optional[CardSnapshot]] = [None] * len(decks)
+        today_card_ids: Optional[List[int]] = None
+        if not self.settings.delta_export:
+            snapshot, today_card_ids = self._load_shared_snapshot(decks)
+            views = snapshot.split(deck_groups, self.settings.collapse_siblings)
+
+        # deltas read the collection while they write, so they stay on this thread
+        workers = 1 if self.settings.delta_export else self.settings.batch_workers
+        workers = max(1, min(workers, os.cpu_count() or 1, len(decks)))
+        exporters: List[VocabularyExporter] = []
+        # deck position -> why its collection reads failed
+        failed: Dict[int, ExportResult] = {}
+        for position, (name, _) in enumerate(decks):
+
+            def progress(label: str, value: int, maximum: int, name: str = name, position: int = position) -> None:
+                self._report_progress(f"{name}: {label}", position, len(decks))
+
+            # decks written in parallel write their day files one at a time
+            file_workers = 1 if workers > 1 else self.settings.file_workers
+            exporter = VocabularyExporter(
+                replace(self.settings, deck=name, batch_decks=[], batch_all_decks=False, file_workers=file_workers),
+                self.col,
+                progress=progress,
+                should_cancel=self._should_cancel,
+                snapshot=views[position],
+                today_card_ids=(
+                    snapshot.in_decks(today_card_ids, deck_groups[position]) if today_card_ids is not None else None
+                ),
+            )
+            exporters.append(exporter)
+            if workers > 1:
+                # every collection read happens here, on the thread that may use the collection
+                try:
+                    exporter.prepare()
+                except ExportCancelled:
+                    raise
+                except Exception as e:
+                    failed[position] = ExportResult(success=False, error_message=str(e))
+
+        def export_deck(position: int) -> ExportResult:
+            if position in failed:
+                return failed[position]
+            deck_dir = os.path.join(export_dir, deck_folder_name(decks[position][0]))
+            os.makedirs(deck_dir, exist_ok=True)
+            return exporters[position].export(deck_dir)
+
+        if workers == 1:
+            results = [export_deck(position) for position in range(len(decks))]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(export_deck, range(len(decks))))
+
+        total_cards = 0
+        files: Dict[str, List[str]] = {"all": [], "created": [], "updated": [], "unchanged": [], "failed": []}
+        failures: List[str] = []
+        for (name, _), result in zip(decks, results):
+            if result.cancelled:
+                raise ExportCancelled()
+            folder = deck_folder_name(name)
+            if result.metrics is not None:
+                self._recorder.merge(result.metrics, folder)
+            if not result.success:
+                failures.append(f"{name}: {result.error_message}")
+            total_cards += result.total_cards
+            for key, names in (
+                ("all", result.files),
+                ("created", result.files_created),
+                ("updated", result.files_updated),
+                ("unchanged", result.files_unchanged),
+                ("failed", result.files_failed),
+            ):
+                files[key].extend(os.path.join(folder, filename) for filename in names)
+
+        return ExportResult(
+            success=not failures,
+            total_cards=total_cards,
+            files=files["all"],
+            files_created=files["created"],
+            files_updated=files["updated"],
+            files_unchanged=files["unchanged"],
+            files_failed=files["failed"],
+            export_directory=export_dir,
+            output_path=os.path.join(export_dir, files["all"][-1]) if files["all"] else "",
+            error_message="\n".join(failures),
+        )
+
+    def _load_shared_snapshot(self, decks: List[Tuple[str, List[int]]]) -> Tuple[CardSnapshot, Optional[List[int]]]:
+        """One sorted snapshot of every deck in the batch, and the cards first reviewed today in any of them."""
+        all_deck_ids: Set[int] = {did for _, deck_ids in decks for did in deck_ids}
+        where = deck_ids_filter(sorted(all_deck_ids))
+        snapshot = CardSnapshot(
+            self.col,
+            None,
+            self.settings.fields,
+            deck_ids=all_deck_ids,
+            normalizer=get_normalizer(self.col, self.settings),
+            buckets=self.settings.buckets,
+            cache=self._cache,
+        )
+
+        self._refresh_cache()
+        with self._recorder.stage("first_review_index") as stage:
+            self._report_progress("Indexing review history", 0, 0)
+            if self._cache is not None:
+                first_review_index = FirstReviewIndex(self._cache.first_reviews)
+            else:
+                first_review_index = FirstReviewIndex.build_for_filter(self.col, where)
+            stage.cards = len(first_review_index.first_reviews)
+        with self._recorder.stage("fetch_cards") as stage:
+            self._report_progress("Reading cards", 0, 0)
+            snapshot.fetch()
+            stage.cards = len(snapshot.card_ids)
+        with self._recorder.stage("sort_cards") as stage:
+            snapshot.sort(first_review_index)
+            stage.cards = len(snapshot.card_ids)
+
+        today_card_ids: Optional[List[int]] = None
+        if self.settings.grouping == "status" and self.settings.include_first_bucket and self.settings.separate_today:
+            today_card_ids = get_cards_first_reviewed_today_for_filter(self.col, where)
+        return snapshot, today_card_ids
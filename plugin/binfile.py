@@ -0,0 +1,59 @@
+"""The framing of the add-on's binary sidecar files: a JSON header followed by length-prefixed arrays and text.
+
+Arrays are stored in the machine's byte order, which every header records; a file from a machine with another
+byte order reads as damaged and is rebuilt. Readers raise ValueError or struct.error on anything truncated.
+"""
+
+import json
+import struct
+import sys
+from array import array
+from typing import BinaryIO, Iterable, List
+
+
+def check_magic(f: BinaryIO, magic: bytes) -> None:
+    if f.read(len(magic)) != magic:
+        raise ValueError("not the expected kind of file")
+
+
+def write_header(f: BinaryIO, header: dict) -> None:
+    encoded = json.dumps({**header, "byteorder": sys.byteorder}).encode("utf-8")
+    f.write(struct.pack("<I", len(encoded)) + encoded)
+
+
+def read_header(f: BinaryIO) -> dict:
+    (size,) = struct.unpack("<I", f.read(4))
+    header = json.loads(f.read(size))
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError("written with another byte order")
+    return header
+
+
+def write_array(f: BinaryIO, values: Iterable[int], typecode: str = "q") -> None:
+    data = (values if isinstance(values, array) else array(typecode, values)).tobytes()
+    f.write(struct.pack("<Q", len(data)))
+    f.write(data)
+
+
+def read_columns(f: BinaryIO, typecodes: str) -> List[array]:
+    """One array per typecode, which must all have the same length."""
+    columns = []
+    for typecode in typecodes:
+        (size,) = struct.unpack("<Q", f.read(8))
+        values = array(typecode)
+        values.frombytes(f.read(size))
+        columns.append(values)
+    if len({len(column) for column in columns}) > 1:
+        raise ValueError("truncated file")
+    return columns
+
+
+def write_text(f: BinaryIO, text: str) -> None:
+    data = text.encode("utf-8")
+    f.write(struct.pack("<Q", len(data)))
+    f.write(data)
+
+
+def read_text(f: BinaryIO) -> str:
+    (size,) = struct.unpack("<Q", f.read(8))
+    return f.read(size).decode("utf-8")
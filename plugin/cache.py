@@ -0,0 +1,356 @@
+"""A copy of the collection's cards, notes and first reviews that survives between exports and Anki sessions.
+
+The copy lives in memory and in a sidecar file in the add-on's user_files folder. Before an export it is
+brought up to date from the collection's high-water marks, reading back only the rows that changed, and those
+rows are appended to the file as a segment of their own until the file is next rewritten whole.
+"""
+
+import hashlib
+import os
+import struct
+import threading
+from array import array
+from dataclasses import asdict, dataclass
+from typing import Any, BinaryIO, Collection as Container, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from .binfile import check_magic, read_columns, read_header, read_text, write_array, write_header, write_text
+from .collection import Collection
+from .queries import (
+    CACHE_CARDS_QUERY,
+    CACHE_FIRST_REVIEWS_QUERY,
+    CACHE_FIRST_REVIEWS_SINCE_QUERY,
+    CACHE_NOTES_QUERY,
+    CARD_TYPE_NEW,
+)
+
+CACHE_VERSION = 2
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "user_files")
+_MAGIC = b"VXC1"
+# appended segments are folded into a full rewrite once they outgrow this share of the full segment
+APPEND_LIMIT = 0.25
+
+# nid, ivl, queue, type, did, odid
+CachedCard = Tuple[int, int, int, int, int, int]
+# mid, mod, flds
+CachedNote = Tuple[int, int, str]
+
+
+@dataclass
+class TableMarks:
+    """The newest change seen in a table: highest mod (or id for the revlog) and usn, and its row count."""
+
+    mod: int = 0
+    usn: int = 0
+    count: int = 0
+
+
+class ExportCache:
+    def __init__(self, path: str, collection_path: str):
+        self.path = path
+        self.collection_path = collection_path
+        self.lock = threading.Lock()
+        self._file_checked = False
+        # (size, mtime) of the file as this cache last left it, and the size of its full segment
+        self._file_stat: Optional[Tuple[int, int]] = None
+        self._base_size = 0
+        self._clear()
+
+    def _clear(self) -> None:
+        # the last export's sorted snapshot, reused by the next export with the same key until anything changes
+        self.snapshot: Optional[Tuple[Hashable, Any]] = None
+        self.cards: Dict[int, CachedCard] = {}
+        self.notes: Dict[int, CachedNote] = {}
+        self.first_reviews: Dict[int, int] = {}
+        self.card_marks: Optional[TableMarks] = None
+        self.note_marks: Optional[TableMarks] = None
+        self.revlog_marks: Optional[TableMarks] = None
+        self.col_mod: Optional[int] = None
+
+    def refresh(self, col: Collection) -> None:
+        """Brings the cache up to date with the collection; nothing is read when the collection is unchanged."""
+        with self.lock:
+            if not self._file_checked:
+                self._file_checked = True
+                self._read_file()
+            col_mod = col.mod
+            if col_mod == self.col_mod:
+                return
+
+            self.snapshot = None
+            changed_cards = self._refresh_cards(col)
+            changed_notes = self._refresh_notes(col)
+            changed_reviews = self._refresh_first_reviews(col)
+            self.col_mod = col_mod
+            self._write_file(changed_cards, changed_notes, changed_reviews)
+
+    def get_snapshot(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            if self.snapshot is not None and self.snapshot[0] == key:
+                return self.snapshot[1]
+            return None
+
+    def put_snapshot(self, key: Hashable, snapshot: Any) -> None:
+        with self.lock:
+            self.snapshot = (key, snapshot)
+
+    def card_rows(self, deck_ids: Optional[Container[int]]) -> List[tuple]:
+        """(cid, nid, ivl, queue, type, did, odid) of the reviewed cards in the decks, in card id order."""
+        with self.lock:
+            return [
+                (cid, *card)
+                for cid, card in self.cards.items()
+                if card[3] != CARD_TYPE_NEW
+                and (deck_ids is None or card[4] in deck_ids or (card[5] != 0 and card[5] in deck_ids))
+            ]
+
+    def cards_by_id(self, card_ids: Iterable[int]) -> List[tuple]:
+        with self.lock:
+            cards = self.cards
+            return [(cid, *cards[cid]) for cid in card_ids if cid in cards]
+
+    def note_rows(self, note_ids: Iterable[int]) -> List[tuple]:
+        """(nid, mid, mod, flds) of the notes."""
+        with self.lock:
+            notes = self.notes
+            return [(nid, *notes[nid]) for nid in note_ids if nid in notes]
+
+    def _refresh_cards(self, col: Collection) -> Optional[List[int]]:
+        """The ids of the cards that changed, or None when every card was read again."""
+        count = col.db.scalar("SELECT COUNT(*) FROM cards")
+        marks = self.card_marks
+        changed = None
+        if marks is not None:
+            where = "c.mod >= ? OR c.usn > ?"
+            rows = col.db.all(CACHE_CARDS_QUERY.format(where=where), marks.mod, marks.usn)
+            self._store_cards(rows, marks)
+            changed = [row[0] for row in rows]
+        # rows removed, or added without a newer mod or usn (e.g. by an import), need a full read
+        if marks is None or len(self.cards) != count:
+            self.cards = {}
+            marks = TableMarks()
+            self._store_cards(col.db.all(CACHE_CARDS_QUERY.format(where="1")), marks)
+            changed = None
+        marks.count = count
+        self.card_marks = marks
+        return changed
+
+    def _store_cards(self, rows: List[tuple], marks: TableMarks) -> None:
+        self._put_cards((row[0], row[1:7]) for row in rows)
+        for row in rows:
+            marks.mod = max(marks.mod, row[7])
+            marks.usn = max(marks.usn, row[8])
+
+    def _put_cards(self, items: Iterable[Tuple[int, CachedCard]]) -> None:
+        cards = self.cards
+        last_cid = next(reversed(cards), 0)
+        in_order = True
+        for cid, card in items:
+            if cid < last_cid and cid not in cards:
+                in_order = False
+            cards[cid] = card
+        if not in_order:
+            # exports list cards in id order, so new cards with lower ids are put in place
+            self.cards = dict(sorted(cards.items()))
+
+    def _refresh_notes(self, col: Collection) -> Optional[List[int]]:
+        count = col.db.scalar("SELECT COUNT(*) FROM notes")
+        marks = self.note_marks
+        changed = None
+        if marks is not None:
+            where = "n.mod >= ? OR n.usn > ?"
+            rows = col.db.all(CACHE_NOTES_QUERY.format(where=where), marks.mod, marks.usn)
+            self._store_notes(rows, marks)
+            changed = [row[0] for row in rows]
+        if marks is None or len(self.notes) != count:
+            self.notes = {}
+            marks = TableMarks()
+            self._store_notes(col.db.all(CACHE_NOTES_QUERY.format(where="1")), marks)
+            changed = None
+        marks.count = count
+        self.note_marks = marks
+        return changed
+
+    def _store_notes(self, rows: List[tuple], marks: TableMarks) -> None:
+        notes = self.notes
+        for nid, mid, mod, usn, flds in rows:
+            notes[nid] = (mid, mod, flds)
+            marks.mod = max(marks.mod, mod)
+            marks.usn = max(marks.usn, usn)
+
+    def _refresh_first_reviews(self, col: Collection) -> Optional[List[int]]:
+        count = col.db.scalar("SELECT COUNT(*) FROM revlog")
+        marks = self.revlog_marks
+        changed = None
+        if marks is not None:
+            # new reviews have higher ids. Older ids with a newer usn are either reviews already counted, re-stamped
+            # by a sync, or another device's reviews synced in, so they only widen the expected row count
+            rows = col.db.all(CACHE_FIRST_REVIEWS_SINCE_QUERY, marks.mod, marks.usn, marks.mod)
+            first_reviews = self.first_reviews
+            added = synced = 0
+            changed = []
+            for cid, first_review, newer, older, max_id, max_usn in rows:
+                if first_review < first_reviews.get(cid, first_review + 1):
+                    first_reviews[cid] = first_review
+                    changed.append(cid)
+                added += newer
+                synced += older
+                marks.mod = max(marks.mod, max_id)
+                marks.usn = max(marks.usn, max_usn)
+            if not marks.count + added <= count <= marks.count + added + synced:
+                marks = None
+        if marks is None:
+            marks = TableMarks(
+                mod=col.db.scalar("SELECT MAX(id) FROM revlog") or 0,
+                usn=col.db.scalar("SELECT MAX(usn) FROM revlog") or 0,
+            )
+            self.first_reviews = dict(col.db.all(CACHE_FIRST_REVIEWS_QUERY))
+            changed = None
+        marks.count = count
+        self.revlog_marks = marks
+        return changed
+
+    def _read_file(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                self._read(f)
+                self._file_stat = _stat_key(os.fstat(f.fileno()))
+        except (OSError, ValueError, KeyError, TypeError, struct.error):
+            # a missing, old or damaged cache is rebuilt from the collection
+            self._clear()
+            self._file_stat = None
+
+    def _read(self, f: BinaryIO) -> None:
+        check_magic(f, _MAGIC)
+        header, cards, first_reviews, notes = _read_segment(f)
+        if not header["full"] or header["version"] != CACHE_VERSION or header["collection"] != self.collection_path:
+            raise ValueError("cache made for another collection or version")
+        self.cards, self.first_reviews, self.notes = dict(cards), dict(first_reviews), dict(notes)
+        self._base_size = f.tell()
+        # the segments appended since, oldest first
+        size = os.fstat(f.fileno()).st_size
+        while f.tell() < size:
+            header, cards, first_reviews, notes = _read_segment(f)
+            self._put_cards(cards)
+            self.first_reviews.update(first_reviews)
+            self.notes.update(notes)
+
+        self.col_mod = header["col_mod"]
+        self.card_marks = TableMarks(**header["cards"])
+        self.note_marks = TableMarks(**header["notes"])
+        self.revlog_marks = TableMarks(**header["revlog"])
+
+    def _write_file(
+        self,
+        changed_cards: Optional[List[int]],
+        changed_notes: Optional[List[int]],
+        changed_reviews: Optional[List[int]],
+    ) -> None:
+        header = {
+            "version": CACHE_VERSION,
+            "collection": self.collection_path,
+            "col_mod": self.col_mod,
+            "cards": asdict(self.card_marks),
+            "notes": asdict(self.note_marks),
+            "revlog": asdict(self.revlog_marks),
+        }
+        if None not in (changed_cards, changed_notes, changed_reviews) and self._append_file(
+            header, changed_cards, changed_notes, changed_reviews
+        ):
+            return
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(_MAGIC)
+                _write_segment(f, {**header, "full": True}, self.cards, self.first_reviews, self.notes)
+                self._base_size = f.tell()
+            os.replace(tmp_path, self.path)
+            self._file_stat = _stat_key(os.stat(self.path))
+        except OSError:
+            # the in-memory copy still serves this session
+            self._file_stat = None
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _append_file(
+        self, header: dict, changed_cards: List[int], changed_notes: List[int], changed_reviews: List[int]
+    ) -> bool:
+        """Appends the changed rows as a segment; False when the file has to be rewritten whole instead."""
+        try:
+            stat = os.stat(self.path)
+            # the file is rewritten once the appended segments have grown too large, or if anything else touched it
+            if _stat_key(stat) != self._file_stat or stat.st_size - self._base_size > self._base_size * APPEND_LIMIT:
+                return False
+            with open(self.path, "ab") as f:
+                _write_segment(
+                    f,
+                    {**header, "full": False},
+                    {cid: self.cards[cid] for cid in changed_cards},
+                    {cid: self.first_reviews[cid] for cid in changed_reviews},
+                    {nid: self.notes[nid] for nid in changed_notes},
+                )
+            self._file_stat = _stat_key(os.stat(self.path))
+            return True
+        except OSError:
+            return False
+
+
+def _stat_key(stat: os.stat_result) -> Tuple[int, int]:
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _write_segment(
+    f: BinaryIO,
+    header: dict,
+    cards: Dict[int, CachedCard],
+    first_reviews: Dict[int, int],
+    notes: Dict[int, CachedNote],
+) -> None:
+    write_header(f, header)
+    write_array(f, cards.keys())
+    for position in range(6):
+        write_array(f, (card[position] for card in cards.values()))
+    write_array(f, first_reviews.keys())
+    write_array(f, first_reviews.values())
+    write_array(f, notes.keys())
+    write_array(f, (mid for mid, _mod, _flds in notes.values()))
+    write_array(f, (mod for _mid, mod, _flds in notes.values()))
+    write_array(f, (len(flds) for _mid, _mod, flds in notes.values()))
+    write_text(f, "".join(flds for _mid, _mod, flds in notes.values()))
+
+
+def _read_segment(f: BinaryIO) -> Tuple[dict, Iterable, Iterable, Iterable]:
+    """The segment's header and its (id, row) pairs of cards, first reviews and notes."""
+    header = read_header(f)
+    card_ids, *card_columns = read_columns(f, "q" * 7)
+    review_cids, review_ids = read_columns(f, "qq")
+    note_ids, mids, mods, lengths = read_columns(f, "qqqq")
+    text = read_text(f)
+    if len(text) != sum(lengths):
+        raise ValueError("truncated cache")
+    notes = _note_items(note_ids, mids, mods, lengths, text)
+    return header, zip(card_ids, zip(*card_columns)), zip(review_cids, review_ids), notes
+
+
+def _note_items(
+    note_ids: array, mids: array, mods: array, lengths: array, text: str
+) -> Iterable[Tuple[int, CachedNote]]:
+    start = 0
+    for nid, mid, mod, length in zip(note_ids, mids, mods, lengths):
+        yield nid, (mid, mod, text[start : start + length])
+        start += length
+
+
+# collection path -> cache; one per collection for the whole session
+_caches: Dict[str, ExportCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_export_cache(col: Collection, cache_dir: str = CACHE_DIR) -> ExportCache:
+    with _caches_lock:
+        cache = _caches.get(col.path)
+        if cache is None:
+            digest = hashlib.sha1(col.path.encode("utf-8")).hexdigest()[:12]
+            cache = _caches[col.path] = ExportCache(os.path.join(cache_dir, f"export_cache_{digest}.bin"), col.path)
+        return cache
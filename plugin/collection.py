@@ -0,0 +1,216 @@
+import json
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+
+@dataclass
+class Deck:
+    id: int
+    name: str
+    filtered: bool = False
+    new_limit: int = 0
+
+
+class AnkiCollection:
+    """Data access through a running Anki's collection (mw.col or the col passed to a QueryOp)."""
+
+    def __init__(self, col):
+        self.col = col
+        self.db = col.db
+        self.path = col.path
+
+    @property
+    def mod(self) -> int:
+        return self.col.mod
+
+    @property
+    def day_cutoff(self) -> int:
+        return self.col.sched.day_cutoff
+
+    @property
+    def today(self) -> int:
+        return self.col.sched.today
+
+    def deck_id(self, name: str) -> Optional[int]:
+        return self.col.decks.id_for_name(name)
+
+    def deck_and_child_ids(self, deck_id: int) -> List[int]:
+        return list(self.col.decks.deck_and_child_ids(deck_id))
+
+    def decks(self) -> List[Deck]:
+        decks = (self.deck(entry.id) for entry in self.col.decks.all_names_and_ids())
+        return [deck for deck in decks if deck is not None]
+
+    def deck(self, deck_id: int) -> Optional[Deck]:
+        deck = self.col.decks.get(deck_id, default=False)
+        if not deck:
+            return None
+        if deck.get("dyn"):
+            return Deck(deck_id, deck["name"], filtered=True)
+
+        new_limit = deck.get("newLimit")
+        if new_limit is None:
+            conf = self.col.decks.config_dict_for_deck_id(deck_id)
+            new_limit = conf.get("new", {}).get("perDay", 5)
+        return Deck(deck_id, deck["name"], new_limit=new_limit)
+
+    def field_names(self, mid: int) -> List[str]:
+        model = self.col.models.get(mid)
+        if not model:
+            return []
+        return [fld["name"] for fld in sorted(model["flds"], key=lambda fld: fld["ord"])]
+
+
+class SqliteDB:
+    """The subset of Anki's DBProxy interface the exporter uses, over a plain sqlite3 connection."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def all(self, sql: str, *args) -> List[tuple]:
+        return self._conn.execute(sql, args).fetchall()
+
+    def list(self, sql: str, *args) -> List[Any]:
+        return [row[0] for row in self._conn.execute(sql, args)]
+
+    def scalar(self, sql: str, *args) -> Any:
+        row = self._conn.execute(sql, args).fetchone()
+        return row[0] if row else None
+
+
+class SqliteCollection:
+    """Read-only data access straight from a collection.anki2 file, without Anki or Qt."""
+
+    def __init__(self, path: str):
+        self.path = str(Path(path).resolve())
+        self._conn = sqlite3.connect(Path(self.path).as_uri() + "?mode=ro", uri=True, check_same_thread=False)
+        self.db = SqliteDB(self._conn)
+        self._decks: Dict[int, Deck] = {}
+        self._field_names: Dict[int, List[str]] = {}
+        self._rollover = 4
+
+        if self.db.scalar("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'decks'"):
+            self._load_schema_18()
+        else:
+            self._load_legacy_schema()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    @property
+    def mod(self) -> int:
+        return self.db.scalar("SELECT mod FROM col")
+
+    @property
+    def day_cutoff(self) -> int:
+        now = datetime.now()
+        cutoff = now.replace(hour=self._rollover, minute=0, second=0, microsecond=0)
+        if now >= cutoff:
+            cutoff += timedelta(days=1)
+        return int(cutoff.timestamp())
+
+    @property
+    def today(self) -> int:
+        """The scheduler's day number, which review cards' due is counted in."""
+        crt = self.db.scalar("SELECT crt FROM col")
+        return (self.day_cutoff - crt) // 86400 - 1
+
+    def deck_id(self, name: str) -> Optional[int]:
+        name = name.casefold()
+        for deck in self._decks.values():
+            if deck.name.casefold() == name:
+                return deck.id
+        return None
+
+    def deck_and_child_ids(self, deck_id: int) -> List[int]:
+        parent = self._decks[deck_id].name
+        return [deck.id for deck in self._decks.values() if deck.name == parent or deck.name.startswith(parent + "::")]
+
+    def decks(self) -> List[Deck]:
+        return list(self._decks.values())
+
+    def deck(self, deck_id: int) -> Optional[Deck]:
+        return self._decks.get(deck_id)
+
+    def field_names(self, mid: int) -> List[str]:
+        return self._field_names.get(mid, [])
+
+    def _load_schema_18(self) -> None:
+        # DeckConfig.Config.new_per_day is field 9; Deck.Normal has config_id = 1 and new_limit = 7
+        new_per_day: Dict[int, int] = {}
+        for dcid, config in self.db.all("SELECT id, config FROM deck_config"):
+            new_per_day[dcid] = _parse_protobuf(config).get(9, 0)
+
+        for did, name, kind in self.db.all("SELECT id, name, kind FROM decks"):
+            name = name.replace("\x1f", "::")
+            kind = _parse_protobuf(kind)
+            if 2 in kind:
+                self._decks[did] = Deck(did, name, filtered=True)
+                continue
+            normal = _parse_protobuf(kind.get(1, b""))
+            new_limit = normal[7] if 7 in normal else new_per_day.get(normal.get(1, 1), 0)
+            self._decks[did] = Deck(did, name, new_limit=new_limit)
+
+        for mid, _ord, name in self.db.all("SELECT ntid, ord, name FROM fields ORDER BY ntid, ord"):
+            self._field_names.setdefault(mid, []).append(name)
+
+        rollover = self.db.scalar("SELECT val FROM config WHERE KEY = 'rollover'")
+        if rollover is not None:
+            self._rollover = json.loads(rollover)
+
+    def _load_legacy_schema(self) -> None:
+        row = self.db.all("SELECT decks, dconf, models, conf FROM col")[0]
+        decks, dconf, models, conf = (json.loads(value) for value in row)
+
+        for deck in decks.values():
+            if deck.get("dyn"):
+                self._decks[deck["id"]] = Deck(deck["id"], deck["name"], filtered=True)
+                continue
+            new_limit = deck.get("newLimit")
+            if new_limit is None:
+                new_limit = dconf.get(str(deck.get("conf", 1)), {}).get("new", {}).get("perDay", 5)
+            self._decks[deck["id"]] = Deck(deck["id"], deck["name"], new_limit=new_limit)
+
+        for model in models.values():
+            flds = sorted(model["flds"], key=lambda fld: fld["ord"])
+            self._field_names[int(model["id"])] = [fld["name"] for fld in flds]
+
+        self._rollover = conf.get("rollover", 4)
+
+
+Collection = Union[AnkiCollection, SqliteCollection]
+
+
+def _parse_protobuf(data: bytes) -> Dict[int, Any]:
+    # just enough of the wire format to read scalar and nested fields from Anki's config blobs
+    fields: Dict[int, Any] = {}
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            fields[number], pos = _read_varint(data, pos)
+        elif wire_type == 1:
+            fields[number], pos = data[pos : pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            fields[number], pos = data[pos : pos + length], pos + length
+        elif wire_type == 5:
+            fields[number], pos = data[pos : pos + 4], pos + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+    return fields
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
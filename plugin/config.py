@@ -3,12 +3,35 @@ from aqt import mw
 DEFAULT_CONFIG = {
     "fields": [],
     "grouping": "status",
-    "format": "json",
-    "include_learning": True,
-    "include_young": True,
-    "include_mature": True,
+    "format": "markdown",
+    "buckets": [
+        {"name": "Fresh", "min_ivl": 1, "max_ivl": 7},
+        {"name": "Young", "min_ivl": 8, "max_ivl": 20},
+        {"name": "Mature", "min_ivl": 21, "max_ivl": 89},
+        {"name": "Mastered", "min_ivl": 90},
+    ],
+    "included_buckets": None,
     "last_export_dir": "",
+    "last_deck": None,
+    "auto_export": False,
+    "auto_export_dir": "",
+    "auto_export_delay": 10,
     "predictive_days": 0,
+    "forecast_intervals": False,
+    "forecast_success_rate": 0.9,
+    "delta_export": False,
+    "collapse_siblings": False,
+    "normalize_fields": False,
+    "furigana": "brackets",
+    "keep_first_review_index": False,
+    "export_cache": True,
+    "show_metrics": False,
+    "log_metrics": False,
+    "batch": False,
+    "batch_decks": [],
+    "batch_all_decks": False,
+    "batch_workers": 1,
+    "file_workers": 0,
 }
 
 
@@ -0,0 +1,192 @@
+"""What changed since the last export: cards learned for the first time, promoted to a later bucket or lapsed.
+
+Each export folder keeps a compact record of every card's bucket and of the newest review it has seen, so a
+delta only reads the cards reviewed since then and costs time in proportion to those reviews, not to the size of
+the collection. Deltas repeated on one day all compare against the last export of an earlier day, so the day's
+file grows through the day instead of keeping only the changes since the previous run.
+"""
+
+import struct
+from array import array
+from bisect import bisect_left
+from typing import BinaryIO, Dict, List, Optional, Sequence
+
+from .binfile import check_magic, read_columns, read_header, write_array, write_header
+from .cache import TableMarks
+from .collection import Collection
+from .forecast import BucketChange
+from .models import Bucket
+from .queries import CARD_TYPE_NEW, DELTA_CARDS_QUERY, SNAPSHOT_QUERY
+from .snapshot import IntervalBuckets
+from .writers import atomic_write
+
+DELTA_RECORD_NAME = ".vocab_delta_record.bin"
+DELTA_RECORD_VERSION = 1
+_MAGIC = b"VXD1"
+
+NEWLY_LEARNED = "Newly Learned"
+PROMOTED = "Promoted"
+LAPSED = "Lapsed"
+DELTA_SECTIONS = (NEWLY_LEARNED, PROMOTED, LAPSED)
+
+# rank of a card outside every bucket: new, reset, or past the last bucket's max_ivl
+UNLISTED = -1
+
+
+def delta_record_key(deck_name: Optional[str], buckets: Sequence[Bucket]) -> list:
+    # ranks only compare within the same deck and buckets; JSON-shaped to match the file's header
+    return [deck_name, [[bucket.name, bucket.min_ivl, bucket.max_ivl] for bucket in buckets]]
+
+
+class DeltaRecord:
+    """Every card's bucket rank as of the last export of an earlier day, and the ranks of the cards reviewed since."""
+
+    def __init__(self, path: str, collection_path: str, key: list):
+        self.path = path
+        self.collection_path = collection_path
+        self.key = key
+        self.day = ""
+        # sorted card ids and their IntervalBuckets.rank (or UNLISTED) as of base_marks (None before any export)
+        self.card_ids = array("q")
+        self.ranks = array("b")
+        self.base_marks: Optional[TableMarks] = None
+        # card id -> rank of the cards reviewed after base_marks, up to marks
+        self.changes: Dict[int, int] = {}
+        self.marks: Optional[TableMarks] = None
+        self._read_file()
+
+    def rank(self, card_id: int) -> int:
+        card_ids = self.card_ids
+        position = bisect_left(card_ids, card_id)
+        if position < len(card_ids) and card_ids[position] == card_id:
+            return self.ranks[position]
+        return UNLISTED
+
+    def start_day(self, day: str) -> None:
+        """Moves the base up to the last export when that was on an earlier day."""
+        if day == self.day:
+            return
+        self._apply(self.changes)
+        self.base_marks = self.marks
+        self.changes = {}
+        self.day = day
+
+    def _apply(self, changes: Dict[int, int]) -> None:
+        card_ids, ranks = self.card_ids, self.ranks
+        added = []
+        for cid, rank in changes.items():
+            position = bisect_left(card_ids, cid)
+            if position < len(card_ids) and card_ids[position] == cid:
+                ranks[position] = rank
+            else:
+                added.append((cid, rank))
+        if len(added) * 32 > len(card_ids):
+            # many new cards (e.g. the first export) are cheaper to merge in one sort than to insert one by one
+            merged = sorted([*zip(card_ids, ranks), *added])
+            self.card_ids = array("q", (cid for cid, _ in merged))
+            self.ranks = array("b", (rank for _, rank in merged))
+            return
+        for cid, rank in added:
+            position = bisect_left(card_ids, cid)
+            card_ids.insert(position, cid)
+            ranks.insert(position, rank)
+
+    def save(self) -> None:
+        header = {
+            "version": DELTA_RECORD_VERSION,
+            "collection": self.collection_path,
+            "key": self.key,
+            "day": self.day,
+            "base_marks": None if self.base_marks is None else [self.base_marks.mod, self.base_marks.usn],
+            "marks": None if self.marks is None else [self.marks.mod, self.marks.usn],
+        }
+        try:
+            with atomic_write(self.path, binary=True) as f:
+                f.write(_MAGIC)
+                write_header(f, header)
+                write_array(f, self.card_ids)
+                write_array(f, self.ranks)
+                write_array(f, self.changes.keys())
+                write_array(f, self.changes.values(), "b")
+        except OSError:
+            # the next delta lists these changes again
+            pass
+
+    def _read_file(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                self._read(f)
+        except (OSError, ValueError, KeyError, TypeError, struct.error):
+            # without a usable record every card in the deck counts as newly learned once
+            self._reset()
+
+    def _reset(self) -> None:
+        self.day = ""
+        self.card_ids, self.ranks = array("q"), array("b")
+        self.base_marks = self.marks = None
+        self.changes = {}
+
+    def _read(self, f: BinaryIO) -> None:
+        check_magic(f, _MAGIC)
+        header = read_header(f)
+        if (
+            header["version"] != DELTA_RECORD_VERSION
+            or header["collection"] != self.collection_path
+            or header["key"] != self.key
+        ):
+            raise ValueError("record made for another collection, deck or buckets")
+
+        card_ids, ranks = read_columns(f, "qb")
+        changed_ids, changed_ranks = read_columns(f, "qb")
+        self.day = header["day"]
+        self.card_ids, self.ranks = card_ids, ranks
+        self.changes = dict(zip(changed_ids, changed_ranks))
+        self.base_marks = _marks(header["base_marks"])
+        self.marks = _marks(header["marks"])
+
+
+def _marks(values: Optional[List[int]]) -> Optional[TableMarks]:
+    return None if values is None else TableMarks(mod=values[0], usn=values[1])
+
+
+def get_bucket_changes(
+    col: Collection, intervals: IntervalBuckets, where: Optional[str], record: DeltaRecord
+) -> List[BucketChange]:
+    """(card id, bucket at the record's base, bucket now) of the listed cards that changed bucket since the base.
+
+    The record takes the new rank of every card reviewed since; it is only written by DeltaRecord.save().
+    """
+    marks = TableMarks(
+        mod=col.db.scalar("SELECT MAX(id) FROM revlog") or 0,
+        usn=col.db.scalar("SELECT MAX(usn) FROM revlog") or 0,
+    )
+    base = record.base_marks
+    if where is None:
+        rows = []
+    elif base is None or marks.mod < base.mod:
+        # no earlier export, or a collection replaced by an older one (e.g. a full sync): every card is compared
+        rows = col.db.all(SNAPSHOT_QUERY.format(where=f"c.type != {CARD_TYPE_NEW} AND {where}"))
+    else:
+        rows = col.db.all(DELTA_CARDS_QUERY.format(where=where), base.mod, base.usn, base.mod)
+
+    names = intervals.order
+    changes: Dict[int, int] = {}
+    moved: List[BucketChange] = []
+    for cid, _nid, ivl, queue, card_type, _did, _odid in rows:
+        bucket = intervals.classify(ivl, queue, card_type)
+        rank = UNLISTED if bucket is None else intervals.rank[bucket]
+        changes[cid] = rank
+        old_rank = record.rank(cid)
+        if rank != UNLISTED and rank != old_rank:
+            moved.append((cid, None if old_rank == UNLISTED else names[old_rank], bucket))
+
+    # the same day's earlier deltas covered a subset of these reviews, so their changes are replaced
+    record.changes = changes
+    record.marks = marks
+    return moved
+
+
+def delta_section(intervals: IntervalBuckets, old_bucket: Optional[str], new_bucket: str) -> str:
+    if old_bucket is None:
+        return NEWLY_LEARNED
+    return PROMOTED if intervals.rank[new_bucket] > intervals.rank[old_bucket] else LAPSED
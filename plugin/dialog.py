@@ -1,29 +1,50 @@
 """Dialog UI for the vocabulary export plugin."""
 
 import os
+import threading
 from datetime import date
 from typing import List, Optional
 
 from aqt import mw
+from aqt.operations import QueryOp
 from aqt.qt import (
     QAbstractItemView,
     QCheckBox,
     QComboBox,
     QDialog,
     QFileDialog,
+    QFontDatabase,
     QHBoxLayout,
     QLabel,
     QListWidget,
     QListWidgetItem,
+    QPlainTextEdit,
     QPushButton,
     QSpinBox,
+    QTimer,
     QVBoxLayout,
 )
 from aqt.utils import showInfo, showWarning
 
+from . import load_timings
+from .batch import BatchExporter
+from .collection import AnkiCollection
 from .config import get_config, save_config
-from .exporter import VocabularyExporter
-from .models import ExportSettings
+from .exporter import VocabularyExporter, get_fields_for_deck, preload_deck_fields
+from .metrics import format_load_timings, format_metrics, log_export_metrics
+from .models import (
+    DEFAULT_BUCKETS,
+    Bucket,
+    ExportPreview,
+    ExportResult,
+    ExportSettings,
+    get_included_buckets,
+    parse_buckets,
+)
+from .writers import get_writer
+
+# quiet time after the last option change before the preview is recomputed
+PREVIEW_DELAY_MS = 300
 
 
 class ExportDialog(QDialog):
@@ -31,13 +52,27 @@ class ExportDialog(QDialog):
         super().__init__(parent)
         self._preselect_deck = preselect_deck
         self._config = get_config()
+        self._buckets = self._load_buckets()
         self._saved_fields: list[str] = []
+        self._cancel_event = threading.Event()
+        # a preview is computing; another one is due when it finishes
+        self._preview_running = False
+        self._preview_pending = False
 
         self._setup_window()
         self._create_widgets()
         self._setup_layout()
         self._connect_signals()
         self._apply_saved_config()
+        self._preload_fields()
+        self._schedule_preview()
+
+    def _load_buckets(self) -> List[Bucket]:
+        try:
+            return parse_buckets(self._config.get("buckets"))
+        except ValueError as e:
+            showWarning(f"{e}\n\nUsing the default buckets instead.")
+            return list(DEFAULT_BUCKETS)
 
     def _setup_window(self) -> None:
         self.setWindowTitle("Export Vocabulary")
@@ -50,28 +85,74 @@ class ExportDialog(QDialog):
         for deck_name in self.get_deck_names():
             self._deck_combo.addItem(deck_name, deck_name)
 
+        self._batch_cb = QCheckBox("Export several decks (one folder per deck)")
+        self._batch_all_cb = QCheckBox("Every top-level deck with cards")
+        self._batch_list = QListWidget()
+        self._batch_list.setSelectionMode(QAbstractItemView.SelectionMode.MultiSelection)
+        self._batch_list.setMaximumHeight(150)
+        self._batch_list.addItems(self.get_deck_names())
+
         self._fields_label = QLabel("Select fields to export:")
         self._fields_list = QListWidget()
         self._fields_list.setSelectionMode(QAbstractItemView.SelectionMode.MultiSelection)
         self._fields_list.setMaximumHeight(200)
 
+        self._collapse_siblings_cb = QCheckBox("One row per note (merge sibling cards)")
+        self._normalize_cb = QCheckBox("Clean up field text (strip HTML, decode entities)")
+        self._furigana_label = QLabel("Furigana:")
+        self._furigana_combo = QComboBox()
+        self._furigana_combo.addItem("Keep as 漢字[かんじ]", "brackets")
+        self._furigana_combo.addItem("Kanji only", "kanji")
+        self._furigana_combo.addItem("Reading only", "reading")
+
         self._group_label = QLabel("Group by:")
         self._group_combo = QComboBox()
         self._group_combo.addItem("No grouping (all in one)", "none")
         self._group_combo.addItem("Learning status", "status")
 
+        self._format_label = QLabel("Format:")
+        self._format_combo = QComboBox()
+        self._format_combo.addItem("Markdown", "markdown")
+        self._format_combo.addItem("CSV", "csv")
+        self._format_combo.addItem("JSON Lines", "jsonl")
+
         self._status_label = QLabel("Include:")
-        self._fresh_cb = QCheckBox("Fresh (1-7d)")
-        self._young_cb = QCheckBox("Young (8-20d)")
-        self._mature_cb = QCheckBox("Mature (21-89d)")
-        self._mastered_cb = QCheckBox("Mastered (90d+)")
+        self._bucket_cbs = {bucket.name: QCheckBox(bucket.label) for bucket in self._buckets}
 
         self._separate_today_cb = QCheckBox("Separate 'Added Today' section")
+        self._delta_cb = QCheckBox("Only what changed since the last export")
+        self._delta_cb.setToolTip(
+            "Writes one file with the words newly learned, promoted to a later bucket or lapsed since the last "
+            "export to the chosen folder"
+        )
 
         self._predictive_label = QLabel("Include new cards for next:")
         self._predictive_spin = QSpinBox()
         self._predictive_spin.setRange(0, 30)
         self._predictive_spin.setSuffix(" days")
+        self._forecast_cb = QCheckBox("Project review intervals, assuming")
+        self._forecast_cb.setToolTip("Move review cards to the bucket their interval is expected to reach by each day")
+        self._success_rate_spin = QSpinBox()
+        self._success_rate_spin.setRange(50, 100)
+        self._success_rate_spin.setSuffix("% recalled")
+
+        self._auto_export_cb = QCheckBox("Export like this after every sync")
+        self._auto_export_cb.setToolTip(
+            "Repeats this export in the background after syncing and when the profile closes, "
+            "if the collection changed"
+        )
+
+        self._preview_label = QLabel("")
+        self._preview_label.setWordWrap(True)
+        self._preview_text = QPlainTextEdit()
+        self._preview_text.setReadOnly(True)
+        self._preview_text.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self._preview_text.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        self._preview_text.setMaximumHeight(120)
+        self._preview_text.setVisible(False)
+        self._preview_timer = QTimer(self)
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.setInterval(PREVIEW_DELAY_MS)
 
         self._export_btn = QPushButton("Export")
         self._cancel_btn = QPushButton("Cancel")
@@ -84,30 +165,41 @@ class ExportDialog(QDialog):
         deck_layout.addWidget(self._deck_label)
         deck_layout.addWidget(self._deck_combo)
         layout.addLayout(deck_layout)
+        layout.addWidget(self._batch_cb)
+        layout.addWidget(self._batch_all_cb)
+        layout.addWidget(self._batch_list)
 
         # Fields section
         layout.addWidget(self._fields_label)
         layout.addWidget(self._fields_list)
+        layout.addWidget(self._collapse_siblings_cb)
+        normalize_layout = QHBoxLayout()
+        normalize_layout.addWidget(self._normalize_cb)
+        normalize_layout.addWidget(self._furigana_label)
+        normalize_layout.addWidget(self._furigana_combo)
+        normalize_layout.addStretch()
+        layout.addLayout(normalize_layout)
 
         # Group by row
         group_layout = QHBoxLayout()
         group_layout.addWidget(self._group_label)
         group_layout.addWidget(self._group_combo)
+        group_layout.addWidget(self._format_label)
+        group_layout.addWidget(self._format_combo)
         group_layout.addStretch()
         layout.addLayout(group_layout)
 
         # Status checkboxes row
         self._status_layout = QHBoxLayout()
         self._status_layout.addWidget(self._status_label)
-        self._status_layout.addWidget(self._fresh_cb)
-        self._status_layout.addWidget(self._young_cb)
-        self._status_layout.addWidget(self._mature_cb)
-        self._status_layout.addWidget(self._mastered_cb)
+        for checkbox in self._bucket_cbs.values():
+            self._status_layout.addWidget(checkbox)
         layout.addLayout(self._status_layout)
 
         # Today section row
         self._today_layout = QHBoxLayout()
         self._today_layout.addWidget(self._separate_today_cb)
+        self._today_layout.addWidget(self._delta_cb)
         self._today_layout.addStretch()
         layout.addLayout(self._today_layout)
 
@@ -115,11 +207,18 @@ class ExportDialog(QDialog):
         self._predictive_layout = QHBoxLayout()
         self._predictive_layout.addWidget(self._predictive_label)
         self._predictive_layout.addWidget(self._predictive_spin)
+        self._predictive_layout.addWidget(self._forecast_cb)
+        self._predictive_layout.addWidget(self._success_rate_spin)
         self._predictive_layout.addStretch()
         layout.addLayout(self._predictive_layout)
 
+        # Preview
+        layout.addWidget(self._preview_label)
+        layout.addWidget(self._preview_text)
+
         # Buttons row
         button_layout = QHBoxLayout()
+        button_layout.addWidget(self._auto_export_cb)
         button_layout.addStretch()
         button_layout.addWidget(self._cancel_btn)
         button_layout.addWidget(self._export_btn)
@@ -127,16 +226,50 @@ class ExportDialog(QDialog):
 
     def _connect_signals(self) -> None:
         self._deck_combo.currentIndexChanged.connect(self._on_deck_changed)
+        self._batch_cb.toggled.connect(self._on_batch_changed)
+        self._batch_all_cb.toggled.connect(self._on_batch_changed)
+        self._batch_list.itemSelectionChanged.connect(self._on_deck_changed)
         self._group_combo.currentIndexChanged.connect(self._on_grouping_changed)
+        self._normalize_cb.toggled.connect(self._furigana_combo.setEnabled)
+        self._forecast_cb.toggled.connect(self._success_rate_spin.setEnabled)
         self._export_btn.clicked.connect(self._on_export_clicked)
         self._cancel_btn.clicked.connect(self.reject)
 
+        # every option that changes what gets exported restarts the preview's timer
+        self._preview_timer.timeout.connect(self._start_preview)
+        for signal in (
+            self._deck_combo.currentIndexChanged,
+            self._batch_cb.toggled,
+            self._batch_all_cb.toggled,
+            self._batch_list.itemSelectionChanged,
+            self._fields_list.itemSelectionChanged,
+            self._collapse_siblings_cb.toggled,
+            self._normalize_cb.toggled,
+            self._furigana_combo.currentIndexChanged,
+            self._group_combo.currentIndexChanged,
+            self._format_combo.currentIndexChanged,
+            self._separate_today_cb.toggled,
+            self._delta_cb.toggled,
+            self._predictive_spin.valueChanged,
+            *(checkbox.toggled for checkbox in self._bucket_cbs.values()),
+        ):
+            signal.connect(self._schedule_preview)
+
     def _apply_saved_config(self) -> None:
         if self._preselect_deck:
             index = self._deck_combo.findText(self._preselect_deck)
             if index >= 0:
                 self._deck_combo.setCurrentIndex(index)
 
+        batch_decks = self._config.get("batch_decks", [])
+        for i in range(self._batch_list.count()):
+            item = self._batch_list.item(i)
+            item.setSelected(item.text() in batch_decks)
+        self._batch_all_cb.setChecked(self._config.get("batch_all_decks", False))
+        # a deck picked from the deck browser means a single-deck export
+        self._batch_cb.setChecked(self._config.get("batch", False) and not self._preselect_deck)
+        self._update_batch_visibility()
+
         saved_fields = self._config.get("fields", [])
         if isinstance(saved_fields, str):
             saved_fields = [f.strip() for f in saved_fields.split(",") if f.strip()]
@@ -149,26 +282,61 @@ class ExportDialog(QDialog):
         if index >= 0:
             self._group_combo.setCurrentIndex(index)
 
-        self._fresh_cb.setChecked(self._config.get("include_fresh", True))
-        self._young_cb.setChecked(self._config.get("include_young", True))
-        self._mature_cb.setChecked(self._config.get("include_mature", True))
-        self._mastered_cb.setChecked(self._config.get("include_mastered", True))
+        index = self._format_combo.findData(self._config.get("format", "markdown"))
+        if index >= 0:
+            self._format_combo.setCurrentIndex(index)
+
+        included_buckets = get_included_buckets(self._config, self._buckets)
+        for name, checkbox in self._bucket_cbs.items():
+            checkbox.setChecked(name in included_buckets)
         self._separate_today_cb.setChecked(self._config.get("separate_today", True))
+        self._delta_cb.setChecked(self._config.get("delta_export", False))
+        self._collapse_siblings_cb.setChecked(self._config.get("collapse_siblings", False))
+        self._normalize_cb.setChecked(self._config.get("normalize_fields", False))
+        self._furigana_combo.setEnabled(self._normalize_cb.isChecked())
+        index = self._furigana_combo.findData(self._config.get("furigana", "brackets"))
+        if index >= 0:
+            self._furigana_combo.setCurrentIndex(index)
         self._predictive_spin.setValue(self._config.get("predictive_days", 0))
+        self._auto_export_cb.setChecked(self._config.get("auto_export", False))
+        self._forecast_cb.setChecked(self._config.get("forecast_intervals", False))
+        self._success_rate_spin.setEnabled(self._forecast_cb.isChecked())
+        self._success_rate_spin.setValue(round(self._config.get("forecast_success_rate", 0.9) * 100))
 
         self._update_status_visibility()
 
+    def _preload_fields(self) -> None:
+        QueryOp(
+            parent=self, op=lambda col: preload_deck_fields(AnkiCollection(col)), success=lambda _: None
+        ).run_in_background()
+
     def _on_deck_changed(self) -> None:
         self._update_fields_list()
 
+    def _on_batch_changed(self) -> None:
+        self._update_batch_visibility()
+        self._update_fields_list()
+
+    def _update_batch_visibility(self) -> None:
+        batch = self._batch_cb.isChecked()
+        self._deck_combo.setEnabled(not batch)
+        self._batch_all_cb.setVisible(batch)
+        self._batch_list.setVisible(batch)
+        self._batch_list.setEnabled(not self._batch_all_cb.isChecked())
+
     def _on_grouping_changed(self) -> None:
         self._update_status_visibility()
 
     def _update_fields_list(self) -> None:
         currently_selected = [item.text() for item in self._fields_list.selectedItems()]
 
-        deck_name = self._deck_combo.currentData()
-        available_fields = self.get_fields_for_deck(deck_name)
+        if not self._batch_cb.isChecked():
+            available_fields = self.get_fields_for_deck(self._deck_combo.currentData())
+        elif self._batch_all_cb.isChecked():
+            available_fields = self.get_fields_for_deck(None)
+        else:
+            deck_names = [item.text() for item in self._batch_list.selectedItems()]
+            available_fields = sorted({field for name in deck_names for field in self.get_fields_for_deck(name)})
 
         self._fields_list.clear()
         for field_name in available_fields:
@@ -195,28 +363,100 @@ class ExportDialog(QDialog):
             if widget:
                 widget.setVisible(show_status)
 
+    def _schedule_preview(self) -> None:
+        self._preview_timer.start()
+
+    def _start_preview(self) -> None:
+        if self._preview_running:
+            self._preview_pending = True
+            return
+        settings = self._get_export_settings()
+        if settings.is_batch:
+            self._show_preview_message("The preview covers single-deck exports.")
+            return
+        if not settings.fields:
+            self._show_preview_message("Select at least one field to preview the export.")
+            return
+
+        settings.collect_metrics = False
+        self._preview_running = True
+        op = QueryOp(
+            parent=self,
+            op=lambda col: VocabularyExporter(settings, AnkiCollection(col)).preview(),
+            success=lambda preview: self._on_preview_finished(settings, preview),
+        )
+        op.failure(self._on_preview_failed)
+        op.run_in_background()
+
+    def _on_preview_finished(self, settings: ExportSettings, preview: ExportPreview) -> None:
+        if self._restart_outdated_preview():
+            return
+
+        lines = [", ".join(f"{title}: {cards:,}" for title, cards in preview.sections)]
+        if preview.predicted_new_cards:
+            new_cards = ", ".join(f"{cards:,}" for cards in preview.predicted_new_cards)
+            lines.append(f"New cards on the predicted days: {new_cards}")
+        if settings.delta_export:
+            lines.append("The delta file lists only the cards that changed since the last export.")
+        elif not preview.text:
+            lines.append('Turn on "export_cache" in the add-on config to preview rows.')
+        self._preview_label.setText("\n".join(lines))
+        self._preview_text.setPlainText(preview.text)
+        self._preview_text.setVisible(bool(preview.text))
+
+    def _on_preview_failed(self, error: Exception) -> None:
+        if not self._restart_outdated_preview():
+            self._show_preview_message(f"No preview: {error}")
+
+    def _restart_outdated_preview(self) -> bool:
+        """Ends the running preview; when the options changed meanwhile, starts the next one and returns True."""
+        self._preview_running = False
+        if not self._preview_pending:
+            return False
+        self._preview_pending = False
+        self._start_preview()
+        return True
+
+    def _show_preview_message(self, message: str) -> None:
+        self._preview_label.setText(message)
+        self._preview_text.setVisible(False)
+
     def _get_export_settings(self) -> ExportSettings:
         grouping = self._group_combo.currentData()
         predictive_days = self._predictive_spin.value() if grouping == "status" else 0
+        batch = self._batch_cb.isChecked()
 
         return ExportSettings(
-            deck=self._deck_combo.currentData(),
+            deck=None if batch else self._deck_combo.currentData(),
             fields=[item.text() for item in self._fields_list.selectedItems()],
             grouping=grouping,
-            include_fresh=self._fresh_cb.isChecked(),
-            include_young=self._young_cb.isChecked(),
-            include_mature=self._mature_cb.isChecked(),
-            include_mastered=self._mastered_cb.isChecked(),
+            format=self._format_combo.currentData(),
+            buckets=self._buckets,
+            included_buckets=[name for name, checkbox in self._bucket_cbs.items() if checkbox.isChecked()],
             separate_today=self._separate_today_cb.isChecked(),
             predictive_days=predictive_days,
+            forecast_intervals=self._forecast_cb.isChecked(),
+            forecast_success_rate=self._success_rate_spin.value() / 100,
+            delta_export=grouping == "status" and self._delta_cb.isChecked(),
+            collapse_siblings=self._collapse_siblings_cb.isChecked(),
+            normalize_fields=self._normalize_cb.isChecked(),
+            furigana=self._furigana_combo.currentData(),
+            keep_first_review_index=self._config.get("keep_first_review_index", False),
+            use_cache=self._config.get("export_cache", False),
+            collect_metrics=self._config.get("show_metrics", False) or self._config.get("log_metrics", False),
+            batch_decks=[item.text() for item in self._batch_list.selectedItems()] if batch else [],
+            batch_all_decks=batch and self._batch_all_cb.isChecked(),
+            batch_workers=self._config.get("batch_workers", 1),
+            file_workers=self._config.get("file_workers", 0),
         )
 
-    def _prompt_for_export_path(self, predictive_days: int) -> tuple[Optional[str], Optional[str]]:
+    def _prompt_for_export_path(self, settings: ExportSettings) -> tuple[Optional[str], Optional[str]]:
         last_dir = self._config.get("last_export_dir", "")
-        ext = ".md"
-        file_filter = "Markdown Files (*.md);;All Files (*)"
+        writer = get_writer(settings.format)
+        ext = writer.extension
+        file_filter = f"{writer.file_filter};;All Files (*)"
 
-        if predictive_days > 0:
+        if settings.predictive_days > 0 or settings.is_batch or settings.delta_export:
             export_dir = QFileDialog.getExistingDirectory(self, "Select Export Directory", last_dir)
             if not export_dir:
                 return None, None
@@ -232,13 +472,23 @@ class ExportDialog(QDialog):
     def _save_config_from_settings(self, settings: ExportSettings, export_dir: str) -> None:
         self._config["fields"] = settings.fields
         self._config["grouping"] = settings.grouping
-        self._config["include_fresh"] = settings.include_fresh
-        self._config["include_young"] = settings.include_young
-        self._config["include_mature"] = settings.include_mature
-        self._config["include_mastered"] = settings.include_mastered
+        self._config["format"] = settings.format
+        self._config["included_buckets"] = settings.included_buckets
         self._config["separate_today"] = settings.separate_today
         self._config["predictive_days"] = settings.predictive_days
+        self._config["forecast_intervals"] = settings.forecast_intervals
+        self._config["forecast_success_rate"] = settings.forecast_success_rate
+        self._config["delta_export"] = settings.delta_export
+        self._config["collapse_siblings"] = settings.collapse_siblings
+        self._config["normalize_fields"] = settings.normalize_fields
+        self._config["furigana"] = settings.furigana
+        self._config["batch"] = settings.is_batch
+        if settings.is_batch:
+            self._config["batch_decks"] = settings.batch_decks
+            self._config["batch_all_decks"] = settings.batch_all_decks
         self._config["last_export_dir"] = export_dir
+        self._config["last_deck"] = settings.deck
+        self._config["auto_export"] = self._auto_export_cb.isChecked()
         save_config(self._config)
 
     def _on_export_clicked(self) -> None:
@@ -247,53 +497,94 @@ class ExportDialog(QDialog):
             return
 
         settings = self._get_export_settings()
+        if self._batch_cb.isChecked() and not settings.is_batch:
+            showWarning("Please select at least one deck to export.")
+            return
 
-        export_dir, output_path = self._prompt_for_export_path(settings.predictive_days)
+        export_dir, output_path = self._prompt_for_export_path(settings)
         if export_dir is None:
             return
+        self._preview_timer.stop()
+
+        self._cancel_event.clear()
 
-        exporter = VocabularyExporter(settings)
-        result = exporter.export(export_dir, output_path)
+        def export(col) -> ExportResult:
+            exporter_class = BatchExporter if settings.is_batch else VocabularyExporter
+            exporter = exporter_class(
+                settings, AnkiCollection(col), progress=self._report_progress, should_cancel=self._cancel_event.is_set
+            )
+            return exporter.export(export_dir, output_path)
+
+        self._export_btn.setEnabled(False)
+        op = QueryOp(
+            parent=self,
+            op=export,
+            success=lambda result: self._on_export_finished(settings, export_dir, result),
+        )
+        op.failure(self._on_export_failed)
+        op.with_progress("Exporting vocabulary...").run_in_background()
+
+    def _report_progress(self, label: str, value: int, maximum: int) -> None:
+        # called from the export thread; Qt widgets may only be touched on the main thread
+        def update() -> None:
+            if mw.progress.want_cancel():
+                self._cancel_event.set()
+            mw.progress.update(label=label, value=value, max=maximum)
+
+        mw.taskman.run_on_main(update)
+
+    def _on_export_finished(self, settings: ExportSettings, export_dir: str, result: ExportResult) -> None:
+        self._export_btn.setEnabled(True)
+
+        if result.cancelled:
+            return
 
         if not result.success:
             showWarning(result.error_message or "Export failed.")
             return
 
         self._save_config_from_settings(settings, export_dir)
+        if self._config.get("log_metrics", False):
+            log_export_metrics(
+                result,
+                "dialog",
+                deck=settings.deck,
+                grouping=settings.grouping,
+                predictive_days=settings.predictive_days,
+                load_timings=load_timings,
+            )
         self._show_success_message(result)
         self.accept()
 
-    def _show_success_message(self, result) -> None:
-        if len(result.files_created) > 1:
-            showInfo(
-                f"Successfully exported {result.total_cards} cards to {len(result.files_created)} files:\n- "
-                f"{'\n- '.join(result.files_created)}\n\nDirectory: {result.export_directory}"
+    def _on_export_failed(self, error: Exception) -> None:
+        self._export_btn.setEnabled(True)
+        showWarning(str(error) or "Export failed.")
+
+    def _show_success_message(self, result: ExportResult) -> None:
+        if len(result.files) > 1:
+            files = "\n- ".join(result.files)
+            message = (
+                f"Successfully exported {result.total_cards} cards to {len(result.files)} files:\n- "
+                f"{files}\n\nDirectory: {result.export_directory}"
             )
         else:
-            showInfo(f"Successfully exported {result.total_cards} cards to:\n{result.output_path}")
+            message = f"Successfully exported {result.total_cards} cards to:\n{result.output_path}"
+        if result.files_unchanged:
+            message += (
+                f"\n\n{len(result.files_created)} created, {len(result.files_updated)} updated, "
+                f"{len(result.files_unchanged)} unchanged and left as they were."
+            )
+        if result.metrics is not None and self._config.get("show_metrics", False):
+            message += f"\n\nTimings:\n{format_metrics(result.metrics)}\n{format_load_timings(load_timings)}"
+        showInfo(message)
 
     @staticmethod
     def get_deck_names() -> List[str]:
         return sorted(mw.col.decks.all_names())
 
     @staticmethod
-    def get_fields_for_deck(deck_name: str) -> List[str]:
-        query = f'deck:"{deck_name}"'
-        card_ids = mw.col.find_cards(query)
-
-        note_type_ids = set()
-        for cid in card_ids:
-            card = mw.col.get_card(cid)
-            note = card.note()
-            note_type_ids.add(note.mid)
-
-        fields = set()
-        for model in mw.col.models.all():
-            if model["id"] in note_type_ids:
-                for fld in model["flds"]:
-                    fields.add(fld["name"])
-
-        return sorted(fields)
+    def get_fields_for_deck(deck_name: Optional[str]) -> List[str]:
+        return get_fields_for_deck(AnkiCollection(mw.col), deck_name)
 
 
 def show_export_dialog(deck_name: Optional[str] = None) -> None:
@@ -1,65 +1,407 @@
+import heapq
 import os
-from datetime import date, datetime, timedelta
-from typing import Dict, List, Optional, Set, Tuple
-from .models import ExportResult, ExportSettings
-from aqt import mw
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, timedelta
+from itertools import islice
+from typing import Callable, Deque, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+from .cache import get_export_cache
+from .collection import Collection
+from .delta import DELTA_RECORD_NAME, DELTA_SECTIONS, DeltaRecord, delta_record_key, delta_section, get_bucket_changes
+from .forecast import BucketChange, BucketForecast, forecast_buckets
+from .manifest import CREATED, UNCHANGED, UPDATED, ExportManifest
+from .metrics import ExportRecorder, NullRecorder
+from .models import ExportPreview, ExportResult, ExportSettings, StageMetrics
+from .normalize import FieldNormalizer
+from .queries import (
+    CARD_TYPE_NEW,
+    FIRST_REVIEWED_TODAY_QUERY,
+    FORECAST_CARDS_QUERY,
+    NEW_CARDS_QUERY,
+    QUEUE_REVIEW,
+    SECTION_COUNTS_QUERY,
+    SNAPSHOT_QUERY,
+)
+from .snapshot import (
+    LEARNING,
+    CardSnapshot,
+    FirstReviewIndex,
+    IntervalBuckets,
+    Row,
+    get_first_review_index,
+    get_note_type_ids,
+    deck_filter,
+    get_note_type_ids_by_deck,
+    ids_to_sql,
+    sort_cards_by_first_review,
+)
+from .writers import Writer, get_writer
+
+# rows shown in the export dialog's preview
+PREVIEW_ROWS = 5
+
+
+class RowBlock:
+    def __init__(self, snapshot: CardSnapshot, card_ids: List[int], keep_rendered: bool = False):
+        self._snapshot = snapshot
+        self.card_ids = snapshot.load_cards(card_ids)
+        # shared blocks of predictive exports keep their text; single files stream row by row
+        self._keep_rendered = keep_rendered
+        self._rendered: Dict[Hashable, str] = {}
+        # day files written in parallel wait for the first one rendering a shared block instead of repeating it
+        self._render_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.card_ids)
+
+    def rows(self) -> Iterator[Row]:
+        return (self._snapshot.row(cid) for cid in self.card_ids)
+
+    def render(self, writer: Writer, fieldnames: List[str], title: str) -> Iterable[str]:
+        if not self._keep_rendered:
+            return writer.render_rows(self.rows(), fieldnames, title)
+        key = writer.cache_key(title)
+        with self._render_lock:
+            rendered = self._rendered.get(key)
+            if rendered is None:
+                rendered = self._rendered[key] = "".join(writer.render_rows(self.rows(), fieldnames, title))
+        return (rendered,)
+
+
+Section = Tuple[str, List[RowBlock]]
+
+
+ProgressCallback = Callable[[str, int, int], None]
+
+
+class ExportCancelled(Exception):
+    pass
 
 
 class VocabularyExporter:
-    cards_query_learning = "is:learn"
-    cards_query_fresh = "is:review -is:learn prop:ivl>=1 prop:ivl<=7"
-    cards_query_young = "is:review -is:learn prop:ivl>=8 prop:ivl<=20"
-    cards_query_mature = "is:review -is:learn prop:ivl>=21 prop:ivl<=89"
-    cards_query_mastered = "is:review -is:learn prop:ivl>=90"
-
-    def __init__(self, settings: ExportSettings):
+    def __init__(
+        self,
+        settings: ExportSettings,
+        col: Collection,
+        progress: Optional[ProgressCallback] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        snapshot: Optional[CardSnapshot] = None,
+        today_card_ids: Optional[List[int]] = None,
+    ):
         self.settings = settings
+        self._recorder = ExportRecorder(col) if settings.collect_metrics else NullRecorder(col)
+        # with metrics on, queries go through a counting wrapper
+        self.col = self._recorder.col
+        self._progress = progress
+        self._should_cancel = should_cancel
         self._new_cards_by_day: Dict[int, List[int]] = {}
+        # a batch export passes in a loaded and sorted snapshot (and today's cards) shared with other decks
+        self._snapshot_loaded = snapshot is not None
+        # set once prepare() has done every collection read the export needs
+        self._prepared = False
+        # deltas read their few cards straight from the collection instead of refreshing the cache
+        self._cache = get_export_cache(col) if settings.use_cache and not settings.delta_export else None
+        self._snapshot = snapshot or CardSnapshot(
+            self.col,
+            settings.deck,
+            settings.fields,
+            settings.collapse_siblings,
+            normalizer=get_normalizer(col, settings),
+            buckets=settings.buckets,
+            cache=self._cache,
+        )
+        self._snapshot.col = self.col
+        self._today_card_ids = today_card_ids
+        self._writer = get_writer(settings.format)
+        # row blocks shared by every day file; each is extracted and rendered once per export
+        self._blocks: Dict[Hashable, RowBlock] = {}
+        self._forecast: Optional[BucketForecast] = None
+        # blocks of buckets whose projected cards differ from today's, kept for the next day only
+        self._projected_blocks: Dict[Hashable, RowBlock] = {}
 
     def export(self, export_dir: str, output_path: Optional[str] = None) -> ExportResult:
         try:
-            self._load_new_cards_if_needed()
-            return self._perform_export(export_dir, output_path)
+            result = self._export(export_dir, output_path)
+        except ExportCancelled:
+            result = ExportResult(success=False, cancelled=True, error_message="Export cancelled.")
         except Exception as e:
-            return ExportResult(success=False, error_message=str(e))
+            result = ExportResult(success=False, error_message=str(e))
+        result.metrics = self._recorder.finish()
+        return result
+
+    def preview(self, rows: int = PREVIEW_ROWS) -> ExportPreview:
+        """Section counts and the first rows of today's file, without writing anything.
+
+        With the export cache, counts and rows come from its snapshot, which the export then reuses; without it the
+        counts come from one aggregate query and no rows are rendered.
+        """
+        self._load_new_cards_if_needed()
+        predicted = [len(self._new_cards_by_day.get(batch, [])) for batch in range(self.settings.predictive_days)]
+        if self._cache is None:
+            return ExportPreview(sections=get_section_counts(self.col, self.settings), predicted_new_cards=predicted)
+
+        if not self._snapshot_loaded:
+            self._load_snapshot()
+        sections = self._build_sections_for_day(0)
+        return ExportPreview(
+            sections=[(title, sum(len(block) for block in blocks)) for title, blocks in sections],
+            predicted_new_cards=predicted,
+            text=self._writer.render(self._first_rows(sections, rows), self.settings.fields),
+        )
+
+    def _first_rows(self, sections: List[Section], rows: int) -> List[Section]:
+        """The sections cut off after `rows` rows, as the file starts."""
+        result: List[Section] = []
+        for title, blocks in sections:
+            if rows <= 0:
+                break
+            card_ids = list(islice((cid for block in blocks for cid in block.card_ids), rows))
+            result.append((title, [RowBlock(self._snapshot, card_ids)]))
+            rows -= len(card_ids)
+        return result
+
+    def prepare(self) -> None:
+        """Does all of a (non-delta) export's collection reads, so export() can then run on another thread."""
+        if self._prepared:
+            return
+        if not self._snapshot_loaded:
+            self._load_snapshot()
+            self._snapshot_loaded = True
+        self._load_new_cards_if_needed()
+        self._load_forecast_if_needed()
+        settings = self.settings
+        if settings.grouping == "status" and settings.include_first_bucket and settings.separate_today:
+            self._get_today_card_ids()
+        # predicted new cards aren't in the snapshot, so their cards and notes are read now
+        self._snapshot.preload(cid for card_ids in self._new_cards_by_day.values() for cid in card_ids)
+        self._prepared = True
+
+    def _export(self, export_dir: str, output_path: Optional[str]) -> ExportResult:
+        if self.settings.delta_export:
+            return self._perform_delta_export(export_dir)
+        self.prepare()
+        return self._perform_export(export_dir, output_path)
+
+    def _load_snapshot(self) -> None:
+        self._refresh_cache()
+        if self._cache is not None:
+            cached = self._cache.get_snapshot(self._snapshot_key())
+            if cached is not None:
+                self._snapshot = cached
+                self._snapshot.col = self.col
+                return
+
+        with self._recorder.stage("first_review_index") as stage:
+            self._report_progress("Indexing review history", 0, 0)
+            if self._cache is not None:
+                first_review_index = FirstReviewIndex(self._cache.first_reviews)
+            else:
+                first_review_index = get_first_review_index(
+                    self.col, self.settings.deck, self.settings.keep_first_review_index
+                )
+            stage.cards = len(first_review_index.first_reviews)
+        with self._recorder.stage("fetch_cards") as stage:
+            self._report_progress("Reading cards", 0, 0)
+            self._snapshot.fetch()
+            stage.cards = len(self._snapshot.card_ids)
+        with self._recorder.stage("sort_cards") as stage:
+            self._snapshot.sort(first_review_index)
+            stage.cards = len(self._snapshot.card_ids)
+        if self._cache is not None:
+            self._cache.put_snapshot(self._snapshot_key(), self._snapshot)
+
+    def _snapshot_key(self) -> Hashable:
+        settings = self.settings
+        buckets = tuple((bucket.name, bucket.min_ivl, bucket.max_ivl) for bucket in settings.buckets)
+        normalize = settings.furigana if settings.normalize_fields else None
+        return settings.deck, tuple(settings.fields), buckets, settings.collapse_siblings, normalize
+
+    def _refresh_cache(self) -> None:
+        if self._cache is None:
+            return
+        with self._recorder.stage("refresh_cache") as stage:
+            self._report_progress("Checking the collection for changes", 0, 0)
+            self._cache.refresh(self.col)
+            stage.cards = len(self._cache.cards)
+
+    def _report_progress(self, label: str, value: int, maximum: int) -> None:
+        if self._progress is not None:
+            self._progress(label, value, maximum)
+        if self._should_cancel is not None and self._should_cancel():
+            raise ExportCancelled()
 
     def _load_new_cards_if_needed(self) -> None:
         if self.settings.predictive_days > 0 and self.settings.grouping == "status":
-            self._new_cards_by_day = get_new_cards_by_day(self.settings.deck, self.settings.predictive_days)
+            with self._recorder.stage("predict_new_cards") as stage:
+                self._report_progress("Predicting new cards", 0, 0)
+                self._new_cards_by_day = get_new_cards_by_day(
+                    self.col, self.settings.deck, self.settings.predictive_days
+                )
+                stage.cards = sum(len(card_ids) for card_ids in self._new_cards_by_day.values())
+
+    def _load_forecast_if_needed(self) -> None:
+        settings = self.settings
+        if settings.predictive_days > 0 and settings.grouping == "status" and settings.forecast_intervals:
+            with self._recorder.stage("forecast_intervals") as stage:
+                self._report_progress("Projecting intervals", 0, 0)
+                self._forecast = get_interval_forecast(
+                    self.col, self._snapshot, settings.predictive_days, settings.forecast_success_rate
+                )
+                stage.cards = self._forecast.card_count
 
     def _perform_export(self, export_dir: str, output_path: Optional[str]) -> ExportResult:
         total_cards = 0
-        files_created: List[str] = []
+        # file name -> CREATED, UPDATED or UNCHANGED, in export order
+        statuses: Dict[str, str] = {}
+        # file name -> why it couldn't be written
+        failures: Dict[str, str] = {}
         last_output_path = output_path or ""
 
         days_to_export = self._get_days_to_export()
-
-        for day_offset in days_to_export:
-            sections = self._build_sections_for_day(day_offset)
-
-            if day_offset > 0 and not sections:
-                continue
-
-            if day_offset == 0 and not sections and self.settings.grouping == "status":
-                return ExportResult(success=False, error_message="Please select at least one status to include.")
-
-            target_date = date.today() + timedelta(days=day_offset)
-            day_output_path = self._get_output_path_for_day(export_dir, output_path, target_date, day_offset)
-            last_output_path = day_output_path
-
-            write_markdown(day_output_path, sections, self.settings.fields)
-
-            total_cards += sum(len(rows) for _, rows in sections)
-            files_created.append(os.path.basename(day_output_path))
+        # all of an export's files go to one folder; it keeps their fingerprints unless it's a single file the user
+        # placed somewhere of their own choosing
+        first_path = self._get_output_path_for_day(export_dir, output_path, date.today(), 0)
+        owns_folder = output_path is None or self.settings.predictive_days > 0
+        manifest = ExportManifest(os.path.dirname(os.path.abspath(first_path)), persistent=owns_folder)
+        workers = self._get_file_workers(len(days_to_export))
+        # day files being rendered and written, oldest first: (path, cards, metrics, future)
+        pending: Deque[Tuple[str, int, StageMetrics, Future]] = deque()
+
+        def collect_oldest() -> None:
+            nonlocal total_cards
+            day_output_path, day_cards, file_metrics, future = pending.popleft()
+            name = os.path.basename(day_output_path)
+            self._report_progress(f"Writing {name}", len(statuses) + len(failures), len(days_to_export))
+            try:
+                status, stage = future.result()
+            except Exception as e:
+                failures[name] = str(e)
+                return
+            self._recorder.add_stage(stage)
+            file_metrics.seconds += stage.seconds
+            file_metrics.bytes = stage.bytes
+            self._recorder.add_file(file_metrics)
+            total_cards += day_cards
+            statuses[name] = status
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for day_offset in days_to_export:
+                with self._recorder.measure() as file_metrics:
+                    with self._recorder.stage("build_sections"):
+                        self._report_progress("Building sections", day_offset, len(days_to_export))
+                        sections = self._build_sections_for_day(day_offset)
+
+                    if day_offset > 0 and not sections:
+                        continue
+
+                    if day_offset == 0 and not sections and self.settings.grouping == "status":
+                        return ExportResult(
+                            success=False, error_message="Please select at least one status to include."
+                        )
+
+                    target_date = date.today() + timedelta(days=day_offset)
+                    day_output_path = self._get_output_path_for_day(export_dir, output_path, target_date, day_offset)
+                    last_output_path = day_output_path
+                    day_cards = sum(len(block) for _, blocks in sections for block in blocks)
+
+                    if self._recorder.enabled:
+                        # rows are cached per note, so extracting them first only moves that work out of the write stage
+                        with self._recorder.stage("extract_rows") as stage:
+                            stage.cards = sum(1 for _, blocks in sections for block in blocks for _ in block.rows())
+
+                file_metrics.name = os.path.basename(day_output_path)
+                file_metrics.cards = day_cards
+                future = pool.submit(self._write_day_file, manifest, day_output_path, sections, day_cards)
+                pending.append((day_output_path, day_cards, file_metrics, future))
+                # sections are built ahead of the writers by at most two files each
+                while len(pending) > 2 * workers:
+                    collect_oldest()
+
+            while pending:
+                collect_oldest()
+        finally:
+            for _, _, _, future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+            manifest.save()
 
         return ExportResult(
-            success=True,
+            success=not failures,
             total_cards=total_cards,
-            files_created=files_created,
+            files=list(statuses),
+            files_created=[name for name, status in statuses.items() if status == CREATED],
+            files_updated=[name for name, status in statuses.items() if status == UPDATED],
+            files_unchanged=[name for name, status in statuses.items() if status == UNCHANGED],
+            files_failed=list(failures),
             export_directory=export_dir,
             output_path=last_output_path,
+            error_message="\n".join(f"{name}: {error}" for name, error in failures.items()),
         )
 
+    def _perform_delta_export(self, export_dir: str) -> ExportResult:
+        settings = self.settings
+        today = date.today()
+        key = delta_record_key(settings.deck, settings.buckets)
+        record = DeltaRecord(os.path.join(export_dir, DELTA_RECORD_NAME), self.col.path, key)
+        record.start_day(today.isoformat())
+        with self._recorder.stage("delta_changes") as stage:
+            self._report_progress("Finding changes since the last export", 0, 0)
+            changes = get_bucket_changes(
+                self.col, self._snapshot.intervals, deck_filter(self.col, settings.deck), record
+            )
+            stage.cards = len(record.changes)
+
+        path = os.path.join(export_dir, f"vocab_delta_{today.isoformat()}{self._writer.extension}")
+        name = os.path.basename(path)
+        manifest = ExportManifest(export_dir)
+        with self._recorder.measure(name) as file_metrics:
+            with self._recorder.stage("build_sections"):
+                self._report_progress("Building sections", 0, 0)
+                sections = self._build_delta_sections(changes)
+            cards = sum(len(block) for _, blocks in sections for block in blocks)
+            self._report_progress(f"Writing {name}", 0, 1)
+            status, stage = self._write_day_file(manifest, path, sections, cards)
+        manifest.save()
+        # the record only moves on once the file listing its changes is written
+        record.save()
+
+        self._recorder.add_stage(stage)
+        file_metrics.cards = cards
+        file_metrics.bytes = stage.bytes
+        self._recorder.add_file(file_metrics)
+        return ExportResult(
+            success=True,
+            total_cards=cards,
+            files=[name],
+            files_created=[name] if status == CREATED else [],
+            files_updated=[name] if status == UPDATED else [],
+            files_unchanged=[name] if status == UNCHANGED else [],
+            export_directory=export_dir,
+            output_path=path,
+        )
+
+    def _write_day_file(
+        self, manifest: ExportManifest, path: str, sections: List[Section], cards: int
+    ) -> Tuple[str, StageMetrics]:
+        """Renders and writes one day file, usually on a worker thread.
+
+        The blocks' notes and field indexes were read on the export thread, so building their rows makes no calls
+        into the collection.
+        """
+        # timed directly: queries counted meanwhile would be the main thread's
+        started = time.perf_counter()
+        status, size = manifest.write(
+            path, lambda f: self._writer.write(f, sections, self.settings.fields), self._writer.newline
+        )
+        return status, StageMetrics("write_file", time.perf_counter() - started, cards=cards, bytes=size)
+
+    def _get_file_workers(self, files: int) -> int:
+        cores = os.cpu_count() or 1
+        return max(1, min(self.settings.file_workers or cores, cores, files))
+
     def _get_days_to_export(self) -> range:
         if self.settings.predictive_days > 0:
             return range(self.settings.predictive_days + 1)
@@ -68,7 +410,7 @@ class VocabularyExporter:
     def _get_output_path_for_day(
         self, export_dir: str, output_path: Optional[str], target_date: date, day_offset: int
     ) -> str:
-        ext = ".md"
+        ext = self._writer.extension
 
         if self.settings.predictive_days > 0:
             if day_offset == 0:
@@ -79,7 +421,7 @@ class VocabularyExporter:
 
         return output_path or os.path.join(export_dir, f"vocab_{target_date.isoformat()}{ext}")
 
-    def _build_sections_for_day(self, day_offset: int) -> List[Tuple[str, List[Dict[str, str]]]]:
+    def _build_sections_for_day(self, day_offset: int) -> List[Section]:
         if self.settings.grouping == "none":
             if day_offset == 0:
                 return self._build_all_cards_section()
@@ -87,186 +429,317 @@ class VocabularyExporter:
         else:
             return self._build_grouped_sections(day_offset)
 
-    def _build_all_cards_section(self) -> List[Tuple[str, List[Dict[str, str]]]]:
-        query = build_query(self.settings.deck, "")
-        card_ids = sort_cards_by_first_review(fetch_cards(query))
-        rows = [extract_row(cid, self.settings.fields) for cid in card_ids]
-        return [("All Cards", rows)]
+    def _build_all_cards_section(self) -> List[Section]:
+        return [("All Cards", [self._block("all", lambda: self._snapshot.card_ids)])]
 
-    def _build_grouped_sections(self, day_offset: int) -> List[Tuple[str, List[Dict[str, str]]]]:
-        sections: List[Tuple[str, List[Dict[str, str]]]] = []
+    def _build_grouped_sections(self, day_offset: int) -> List[Section]:
+        sections: List[Section] = []
         today_batch = day_offset - 1
-        exclude_ids: Set[int] = set()
+        exclude_today = False
+        moves = self._get_projected_moves(day_offset)
 
-        if self.settings.include_fresh:
+        if self.settings.include_first_bucket:
             if self.settings.separate_today:
-                today_result = self._build_today_section(day_offset, today_batch)
-                if today_result:
-                    section_name, rows, today_ids = today_result
-                    sections.append((section_name, rows))
-                    exclude_ids = today_ids
-
-            sections.append(self._build_fresh_section(today_batch, exclude_ids))
-
-        status_configs = [
-            (self.settings.include_young, self.cards_query_young, "Young"),
-            (self.settings.include_mature, self.cards_query_mature, "Mature"),
-            (self.settings.include_mastered, self.cards_query_mastered, "Mastered"),
-        ]
-
-        for include, query_filter, section_name in status_configs:
-            if include:
-                sections.append(self._build_status_section(query_filter, section_name))
-
+                today_block = self._build_today_block(day_offset, today_batch)
+                if today_block:
+                    sections.append(("Added Today", [today_block]))
+                    # predicted batches are new cards, so only the real "today" overlaps the first bucket
+                    exclude_today = day_offset == 0
+
+            sections.append(self._build_fresh_section(today_batch, exclude_today, moves))
+
+        for bucket in self.settings.buckets[1:]:
+            if self.settings.includes(bucket):
+                sections.append((bucket.name, [self._bucket_block(bucket.name, moves=moves)]))
+
+        if self._forecast is not None:
+            # a projected block can only be shared with the next day
+            self._projected_blocks = {
+                key: block for key, block in self._projected_blocks.items() if key[1:] == moves.get(key[0])
+            }
         return sections
 
-    def _build_today_section(
-        self, day_offset: int, today_batch: int
-    ) -> Optional[Tuple[str, List[Dict[str, str]], Set[int]]]:
+    def _build_delta_sections(self, changes: List[BucketChange]) -> List[Section]:
+        """The changed cards by how they changed, filtered and ordered like the buckets they are in now."""
+        settings = self.settings
+        intervals = self._snapshot.intervals
+        included = {bucket.name for bucket in settings.buckets if settings.includes(bucket)}
+        if settings.include_first_bucket:
+            included.add(LEARNING)
+
+        card_ids: Dict[str, List[int]] = {title: [] for title in DELTA_SECTIONS}
+        for cid, old_bucket, new_bucket in changes:
+            if new_bucket in included:
+                card_ids[delta_section(intervals, old_bucket, new_bucket)].append(cid)
+
+        listed = [cid for ids in card_ids.values() for cid in ids]
+        # only the listed cards' first reviews are looked up
+        index = FirstReviewIndex.build_for_filter(self.col, f"c.id IN {ids_to_sql(listed)}" if listed else None)
+        return [
+            (title, [RowBlock(self._snapshot, sort_cards_by_first_review(ids, index))])
+            for title, ids in card_ids.items()
+        ]
+
+    def _get_projected_moves(self, day_offset: int) -> Dict[str, Tuple[Tuple[int, ...], frozenset]]:
+        """bucket -> (cards projected to enter it by the day, in export order; cards projected to leave it)."""
+        if self._forecast is None or day_offset == 0:
+            return {}
+        entering: Dict[str, List[int]] = {}
+        leaving: Dict[str, List[int]] = {}
+        for cid, bucket, projected in self._forecast.changes(day_offset):
+            leaving.setdefault(bucket, []).append(cid)
+            if projected is not None:
+                entering.setdefault(projected, []).append(cid)
+        index = self._snapshot.first_review_index
+        return {
+            bucket: (
+                tuple(sort_cards_by_first_review(entering.get(bucket, []), index)),
+                frozenset(leaving.get(bucket, ())),
+            )
+            for bucket in entering.keys() | leaving.keys()
+        }
+
+    def _build_today_block(self, day_offset: int, today_batch: int) -> Optional[RowBlock]:
         if day_offset == 0:
-            today_card_ids = get_cards_first_reviewed_today(self.settings.deck)
-            rows = [extract_row(cid, self.settings.fields) for cid in today_card_ids]
-            if rows:
-                return ("Added Today", rows, set(today_card_ids))
+            block = self._block("today", self._get_today_card_ids)
         elif today_batch >= 0 and today_batch in self._new_cards_by_day:
-            today_card_ids = self._new_cards_by_day[today_batch]
-            rows = [extract_row(cid, self.settings.fields) for cid in today_card_ids]
-            if rows:
-                return ("Added Today", rows, set(today_card_ids))
-        return None
-
-    def _build_fresh_section(self, today_batch: int, exclude_ids: Set[int]) -> Tuple[str, List[Dict[str, str]]]:
-        fresh_rows: List[Dict[str, str]] = []
+            block = self._new_cards_block(today_batch)
+        else:
+            return None
+        return block if block else None
 
-        learning_query = build_query(self.settings.deck, self.cards_query_learning)
-        learning_ids = sort_cards_by_first_review(fetch_cards(learning_query))
-        learning_ids = [cid for cid in learning_ids if cid not in exclude_ids]
-        fresh_rows.extend(extract_row(cid, self.settings.fields) for cid in learning_ids)
+    def _build_fresh_section(self, today_batch: int, exclude_today: bool, moves: Dict) -> Section:
+        # the first bucket's section also lists cards in (re)learning and the predicted new cards
+        first_bucket = self.settings.buckets[0].name
+        blocks = [self._bucket_block(LEARNING, exclude_today)]
 
         for batch in range(today_batch):
             if batch in self._new_cards_by_day:
-                new_card_ids = [cid for cid in self._new_cards_by_day[batch] if cid not in exclude_ids]
-                fresh_rows.extend(extract_row(cid, self.settings.fields) for cid in new_card_ids)
+                blocks.append(self._new_cards_block(batch))
+
+        blocks.append(self._bucket_block(first_bucket, exclude_today, moves))
+
+        return (first_bucket, blocks)
+
+    def _bucket_block(self, bucket: str, exclude_today: bool = False, moves: Optional[Dict] = None) -> RowBlock:
+        if moves and bucket in moves:
+            return self._projected_bucket_block(bucket, *moves[bucket])
+
+        def card_ids() -> List[int]:
+            bucket_ids = self._snapshot.buckets[bucket]
+            if not exclude_today:
+                return bucket_ids
+            today_ids = set(self._get_today_card_ids())
+            return [cid for cid in bucket_ids if cid not in today_ids]
+
+        return self._block((bucket, exclude_today), card_ids)
+
+    def _projected_bucket_block(self, bucket: str, entering: Tuple[int, ...], leaving: frozenset) -> RowBlock:
+        key = (bucket, entering, leaving)
+        block = self._projected_blocks.get(key)
+        if block is None:
+            first_reviews = self._snapshot.first_review_index.first_reviews
+            kept = (cid for cid in self._snapshot.buckets[bucket] if cid not in leaving)
+            card_ids = list(heapq.merge(kept, entering, key=lambda cid: -first_reviews.get(cid, 0)))
+            block = RowBlock(self._snapshot, card_ids, keep_rendered=True)
+            self._projected_blocks[key] = block
+        return block
+
+    def _new_cards_block(self, batch: int) -> RowBlock:
+        return self._block(("new", batch), lambda: self._new_cards_by_day[batch])
+
+    def _block(self, key: Hashable, card_ids: Callable[[], List[int]]) -> RowBlock:
+        block = self._blocks.get(key)
+        if block is None:
+            block = RowBlock(self._snapshot, card_ids(), keep_rendered=self.settings.predictive_days > 0)
+            self._blocks[key] = block
+        return block
+
+    def _get_today_card_ids(self) -> List[int]:
+        if self._today_card_ids is None:
+            self._today_card_ids = get_cards_first_reviewed_today(self.col, self.settings.deck)
+        return self._today_card_ids
+
+
+def get_normalizer(col: Collection, settings: ExportSettings) -> Optional[FieldNormalizer]:
+    if not settings.normalize_fields:
+        return None
+    return FieldNormalizer(col.path, settings.furigana)
+
+
+def get_section_counts(col: Collection, settings: ExportSettings) -> List[Tuple[str, int]]:
+    """(section title, cards) of today's file, from one aggregate query instead of a snapshot."""
+    where = deck_filter(col, settings.deck)
+    intervals = IntervalBuckets(settings.buckets)
+    counts: Dict[Optional[str], int] = {}
+    # card id -> bucket of each note's one card when siblings are merged
+    card_buckets: Optional[Dict[int, Optional[str]]] = None
+    if where is None:
+        pass
+    elif settings.collapse_siblings:
+        # the least mature card of each note, picked like the export's snapshot picks it
+        card_buckets = CardSnapshot(col, settings.deck, [], True, buckets=settings.buckets).fetch_buckets()
+        for bucket in card_buckets.values():
+            counts[bucket] = counts.get(bucket, 0) + 1
+    else:
+        for ivl, queue, card_type, cards in col.db.all(
+            SECTION_COUNTS_QUERY.format(where=f"c.type != {CARD_TYPE_NEW} AND {where}")
+        ):
+            bucket = intervals.classify(ivl, queue, card_type)
+            counts[bucket] = counts.get(bucket, 0) + cards
+    if settings.grouping == "none":
+        return [("All Cards", sum(counts.values()))]
+
+    sections: List[Tuple[str, int]] = []
+    first_bucket = settings.buckets[0].name
+    if settings.include_first_bucket:
+        first_count = counts.get(LEARNING, 0) + counts.get(first_bucket, 0)
+        today_ids = get_cards_first_reviewed_today_for_filter(col, where) if settings.separate_today else []
+        if card_buckets is not None:
+            today_ids = [cid for cid in today_ids if cid in card_buckets]
+            today_buckets = [card_buckets[cid] for cid in today_ids]
+        elif today_ids:
+            rows = col.db.all(SNAPSHOT_QUERY.format(where=f"c.id IN {ids_to_sql(today_ids)}"))
+            today_buckets = [intervals.classify(ivl, queue, card_type) for _, _, ivl, queue, card_type, _, _ in rows]
+        else:
+            today_buckets = []
+        if today_ids:
+            sections.append(("Added Today", len(today_ids)))
+            # like the export, the first bucket's section leaves out today's cards
+            first_count -= sum(1 for bucket in today_buckets if bucket in (LEARNING, first_bucket))
+        sections.append((first_bucket, first_count))
+    for bucket in settings.buckets[1:]:
+        if settings.includes(bucket):
+            sections.append((bucket.name, counts.get(bucket.name, 0)))
+    return sections
 
-        fresh_query = build_query(self.settings.deck, self.cards_query_fresh)
-        fresh_ids = sort_cards_by_first_review(fetch_cards(fresh_query))
-        fresh_ids = [cid for cid in fresh_ids if cid not in exclude_ids]
-        fresh_rows.extend(extract_row(cid, self.settings.fields) for cid in fresh_ids)
 
-        return ("Fresh", fresh_rows)
+def get_interval_forecast(col: Collection, snapshot: CardSnapshot, days: int, success_rate: float) -> BucketForecast:
+    """Projects the snapshot's bucketed review cards; cards in learning or outside every bucket stay where they are."""
+    intervals = snapshot.intervals
+    card_ids = {cid for name in intervals.names for cid in snapshot.buckets[name]}
+    # reading the whole review queue beats a query listing every card id
+    rows = col.db.all(FORECAST_CARDS_QUERY.format(where=f"c.queue = {QUEUE_REVIEW}"))
+    cards = [row for row in rows if row[0] in card_ids]
+    return forecast_buckets(cards, col.today, days, intervals.buckets, success_rate)
 
-    def _build_status_section(self, query_filter: str, section_name: str) -> Tuple[str, List[Dict[str, str]]]:
-        query = build_query(self.settings.deck, query_filter)
-        card_ids = sort_cards_by_first_review(fetch_cards(query))
-        rows = [extract_row(cid, self.settings.fields) for cid in card_ids]
-        return (section_name, rows)
 
+def get_day_start(col: Collection) -> int:
+    return (col.day_cutoff - 86400) * 1000
 
-def get_cards_first_reviewed_today(deck_name: str) -> List[int]:
-    today_start = int(datetime.combine(date.today(), datetime.min.time()).timestamp()) * 1000
-    deck_id = mw.col.decks.id_for_name(deck_name)
 
-    query = """
-        SELECT DISTINCT r.cid 
-        FROM revlog r
-        JOIN cards c ON r.cid = c.id
-        WHERE c.did = ? AND r.id >= ?
-        AND r.id = (SELECT MIN(id) FROM revlog WHERE cid = r.cid)
-    """
-    result = mw.col.db.list(query, deck_id, today_start)
+def get_cards_first_reviewed_today(col: Collection, deck_name: Optional[str]) -> List[int]:
+    return get_cards_first_reviewed_today_for_filter(col, deck_filter(col, deck_name))
 
-    return result
 
+def get_cards_first_reviewed_today_for_filter(col: Collection, where: Optional[str]) -> List[int]:
+    if where is None:
+        return []
+    day_start = get_day_start(col)
+    return col.db.list(FIRST_REVIEWED_TODAY_QUERY.format(where=where), day_start, day_start)
 
-def get_note_type_fields(note_type_name: str = None) -> List[str]:
-    fields = set()
-    for model in mw.col.models.all():
-        if note_type_name is None or model["name"] == note_type_name:
-            for fld in model["flds"]:
-                fields.add(fld["name"])
-    return sorted(fields)
 
+# collection path -> (collection mod time, deck name -> field names); stale once the collection changes
+_deck_fields_cache: Dict[str, Tuple[int, Dict[Optional[str], List[str]]]] = {}
+_deck_fields_lock = threading.Lock()
 
-def build_query(deck: str, extra: str) -> str:
-    return "-is:new " + extra + f' deck:"{deck}"'
 
+def get_fields_for_deck(col: Collection, deck_name: Optional[str]) -> List[str]:
+    col_mod = col.mod
+    with _deck_fields_lock:
+        cache_mod, entries = _deck_fields_cache.get(col.path, (None, {}))
+        if cache_mod == col_mod and deck_name in entries:
+            return entries[deck_name]
 
-def get_new_cards_per_day(deck_name: str) -> int:
-    deck_id = mw.col.decks.id_for_name(deck_name)
-    conf = mw.col.decks.config_dict_for_deck_id(deck_id)
-    return conf.get("new", {}).get("perDay", 5)
+    fields = get_fields_for_note_types(col, get_note_type_ids(col, deck_name))
+    _store_deck_fields(col, col_mod, {deck_name: fields})
+    return fields
 
 
-def get_new_cards_by_day(deck_name: str, days_ahead: int) -> Dict[int, List[int]]:
-    query = f'is:new deck:"{deck_name}"'
-    card_ids = mw.col.find_cards(query)
+def preload_deck_fields(col: Collection) -> None:
+    col_mod = col.mod
+    note_types_by_deck = get_note_type_ids_by_deck(col)
 
-    # Sort cards by their due position (lower = shown first)
-    cards_with_position = []
-    for cid in card_ids:
-        card = mw.col.get_card(cid)
-        cards_with_position.append((cid, card.due))
+    # a deck's search includes its subdecks, so each deck also gets its children's note types
+    note_types_by_name: Dict[Optional[str], Set[int]] = {None: set()}
+    for deck in col.decks():
+        note_types_by_name.setdefault(deck.name, set())
+        note_types = note_types_by_deck.get(deck.id)
+        if not note_types:
+            continue
+        parts = deck.name.split("::")
+        for depth in range(1, len(parts) + 1):
+            note_types_by_name.setdefault("::".join(parts[:depth]), set()).update(note_types)
+        note_types_by_name[None].update(note_types)
 
-    cards_with_position.sort(key=lambda x: x[1])
-    sorted_card_ids = [cid for cid, _ in cards_with_position]
+    _store_deck_fields(
+        col,
+        col_mod,
+        {name: get_fields_for_note_types(col, note_types) for name, note_types in note_types_by_name.items()},
+    )
 
-    new_per_day = get_new_cards_per_day(deck_name)
 
-    result: Dict[int, List[int]] = {}
-    for day in range(days_ahead + 1):
-        start_idx = day * new_per_day
-        end_idx = (day + 1) * new_per_day
-        day_cards = sorted_card_ids[start_idx:end_idx]
-        if day_cards:
-            result[day] = day_cards
-
-    return result
+def _store_deck_fields(col: Collection, col_mod: int, entries: Dict[Optional[str], List[str]]) -> None:
+    with _deck_fields_lock:
+        cache_mod, cached = _deck_fields_cache.get(col.path, (None, {}))
+        if cache_mod != col_mod:
+            cached = {}
+            _deck_fields_cache[col.path] = (col_mod, cached)
+        cached.update(entries)
 
 
-def fetch_cards(query: str) -> List[int]:
-    return mw.col.find_cards(query)
+def get_fields_for_note_types(col: Collection, note_type_ids: Iterable[int]) -> List[str]:
+    fields = set()
+    for mid in note_type_ids:
+        fields.update(col.field_names(mid))
+    return sorted(fields)
 
 
-def sort_cards_by_first_review(card_ids: List[int]) -> List[int]:
-    def get_first_review(cid: int) -> int:
-        result = mw.col.db.scalar("SELECT MIN(id) FROM revlog WHERE cid = ?", cid)
-        return result if result else 0
+def get_new_card_decks(col: Collection, deck_name: Optional[str]) -> List[Tuple[int, int, List[int]]]:
+    if deck_name is None:
+        decks = col.decks()
+    else:
+        deck_id = col.deck_id(deck_name)
+        if deck_id is None:
+            return []
+        decks = [deck for deck in map(col.deck, col.deck_and_child_ids(deck_id)) if deck is not None]
+
+    decks = [deck for deck in decks if not deck.filtered]
+    decks.sort(key=lambda deck: deck.name.split("::"))
+    ids_by_name = {deck.name: deck.id for deck in decks}
+
+    # (deck id, daily limit, ids of the deck and its exported ancestors whose limits also apply), parents first
+    result = []
+    for deck in decks:
+        parts = deck.name.split("::")
+        ancestor_names = ["::".join(parts[:depth]) for depth in range(1, len(parts) + 1)]
+        chain = [ids_by_name[name] for name in ancestor_names if name in ids_by_name]
+        result.append((deck.id, deck.new_limit, chain))
+    return result
 
-    return sorted(card_ids, key=get_first_review, reverse=True)
 
+def get_new_cards_by_day(col: Collection, deck_name: Optional[str], days_ahead: int) -> Dict[int, List[int]]:
+    decks = get_new_card_decks(col, deck_name)
+    limits = {did: limit for did, limit, _ in decks}
 
-def extract_row(card_id: int, requested_fields: List[str]) -> Dict[str, str]:
-    card = mw.col.get_card(card_id)
-    note = card.note()
+    # no deck can show more than the tightest limit on its chain per day, so that bounds each query
+    queues: Dict[int, Deque[int]] = {}
+    for did, _, chain in decks:
+        day_limit = min(limits[ancestor] for ancestor in chain)
+        if day_limit > 0:
+            queues[did] = deque(col.db.list(NEW_CARDS_QUERY, did, day_limit * (days_ahead + 1)))
 
-    field_key_map = {k.lower(): k for k in note.keys()}
+    result: Dict[int, List[int]] = {}
+    for day in range(days_ahead + 1):
+        remaining = dict(limits)
+        day_cards: List[int] = []
+        for did, _, chain in decks:
+            queue = queues.get(did)
+            while queue and all(remaining[ancestor] > 0 for ancestor in chain):
+                day_cards.append(queue.popleft())
+                for ancestor in chain:
+                    remaining[ancestor] -= 1
+        if day_cards:
+            result[day] = day_cards
 
-    row: Dict[str, str] = {}
-    for field in requested_fields:
-        key = field_key_map.get(field.lower())
-        if key is None:
-            row[field] = ""
-        else:
-            value = note[key]
-            row[field] = value if value else ""
-    return row
-
-
-def escape_csv(value: str) -> str:
-    value = value.replace("\n", " ")
-    if any(ch in value for ch in [",", '"', "\n"]):
-        value = '"' + value.replace('"', '""') + '"'
-    return value
-
-
-def write_markdown(path: str, sections: List[Tuple[str, List[Dict[str, str]]]], fieldnames: List[str]) -> None:
-    with open(path, "w", encoding="utf-8") as f:
-        for idx, (title, rows) in enumerate(sections):
-            if idx > 0:
-                f.write("\n\n")
-            f.write(f"## {title}\n\n")
-            if rows:
-                f.write(",".join(fieldnames) + "\n")
-                for row in rows:
-                    values = [escape_csv(str(row.get(name, ""))) for name in fieldnames]
-                    f.write(",".join(values) + "\n")
+    return result
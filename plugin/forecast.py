@@ -0,0 +1,160 @@
+"""Projects review cards' intervals over the predicted days, to list each card in the bucket it will be in that day.
+
+Every card is assumed to be reviewed on its due day and recalled with the configured success rate (less often for
+cards that lapsed before). A review sets the interval to its expected value: interval times ease when recalled, one
+day when forgotten. With NumPy installed all cards and days are projected at once; Anki doesn't ship NumPy, so
+without it the same steps run card by card.
+"""
+
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from typing import List, Optional, Sequence, Tuple
+
+from .models import Bucket
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# the interval a forgotten card comes back with, in days
+LAPSE_IVL = 1
+# ease for cards without one (e.g. scheduled by FSRS), and Anki's lowest
+DEFAULT_EASE = 2.5
+MIN_FACTOR = 1300
+# a card that lapsed n times is recalled with success_rate ** (1 + LAPSE_PENALTY * n)
+LAPSE_PENALTY = 0.25
+
+# card id, interval, due day (the scheduler's day number), ease factor in permille, lapses
+ForecastCard = Tuple[int, int, int, int, int]
+# card id, bucket today, bucket on the day (None: outside every bucket)
+BucketChange = Tuple[int, Optional[str], Optional[str]]
+
+
+class BucketForecast(ABC):
+    """Which cards are projected to be in another bucket than today's on each of the next `days` days."""
+
+    def __init__(self, buckets: Sequence[Bucket], days: int):
+        self.names = [bucket.name for bucket in buckets]
+        self.days = days
+        self.card_count = 0
+        self._min_ivls = [bucket.min_ivl for bucket in buckets]
+        self._max_ivls = [bucket.max_ivl for bucket in buckets]
+
+    @abstractmethod
+    def project(self, cards: List[ForecastCard], today: int, success_rate: float) -> "BucketForecast":
+        pass
+
+    @abstractmethod
+    def changes(self, day: int) -> List[BucketChange]:
+        pass
+
+    def _name(self, index: int) -> Optional[str]:
+        return self.names[index] if index >= 0 else None
+
+    def _classify(self, ivl: int) -> int:
+        position = bisect_right(self._min_ivls, ivl) - 1
+        if position < 0:
+            return -1
+        max_ivl = self._max_ivls[position]
+        return -1 if max_ivl is not None and ivl > max_ivl else position
+
+
+class _ArrayForecast(BucketForecast):
+    def project(self, cards: List[ForecastCard], today: int, success_rate: float) -> "_ArrayForecast":
+        days = self.days
+        if cards:
+            columns = np.array(cards, dtype=np.int64).T
+        else:
+            columns = np.zeros((5, 0), dtype=np.int64)
+        self._card_ids = columns[0]
+        self.card_count = len(self._card_ids)
+        ivl = columns[1].astype(np.float64)
+        review = np.maximum(columns[2] - today, 0)
+        factor = columns[3]
+        ease = np.where(factor >= MIN_FACTOR, factor / 1000, DEFAULT_EASE)
+        success = success_rate ** (1 + LAPSE_PENALTY * columns[4])
+
+        # bucket of every card (columns) on every day (rows); a review on day r shows from day r + 1
+        self._buckets = np.empty((days + 1, self.card_count), dtype=np.int16)
+        self._buckets[:] = self._classify_array(ivl)
+        day = np.arange(days + 1)[:, None]
+        pending = np.flatnonzero(review < days)
+        while len(pending):
+            p = success[pending]
+            new_ivl = np.maximum(np.rint(p * ivl[pending] * ease[pending] + (1 - p) * LAPSE_IVL), 1)
+            ivl[pending] = new_ivl
+            reviewed = review[pending]
+            self._buckets[:, pending] = np.where(
+                day > reviewed, self._classify_array(new_ivl), self._buckets[:, pending]
+            )
+            review[pending] = reviewed + new_ivl.astype(np.int64)
+            pending = pending[review[pending] < days]
+        return self
+
+    def _classify_array(self, ivl: "np.ndarray") -> "np.ndarray":
+        position = np.searchsorted(np.array(self._min_ivls), ivl, side="right") - 1
+        max_ivls = np.array([np.inf if max_ivl is None else max_ivl for max_ivl in self._max_ivls])
+        outside = (position < 0) | (ivl > max_ivls[np.maximum(position, 0)])
+        return np.where(outside, -1, position)
+
+    def changes(self, day: int) -> List[BucketChange]:
+        today, projected = self._buckets[0], self._buckets[day]
+        moved = np.flatnonzero(projected != today)
+        return [
+            (cid, self._name(old), self._name(new))
+            for cid, old, new in zip(
+                self._card_ids[moved].tolist(), today[moved].tolist(), projected[moved].tolist()
+            )
+        ]
+
+
+class _ListForecast(BucketForecast):
+    def project(self, cards: List[ForecastCard], today: int, success_rate: float) -> "_ListForecast":
+        days = self.days
+        # (card id, bucket today, [(first day, bucket)...]) of the cards that change bucket
+        self._moves: List[Tuple[int, int, List[Tuple[int, int]]]] = []
+        self.card_count = len(cards)
+        for cid, ivl, due, factor, lapses in cards:
+            ease = factor / 1000 if factor >= MIN_FACTOR else DEFAULT_EASE
+            p = success_rate ** (1 + LAPSE_PENALTY * lapses)
+            review = max(due - today, 0)
+            ivl = float(ivl)
+            base = current = self._classify(ivl)
+            moves = []
+            while review < days:
+                ivl = max(round(p * ivl * ease + (1 - p) * LAPSE_IVL), 1)
+                bucket = self._classify(ivl)
+                if bucket != current:
+                    moves.append((review + 1, bucket))
+                    current = bucket
+                review += ivl
+            if moves:
+                self._moves.append((cid, base, moves))
+        return self
+
+    def changes(self, day: int) -> List[BucketChange]:
+        result = []
+        for cid, base, moves in self._moves:
+            bucket = base
+            for first_day, moved_to in moves:
+                if first_day > day:
+                    break
+                bucket = moved_to
+            if bucket != base:
+                result.append((cid, self._name(base), self._name(bucket)))
+        return result
+
+
+def forecast_buckets(
+    cards: List[ForecastCard],
+    today: int,
+    days: int,
+    buckets: Sequence[Bucket],
+    success_rate: float,
+    use_numpy: Optional[bool] = None,
+) -> BucketForecast:
+    if use_numpy is None:
+        use_numpy = np is not None
+    forecast_class = _ArrayForecast if use_numpy else _ListForecast
+    return forecast_class(buckets, days).project(cards, today, success_rate)
@@ -0,0 +1,119 @@
+"""Fingerprints of the files exports wrote to a folder, so files whose content didn't change are left untouched."""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Callable, Dict, Optional, TextIO, Tuple
+
+from .writers import WRITE_BUFFER_SIZE, HashingFile, atomic_write
+
+MANIFEST_NAME = ".vocab_export_manifest.json"
+MANIFEST_VERSION = 1
+# rendered files stay in memory up to this size, and beyond it spill to the system's temporary folder
+SPOOL_SIZE = WRITE_BUFFER_SIZE
+
+CREATED = "created"
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+
+
+class ExportManifest:
+    def __init__(self, directory: str, persistent: bool = True):
+        """Only folders the exporter fills itself keep a manifest file; elsewhere files are compared by content."""
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.persistent = persistent
+        # file name -> {"sha256", "size", "mtime_ns"} of the file as this add-on last wrote or checked it
+        self.files: Dict[str, Dict] = self._read() if persistent else {}
+        self._changed = False
+        # day files are written from several threads
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION and isinstance(data.get("files"), dict):
+                return data["files"]
+        except (OSError, ValueError, AttributeError):
+            # a missing or damaged manifest only means every file is compared by content once
+            pass
+        return {}
+
+    def write(self, path: str, write: Callable[[TextIO], None], newline: Optional[str] = None) -> Tuple[str, int]:
+        """Renders write()'s text into a spool, hashing it on the way, and only writes `path` when the content differs.
+
+        Nothing in the folder is created or opened for writing when the file is unchanged. Returns CREATED, UPDATED
+        or UNCHANGED, and the file's size.
+        """
+        name = os.path.relpath(path, self.directory)
+        stat = _stat(path)
+        with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as spool:
+            hashed = HashingFile(spool)
+            f = io.TextIOWrapper(io.BufferedWriter(hashed, WRITE_BUFFER_SIZE), encoding="utf-8", newline=newline)
+            write(f)
+            # detached rather than closed, which would close the spool too
+            f.detach().detach()
+            digest = hashed.sha256.hexdigest()
+            if stat is not None and self._is_unchanged(name, path, stat, digest, hashed.size):
+                return UNCHANGED, hashed.size
+            spool.seek(0)
+            with atomic_write(path, binary=True) as out:
+                shutil.copyfileobj(spool, out, WRITE_BUFFER_SIZE)
+        self._record(name, digest, os.stat(path))
+        return (CREATED if stat is None else UPDATED), hashed.size
+
+    def _is_unchanged(self, name: str, path: str, stat: os.stat_result, digest: str, size: int) -> bool:
+        with self._lock:
+            entry = self.files.get(name)
+        if entry == _entry(digest, stat):
+            return True
+        # edited, copied or written before the manifest existed: the file's own hash decides
+        if stat.st_size == size and _file_sha256(path) == digest:
+            self._record(name, digest, stat)
+            return True
+        return False
+
+    def save(self) -> None:
+        if not self.persistent or not self._changed:
+            return
+        try:
+            with atomic_write(self.path) as f:
+                json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, indent=1, sort_keys=True)
+            self._changed = False
+        except OSError:
+            # without a manifest the next export compares file contents instead
+            pass
+
+    def _record(self, name: str, digest: str, stat: os.stat_result) -> None:
+        entry = _entry(digest, stat)
+        with self._lock:
+            if self.files.get(name) != entry:
+                self.files[name] = entry
+                self._changed = True
+
+
+def _entry(digest: str, stat: os.stat_result) -> Dict:
+    return {"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _stat(path: str) -> Optional[os.stat_result]:
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def _file_sha256(path: str) -> Optional[str]:
+    sha256 = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(WRITE_BUFFER_SIZE), b""):
+                sha256.update(chunk)
+    except OSError:
+        return None
+    return sha256.hexdigest()
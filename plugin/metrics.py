@@ -0,0 +1,157 @@
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, replace
+from typing import ContextManager, Dict, Iterator, List, Optional
+
+from .cache import CACHE_DIR
+from .collection import Collection
+from .models import ExportMetrics, ExportResult, StageMetrics
+
+METRICS_LOG = os.path.join(CACHE_DIR, "export_metrics.jsonl")
+
+
+class CountingDB:
+    """Forwards to the collection's db, counting the queries that go through it."""
+
+    def __init__(self, db):
+        self._db = db
+        self.queries = 0
+
+    def all(self, sql: str, *args) -> List[tuple]:
+        self.queries += 1
+        return self._db.all(sql, *args)
+
+    def list(self, sql: str, *args) -> list:
+        self.queries += 1
+        return self._db.list(sql, *args)
+
+    def scalar(self, sql: str, *args):
+        self.queries += 1
+        return self._db.scalar(sql, *args)
+
+    def __getattr__(self, name: str):
+        return getattr(self._db, name)
+
+
+class CountingCollection:
+    """A collection whose db counts queries; everything else is the wrapped collection's."""
+
+    def __init__(self, col: Collection):
+        self._col = col
+        self.db = CountingDB(col.db)
+
+    def __getattr__(self, name: str):
+        return getattr(self._col, name)
+
+
+class ExportRecorder:
+    enabled = True
+
+    def __init__(self, col: Collection):
+        self.col = CountingCollection(col)
+        self.metrics = ExportMetrics()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def measure(self, name: str = "") -> Iterator[StageMetrics]:
+        metrics = StageMetrics(name)
+        queries = self.col.db.queries
+        start = time.perf_counter()
+        try:
+            yield metrics
+        finally:
+            metrics.seconds += time.perf_counter() - start
+            metrics.queries += self.col.db.queries - queries
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageMetrics]:
+        with self.measure(name) as metrics:
+            yield metrics
+        self.add_stage(metrics)
+
+    def add_stage(self, metrics: StageMetrics) -> None:
+        self.metrics.add_stage(metrics)
+
+    def add_file(self, metrics: StageMetrics) -> None:
+        self.metrics.files.append(metrics)
+
+    def merge(self, metrics: ExportMetrics, folder: str) -> None:
+        for stage in metrics.stages:
+            self.metrics.add_stage(stage)
+        for file in metrics.files:
+            self.metrics.files.append(replace(file, name=f"{folder}/{file.name}"))
+
+    def finish(self) -> ExportMetrics:
+        self.metrics.seconds = time.perf_counter() - self._start
+        self.metrics.queries = self.col.db.queries
+        return self.metrics
+
+
+class NullRecorder:
+    """Stands in for ExportRecorder when metrics are off; every measurement goes to one discarded record."""
+
+    enabled = False
+
+    def __init__(self, col: Collection):
+        self.col = col
+        self._discarded = nullcontext(StageMetrics(""))
+
+    def measure(self, name: str = "") -> ContextManager[StageMetrics]:
+        return self._discarded
+
+    def stage(self, name: str) -> ContextManager[StageMetrics]:
+        return self._discarded
+
+    def add_stage(self, metrics: StageMetrics) -> None:
+        pass
+
+    def add_file(self, metrics: StageMetrics) -> None:
+        pass
+
+    def merge(self, metrics: ExportMetrics, folder: str) -> None:
+        pass
+
+    def finish(self) -> Optional[ExportMetrics]:
+        return None
+
+
+def format_metrics(metrics: ExportMetrics) -> str:
+    lines = [f"{metrics.seconds * 1000:.0f} ms, {metrics.queries} queries"]
+    for stage in metrics.stages + metrics.files:
+        line = f"{stage.name}: {stage.seconds * 1000:.0f} ms"
+        if stage.queries:
+            line += f", {stage.queries} queries"
+        if stage.cards:
+            line += f", {stage.cards} cards"
+        if stage.bytes:
+            line += f", {stage.bytes / 1024:.0f} KB"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def format_load_timings(timings: Dict[str, float]) -> str:
+    parts = [f"{name.replace('_', ' ')} {seconds * 1000:.0f} ms" for name, seconds in timings.items()]
+    return "add-on load: " + ", ".join(parts)
+
+
+def append_metrics_log(path: str, metrics: ExportMetrics, **context) -> None:
+    entry = {"time": int(time.time()), **context, **asdict(metrics)}
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def log_export_metrics(result: ExportResult, trigger: str, **context) -> None:
+    """Adds an export's timings to the add-on's metrics log, with what started it."""
+    if result.metrics is None:
+        return
+    os.makedirs(os.path.dirname(METRICS_LOG), exist_ok=True)
+    append_metrics_log(
+        METRICS_LOG,
+        result.metrics,
+        trigger=trigger,
+        total_cards=result.total_cards,
+        files_written=len(result.files_created) + len(result.files_updated),
+        **context,
+    )
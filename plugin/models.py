@@ -1,5 +1,54 @@
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class Bucket:
+    """Review cards whose interval is between min_ivl and max_ivl days (no upper bound when None)."""
+
+    name: str
+    min_ivl: int
+    max_ivl: Optional[int] = None
+
+    @property
+    def label(self) -> str:
+        days = f"{self.min_ivl}d+" if self.max_ivl is None else f"{self.min_ivl}-{self.max_ivl}d"
+        return f"{self.name} ({days})"
+
+
+DEFAULT_BUCKETS = [Bucket("Fresh", 1, 7), Bucket("Young", 8, 20), Bucket("Mature", 21, 89), Bucket("Mastered", 90)]
+
+
+def parse_buckets(definitions: Optional[List[dict]]) -> List[Bucket]:
+    """Buckets from the config's "buckets" list, sorted by interval; the defaults when it's missing or empty."""
+    if not definitions:
+        return list(DEFAULT_BUCKETS)
+    try:
+        buckets = sorted(
+            (Bucket(str(item["name"]), int(item["min_ivl"]), item.get("max_ivl")) for item in definitions),
+            key=lambda bucket: bucket.min_ivl,
+        )
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Every entry in "buckets" needs a "name" and a "min_ivl" (and optionally "max_ivl").')
+
+    names = set()
+    for bucket, following in zip(buckets, buckets[1:] + [None]):
+        if bucket.name in names or bucket.name.lower() == "learning":
+            raise ValueError(f"Bucket names must be unique and not 'learning': '{bucket.name}'")
+        names.add(bucket.name)
+        if bucket.max_ivl is not None and bucket.max_ivl < bucket.min_ivl:
+            raise ValueError(f"Bucket '{bucket.name}' ends before it starts.")
+        if following is not None and (bucket.max_ivl is None or bucket.max_ivl >= following.min_ivl):
+            raise ValueError(f"Buckets '{bucket.name}' and '{following.name}' overlap.")
+    return buckets
+
+
+def get_included_buckets(config: dict, buckets: List[Bucket]) -> List[str]:
+    included = config.get("included_buckets")
+    if included is None:
+        # configs from before custom buckets have one include_<name> switch per default bucket
+        return [bucket.name for bucket in buckets if config.get(f"include_{bucket.name.lower()}", True)]
+    return list(included)
 
 
 @dataclass
@@ -7,19 +56,132 @@ class ExportSettings:
     deck: Optional[str] = None
     fields: List[str] = field(default_factory=list)
     grouping: str = "status"
-    include_fresh: bool = True
-    include_young: bool = True
-    include_mature: bool = True
-    include_mastered: bool = True
+    format: str = "markdown"
+    # sections by interval, shortest first; learning cards and predicted new cards join the first one
+    buckets: List[Bucket] = field(default_factory=lambda: list(DEFAULT_BUCKETS))
+    # names of the buckets to export; None exports all of them
+    included_buckets: Optional[List[str]] = None
     separate_today: bool = True
     predictive_days: int = 0
+    # predicted files also move review cards to the bucket their projected interval reaches by that day
+    forecast_intervals: bool = False
+    # share of reviews assumed to be recalled when projecting intervals
+    forecast_success_rate: float = 0.9
+    # write only the cards that were newly learned, promoted or lapsed since the last export to that folder
+    delta_export: bool = False
+    collapse_siblings: bool = False
+    normalize_fields: bool = False
+    furigana: str = "brackets"
+    keep_first_review_index: bool = False
+    # keep a copy of the collection in user_files and re-read only what changed since the last export
+    use_cache: bool = False
+    collect_metrics: bool = False
+    # batch mode: one export per deck (each with its subdecks) from a single scan of the collection
+    batch_decks: List[str] = field(default_factory=list)
+    batch_all_decks: bool = False
+    batch_workers: int = 1
+    # threads rendering and writing day files; 0 uses one per core
+    file_workers: int = 0
+
+    @property
+    def is_batch(self) -> bool:
+        return bool(self.batch_decks) or self.batch_all_decks
+
+    def includes(self, bucket: Bucket) -> bool:
+        return self.included_buckets is None or bucket.name in self.included_buckets
+
+    @property
+    def include_first_bucket(self) -> bool:
+        return bool(self.buckets) and self.includes(self.buckets[0])
+
+    @classmethod
+    def from_config(cls, config: dict, deck: Optional[str] = None) -> "ExportSettings":
+        fields = config.get("fields", [])
+        if isinstance(fields, str):
+            fields = [f.strip() for f in fields.split(",") if f.strip()]
+        grouping = config.get("grouping", "status")
+        batch = config.get("batch", False) and deck is None
+        buckets = parse_buckets(config.get("buckets"))
+        success_rate = config.get("forecast_success_rate", 0.9)
+        if not isinstance(success_rate, (int, float)) or not 0 < success_rate <= 1:
+            raise ValueError('"forecast_success_rate" must be a number above 0 and at most 1, e.g. 0.9.')
+
+        return cls(
+            deck=deck,
+            fields=fields,
+            grouping=grouping,
+            format=config.get("format", "markdown"),
+            buckets=buckets,
+            included_buckets=get_included_buckets(config, buckets),
+            separate_today=config.get("separate_today", True),
+            predictive_days=config.get("predictive_days", 0) if grouping == "status" else 0,
+            forecast_intervals=config.get("forecast_intervals", False),
+            forecast_success_rate=success_rate,
+            delta_export=config.get("delta_export", False) and grouping == "status",
+            collapse_siblings=config.get("collapse_siblings", False),
+            normalize_fields=config.get("normalize_fields", False),
+            furigana=config.get("furigana", "brackets"),
+            keep_first_review_index=config.get("keep_first_review_index", False),
+            use_cache=config.get("export_cache", False),
+            collect_metrics=config.get("show_metrics", False) or config.get("log_metrics", False),
+            batch_decks=list(config.get("batch_decks", [])) if batch else [],
+            batch_all_decks=batch and config.get("batch_all_decks", False),
+            batch_workers=config.get("batch_workers", 1),
+            file_workers=config.get("file_workers", 0),
+        )
+
+
+@dataclass
+class StageMetrics:
+    name: str
+    seconds: float = 0.0
+    queries: int = 0
+    cards: int = 0
+    bytes: int = 0
+
+
+@dataclass
+class ExportMetrics:
+    seconds: float = 0.0
+    queries: int = 0
+    # one entry per stage, summed over day files; then one entry per written file
+    stages: List[StageMetrics] = field(default_factory=list)
+    files: List[StageMetrics] = field(default_factory=list)
+
+    def add_stage(self, metrics: StageMetrics) -> None:
+        for stage in self.stages:
+            if stage.name == metrics.name:
+                stage.seconds += metrics.seconds
+                stage.queries += metrics.queries
+                stage.cards += metrics.cards
+                stage.bytes += metrics.bytes
+                return
+        self.stages.append(metrics)
+
+
+@dataclass
+class ExportPreview:
+    # (section title, cards) of today's file, in file order
+    sections: List[Tuple[str, int]] = field(default_factory=list)
+    # new cards added by each predicted day file
+    predicted_new_cards: List[int] = field(default_factory=list)
+    # the file's first rows as the writer renders them; empty when only counts were computed
+    text: str = ""
 
 
 @dataclass
 class ExportResult:
     success: bool
     total_cards: int = 0
+    # every file the export produced, in order, and the same files split by what happened to them on disk
+    files: List[str] = field(default_factory=list)
     files_created: List[str] = field(default_factory=list)
+    files_updated: List[str] = field(default_factory=list)
+    files_unchanged: List[str] = field(default_factory=list)
+    # files that couldn't be written; error_message says why
+    files_failed: List[str] = field(default_factory=list)
     export_directory: str = ""
     output_path: str = ""
     error_message: str = ""
+    cancelled: bool = False
+    metrics: Optional[ExportMetrics] = None
@@ -0,0 +1,91 @@
+import html
+import re
+import threading
+from typing import Dict, List, Tuple
+
+# notes are cleaned in chunks joined by this; none of the patterns below match across it, and
+# html.unescape() drops character references to control characters rather than producing it
+NOTE_SEPARATOR = "\x1e"
+FIELD_SEPARATOR = "\x1f"
+CHUNK_NOTES = 500
+
+FURIGANA_BRACKETS = "brackets"
+FURIGANA_KANJI = "kanji"
+FURIGANA_READING = "reading"
+FURIGANA_MODES = [FURIGANA_BRACKETS, FURIGANA_KANJI, FURIGANA_READING]
+
+_TEXT = r"[^\x1e\x1f]"
+_HIDDEN = re.compile(rf"<(style|script)\b{_TEXT}*?</\1\s*>", re.IGNORECASE)
+_SOUND = re.compile(r"\[sound:[^\]\x1e\x1f]*\]")
+_CLOZE = re.compile(rf"\{{\{{c\d+::({_TEXT}*?)(?:::{_TEXT}*?)?\}}\}}")
+_RUBY = re.compile(
+    rf"<ruby>(?:<rb>)?({_TEXT}*?)(?:</rb>)?(?:<rp>{_TEXT}*?</rp>)?<rt>({_TEXT}*?)</rt>(?:<rp>{_TEXT}*?</rp>)?</ruby>",
+    re.IGNORECASE,
+)
+_BREAK = re.compile(r"<br\s*/?>|</(?:div|p|li)\s*>", re.IGNORECASE)
+_TAG = re.compile(r"<[^<>\x1e\x1f]*>")
+# Anki's furigana syntax: "漢字[かんじ]", with an optional space marking where the base text starts. The base is
+# matched whole from the start of its run, so a run without a reading isn't rescanned from every character; the
+# lookahead and backreference stand in for a possessive quantifier, which needs Python 3.11.
+_FURIGANA = re.compile(r" ?(?<![^ >\[\]\x1e\x1f])(?=([^ >\[\]\x1e\x1f]+))\1\[([^\]\x1e\x1f]+)\]")
+_FURIGANA_REPLACEMENTS = {FURIGANA_KANJI: r"\1", FURIGANA_READING: r"\2"}
+_SPACES = re.compile(r"[ \t\r\xa0]+")
+_LINE_BREAKS = re.compile(r" *\n[ \n]*")
+
+# (collection path, furigana mode) -> note id -> (note mod, cleaned flds); a note is cleaned again once it changes
+_normalized_cache: Dict[Tuple[str, str], Dict[int, Tuple[int, str]]] = {}
+_normalized_cache_lock = threading.Lock()
+
+
+def normalize_text(text: str, furigana: str = FURIGANA_BRACKETS) -> str:
+    text = _HIDDEN.sub("", text)
+    text = _SOUND.sub("", text)
+    text = _CLOZE.sub(r"\1", text)
+    text = _RUBY.sub(r"\1[\2]", text)
+    text = _BREAK.sub("\n", text)
+    text = _TAG.sub("", text)
+    if furigana != FURIGANA_BRACKETS and "[" in text:
+        text = _FURIGANA.sub(_FURIGANA_REPLACEMENTS[furigana], text)
+    if "&" in text:
+        text = html.unescape(text)
+    text = _LINE_BREAKS.sub("\n", _SPACES.sub(" ", text))
+    # trimming each field with str methods is far cheaper than a regex anchored on the separators
+    return NOTE_SEPARATOR.join(
+        FIELD_SEPARATOR.join(field.strip(" \n") for field in note.split(FIELD_SEPARATOR))
+        for note in text.split(NOTE_SEPARATOR)
+    )
+
+
+class FieldNormalizer:
+    """Strips HTML, decodes entities and rewrites furigana in whole notes' field strings."""
+
+    def __init__(self, collection_path: str, furigana: str = FURIGANA_BRACKETS):
+        if furigana not in FURIGANA_MODES:
+            raise ValueError(f"Unknown furigana mode '{furigana}', expected one of {', '.join(FURIGANA_MODES)}")
+        self.furigana = furigana
+        with _normalized_cache_lock:
+            self._cache = _normalized_cache.setdefault((collection_path, furigana), {})
+
+    def normalize_notes(self, notes: List[Tuple[int, int, str]]) -> List[str]:
+        """Cleaned flds for each (note id, note mod, flds), reusing notes cleaned before at the same mod."""
+        result: List[str] = []
+        missing: List[int] = []
+        cache = self._cache
+        for nid, mod, flds in notes:
+            cached = cache.get(nid)
+            if cached is not None and cached[0] == mod:
+                result.append(cached[1])
+            else:
+                missing.append(len(result))
+                result.append(flds)
+
+        for start in range(0, len(missing), CHUNK_NOTES):
+            positions = missing[start : start + CHUNK_NOTES]
+            joined = NOTE_SEPARATOR.join(result[position] for position in positions)
+            cleaned = normalize_text(joined, self.furigana).split(NOTE_SEPARATOR)
+            with _normalized_cache_lock:
+                for position, flds in zip(positions, cleaned):
+                    nid, mod, _ = notes[position]
+                    cache[nid] = (mod, flds)
+                    result[position] = flds
+        return result
@@ -0,0 +1,128 @@
+CARD_TYPE_NEW = 0
+CARD_TYPE_REVIEW = 2
+CARD_TYPE_RELEARNING = 3
+QUEUE_SUSPENDED = -1
+QUEUE_LEARNING = 1
+QUEUE_REVIEW = 2
+QUEUE_DAY_LEARNING = 3
+
+FIELD_SEPARATOR = "\x1f"
+
+SNAPSHOT_QUERY = """
+    SELECT c.id, c.nid, c.ivl, c.queue, c.type, c.did, c.odid
+    FROM cards c
+    WHERE {where}
+    ORDER BY c.id
+"""
+
+# the export dialog's section counts, classified by interval in Python
+SECTION_COUNTS_QUERY = """
+    SELECT c.ivl, c.queue, c.type, COUNT(*)
+    FROM cards c
+    WHERE {where}
+    GROUP BY c.ivl, c.queue, c.type
+"""
+
+# cards in filtered decks keep their own due day in odue
+FORECAST_CARDS_QUERY = """
+    SELECT c.id, c.ivl, CASE WHEN c.odid != 0 THEN c.odue ELSE c.due END, c.factor, c.lapses
+    FROM cards c
+    WHERE {where}
+"""
+
+NOTES_QUERY = """
+    SELECT n.id, n.mid, n.mod, n.flds
+    FROM notes n
+    WHERE n.id IN (SELECT c.nid FROM cards c WHERE {where})
+"""
+
+NOTE_TYPES_QUERY = """
+    SELECT DISTINCT n.mid
+    FROM cards c
+    JOIN notes n ON n.id = c.nid
+    WHERE {where}
+"""
+
+NOTE_TYPES_BY_DECK_QUERY = """
+    SELECT DISTINCT CASE WHEN c.odid != 0 THEN c.odid ELSE c.did END, n.mid
+    FROM cards c
+    JOIN notes n ON n.id = c.nid
+"""
+
+DECKS_WITH_CARDS_QUERY = """
+    SELECT DISTINCT CASE WHEN c.odid != 0 THEN c.odid ELSE c.did END
+    FROM cards c
+"""
+
+FIRST_REVIEW_QUERY = """
+    SELECT r.cid, MIN(r.id)
+    FROM revlog r
+    WHERE r.cid IN (SELECT c.id FROM cards c WHERE {where})
+    GROUP BY r.cid
+"""
+
+# Only revlog rows since the day start are read (revlog.id is the rowid; "+cid" keeps SQLite from
+# walking ix_revlog_cid for the GROUP BY instead), and each candidate's first review is one index
+# seek, so the cost follows today's reviews rather than the size of the review history. The GROUP BY already keeps
+# SQLite from flattening the CTE into the join; "AS MATERIALIZED" would need SQLite 3.35 or newer.
+FIRST_REVIEWED_TODAY_QUERY = """
+    WITH reviewed_today AS (
+        SELECT cid FROM revlog WHERE id >= ? GROUP BY +cid
+    )
+    SELECT t.cid
+    FROM reviewed_today t
+    CROSS JOIN cards c ON c.id = t.cid
+    WHERE {where} AND (SELECT MIN(r.id) FROM revlog r WHERE r.cid = t.cid) >= ?
+"""
+
+CACHE_CARDS_QUERY = """
+    SELECT c.id, c.nid, c.ivl, c.queue, c.type, c.did, c.odid, c.mod, c.usn
+    FROM cards c
+    WHERE {where}
+    ORDER BY c.id
+"""
+
+CACHE_NOTES_QUERY = """
+    SELECT n.id, n.mid, n.mod, n.usn, n.flds
+    FROM notes n
+    WHERE {where}
+"""
+
+CACHE_FIRST_REVIEWS_QUERY = """
+    SELECT cid, MIN(id)
+    FROM revlog
+    GROUP BY cid
+"""
+
+# reviews after the cache's newest id, plus older ones a sync brought in or re-stamped since, counted apart
+# (each half uses an index; "+id" keeps SQLite on ix_revlog_usn instead of walking every older rowid)
+CACHE_FIRST_REVIEWS_SINCE_QUERY = """
+    SELECT cid, MIN(id), SUM(newer), COUNT(*) - SUM(newer), MAX(id), MAX(usn)
+    FROM (
+        SELECT cid, id, usn, 1 AS newer FROM revlog WHERE id > ?
+        UNION ALL
+        SELECT cid, id, usn, 0 AS newer FROM revlog WHERE usn > ? AND +id <= ?
+    )
+    GROUP BY cid
+"""
+
+# cards with reviews after a delta record's newest review id, or older reviews a sync brought in since
+# ("+id" keeps SQLite on ix_revlog_usn instead of walking every older rowid)
+DELTA_CARDS_QUERY = """
+    SELECT c.id, c.nid, c.ivl, c.queue, c.type, c.did, c.odid
+    FROM cards c
+    WHERE c.id IN (
+        SELECT cid FROM revlog WHERE id > ?
+        UNION
+        SELECT cid FROM revlog WHERE usn > ? AND +id <= ?
+    ) AND {where}
+    ORDER BY c.id
+"""
+
+NEW_CARDS_QUERY = f"""
+    SELECT c.id
+    FROM cards c
+    WHERE c.did = ? AND c.type = {CARD_TYPE_NEW} AND c.queue != {QUEUE_SUSPENDED}
+    ORDER BY c.due, c.ord
+    LIMIT ?
+"""
@@ -0,0 +1,392 @@
+import threading
+from bisect import bisect_right
+from typing import Collection as Container, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from .cache import ExportCache
+from .collection import Collection
+from .models import DEFAULT_BUCKETS, Bucket
+from .normalize import FieldNormalizer
+from .queries import (
+    CARD_TYPE_NEW,
+    CARD_TYPE_RELEARNING,
+    CARD_TYPE_REVIEW,
+    FIELD_SEPARATOR,
+    FIRST_REVIEW_QUERY,
+    NOTE_TYPES_BY_DECK_QUERY,
+    NOTE_TYPES_QUERY,
+    NOTES_QUERY,
+    QUEUE_DAY_LEARNING,
+    QUEUE_LEARNING,
+    SNAPSHOT_QUERY,
+)
+
+# cards in (re)learning, kept apart from the interval buckets, whose names never clash with it
+LEARNING = "learning"
+
+# one note's values for the exported fields, in the order of CardSnapshot.fields; shared by the note's cards
+Row = Tuple[str, ...]
+
+# (collection path, deck name) -> index, reused across exports while the revlog is unchanged
+_first_review_index_cache: Dict[Tuple[str, Optional[str]], "FirstReviewIndex"] = {}
+
+
+class IntervalBuckets:
+    """Classifies cards into the configured buckets with a binary search over their sorted lower bounds."""
+
+    def __init__(self, buckets: Sequence[Bucket]):
+        self.buckets = list(buckets)
+        self.names = [bucket.name for bucket in buckets]
+        # LEARNING first: collapsed siblings keep the card in the earliest bucket
+        self.order = [LEARNING] + self.names
+        self.rank = {name: position for position, name in enumerate(self.order)}
+        self._min_ivls = [bucket.min_ivl for bucket in buckets]
+        self._max_ivls = [bucket.max_ivl for bucket in buckets]
+
+    def classify(self, ivl: int, queue: int, card_type: int) -> Optional[str]:
+        if queue in (QUEUE_LEARNING, QUEUE_DAY_LEARNING):
+            return LEARNING
+        if card_type not in (CARD_TYPE_REVIEW, CARD_TYPE_RELEARNING):
+            return None
+        position = bisect_right(self._min_ivls, ivl) - 1
+        if position < 0:
+            return None
+        max_ivl = self._max_ivls[position]
+        if max_ivl is not None and ivl > max_ivl:
+            return None
+        return self.names[position]
+
+
+def deck_filter(col: Collection, deck_name: Optional[str]) -> Optional[str]:
+    if deck_name is None:
+        return "1"
+    deck_ids = get_deck_tree_ids(col, deck_name)
+    if deck_ids is None:
+        return None
+    return deck_ids_filter(deck_ids)
+
+
+def get_deck_tree_ids(col: Collection, deck_name: str) -> Optional[List[int]]:
+    deck_id = col.deck_id(deck_name)
+    if deck_id is None:
+        return None
+    return col.deck_and_child_ids(deck_id)
+
+
+def deck_ids_filter(deck_ids: Iterable[int]) -> str:
+    ids = ids_to_sql(deck_ids)
+    return f"(c.did IN {ids} OR (c.odid != 0 AND c.odid IN {ids}))"
+
+
+def get_note_type_ids(col: Collection, deck_name: Optional[str]) -> List[int]:
+    where = deck_filter(col, deck_name)
+    if where is None:
+        return []
+    return col.db.list(NOTE_TYPES_QUERY.format(where=where))
+
+
+def get_note_type_ids_by_deck(col: Collection) -> Dict[int, Set[int]]:
+    note_types: Dict[int, Set[int]] = {}
+    for did, mid in col.db.all(NOTE_TYPES_BY_DECK_QUERY):
+        note_types.setdefault(did, set()).add(mid)
+    return note_types
+
+
+def ids_to_sql(ids: Iterable[int]) -> str:
+    return "(" + ",".join(str(int(i)) for i in ids) + ")"
+
+
+def sort_cards_by_first_review(card_ids: List[int], index: "FirstReviewIndex") -> List[int]:
+    first_reviews = index.first_reviews
+    return sorted(card_ids, key=lambda cid: first_reviews.get(cid, 0), reverse=True)
+
+
+def get_revlog_max_id(col: Collection) -> int:
+    return col.db.scalar("SELECT MAX(id) FROM revlog") or 0
+
+
+def get_first_review_index(col: Collection, deck_name: Optional[str], keep: bool = False) -> "FirstReviewIndex":
+    cache_key = (col.path, deck_name)
+    if not keep:
+        _first_review_index_cache.pop(cache_key, None)
+        return FirstReviewIndex.build(col, deck_name)
+
+    revlog_max_id = get_revlog_max_id(col)
+    index = _first_review_index_cache.get(cache_key)
+    if index is None or index.revlog_max_id != revlog_max_id:
+        index = FirstReviewIndex.build(col, deck_name, revlog_max_id)
+        _first_review_index_cache[cache_key] = index
+    return index
+
+
+class FirstReviewIndex:
+    def __init__(self, first_reviews: Dict[int, int], revlog_max_id: int = 0):
+        self.first_reviews = first_reviews
+        self.revlog_max_id = revlog_max_id
+
+    @classmethod
+    def build(cls, col: Collection, deck_name: Optional[str], revlog_max_id: int = 0) -> "FirstReviewIndex":
+        return cls.build_for_filter(col, deck_filter(col, deck_name), revlog_max_id)
+
+    @classmethod
+    def build_for_filter(cls, col: Collection, where: Optional[str], revlog_max_id: int = 0) -> "FirstReviewIndex":
+        if where is None:
+            return cls({}, revlog_max_id)
+        return cls(dict(col.db.all(FIRST_REVIEW_QUERY.format(where=where))), revlog_max_id)
+
+    def get(self, card_id: int) -> int:
+        return self.first_reviews.get(card_id, 0)
+
+
+class CardSnapshot:
+    def __init__(
+        self,
+        col: Collection,
+        deck_name: Optional[str],
+        fields: List[str],
+        collapse_siblings: bool = False,
+        deck_ids: Optional[Iterable[int]] = None,
+        normalizer: Optional[FieldNormalizer] = None,
+        buckets: Optional[Sequence[Bucket]] = None,
+        cache: Optional[ExportCache] = None,
+    ):
+        self.col = col
+        self.deck_name = deck_name
+        self.fields = fields
+        self.collapse_siblings = collapse_siblings
+        self.normalizer = normalizer
+        self.intervals = IntervalBuckets(DEFAULT_BUCKETS if buckets is None else buckets)
+        self.buckets: Dict[str, List[int]] = {bucket: [] for bucket in self.intervals.order}
+        self.card_ids: List[int] = []
+        self.first_review_index = FirstReviewIndex({})
+        # given deck ids replace deck_name's tree and make the snapshot remember each card's decks for subset()
+        self._where = deck_ids_filter(deck_ids) if deck_ids is not None else deck_filter(col, deck_name)
+        self._card_decks: Optional[Dict[int, Tuple[int, int]]] = {} if deck_ids is not None else None
+        # with a cache, cards come from its refreshed copy of the collection instead of a query
+        self.cache = cache
+        self._deck_ids: Optional[Set[int]] = None
+        if deck_ids is not None:
+            self._deck_ids = set(deck_ids)
+        elif cache is not None and deck_name is not None:
+            self._deck_ids = set(get_deck_tree_ids(col, deck_name) or ())
+        self._card_notes: Dict[int, int] = {}
+        # nid -> (mid, flds) until the note's row is first needed, then nid -> row
+        self._notes: Dict[int, Tuple[int, str]] = {}
+        self._note_rows: Dict[int, Row] = {}
+        # nid -> the one card that represents the note when siblings are collapsed
+        self._note_cards: Dict[int, int] = {}
+        self._field_indexes: Dict[int, List[Optional[int]]] = {}
+        # guards the caches above, which subsets share and may fill from several threads
+        self._lock = threading.Lock()
+
+    def load(self, first_review_index: "FirstReviewIndex") -> "CardSnapshot":
+        return self.fetch().sort(first_review_index)
+
+    def fetch(self) -> "CardSnapshot":
+        if self._where is None:
+            return self
+
+        card_buckets = self._read_card_buckets()
+        if self.cache is not None:
+            self._store_notes(self.cache.note_rows(dict.fromkeys(self._card_notes.values())))
+        else:
+            self._store_notes(self.col.db.all(NOTES_QUERY.format(where=f"c.type != {CARD_TYPE_NEW} AND {self._where}")))
+        self._assign(card_buckets)
+        return self
+
+    def fetch_buckets(self) -> Dict[int, Optional[str]]:
+        """card id -> bucket of the cards fetch() would list, in card id order, without reading their notes."""
+        if self._where is None:
+            return {}
+        card_buckets = self._read_card_buckets()
+        return self._collapse_siblings(card_buckets) if self.collapse_siblings else card_buckets
+
+    def _read_card_buckets(self) -> Dict[int, Optional[str]]:
+        if self.cache is not None:
+            rows = self.cache.card_rows(self._deck_ids)
+        else:
+            rows = self.col.db.all(SNAPSHOT_QUERY.format(where=f"c.type != {CARD_TYPE_NEW} AND {self._where}"))
+
+        card_buckets: Dict[int, Optional[str]] = {}
+        classify = self.intervals.classify
+        for cid, nid, ivl, queue, card_type, did, odid in rows:
+            self._card_notes[cid] = nid
+            card_buckets[cid] = classify(ivl, queue, card_type)
+            if self._card_decks is not None:
+                self._card_decks[cid] = (did, odid)
+        return card_buckets
+
+    def sort(self, first_review_index: "FirstReviewIndex") -> "CardSnapshot":
+        self.first_review_index = first_review_index
+        self.card_ids = sort_cards_by_first_review(self.card_ids, first_review_index)
+        for bucket, card_ids in self.buckets.items():
+            self.buckets[bucket] = sort_cards_by_first_review(card_ids, first_review_index)
+        return self
+
+    def split(self, deck_groups: List[Container[int]], collapse_siblings: bool = False) -> List["CardSnapshot"]:
+        """One snapshot per group of deck ids, made in a single pass; they share this one's notes and rows."""
+        if self._card_decks is None:
+            raise ValueError("split() needs a snapshot created with deck_ids")
+        owners: Dict[int, List[int]] = {}
+        for position, deck_ids in enumerate(deck_groups):
+            for did in deck_ids:
+                owners.setdefault(did, []).append(position)
+
+        card_positions: Dict[int, Iterable[int]] = {}
+        for cid in self.card_ids:
+            did, odid = self._card_decks[cid]
+            positions = owners.get(did, ())
+            if odid != 0 and odid in owners:
+                positions = sorted({*positions, *owners[odid]})
+            card_positions[cid] = positions
+
+        views = [self._view(collapse_siblings) for _ in deck_groups]
+        # the lists here are already sorted, and appending in order keeps them that way
+        for cid in self.card_ids:
+            for position in card_positions[cid]:
+                views[position].card_ids.append(cid)
+        for bucket, card_ids in self.buckets.items():
+            for cid in card_ids:
+                for position in card_positions[cid]:
+                    views[position].buckets[bucket].append(cid)
+
+        if collapse_siblings:
+            for view in views:
+                view._collapse_sorted()
+        return views
+
+    def _view(self, collapse_siblings: bool) -> "CardSnapshot":
+        view = CardSnapshot(self.col, None, self.fields, collapse_siblings, normalizer=self.normalizer)
+        view.intervals = self.intervals
+        view.buckets = {bucket: [] for bucket in self.intervals.order}
+        view._where = None
+        view._card_decks = self._card_decks
+        view.cache = self.cache
+        view._card_notes = self._card_notes
+        view._notes = self._notes
+        view._note_rows = self._note_rows
+        view._field_indexes = self._field_indexes
+        view._lock = self._lock
+        view.first_review_index = self.first_review_index
+        return view
+
+    def _collapse_sorted(self) -> None:
+        # pick representatives in card id order, like fetch(), then keep the sorted order
+        card_bucket = {cid: bucket for bucket, card_ids in self.buckets.items() for cid in card_ids}
+        kept = self._collapse_siblings({cid: card_bucket.get(cid) for cid in sorted(self.card_ids)})
+        self.card_ids = [cid for cid in self.card_ids if cid in kept]
+        for bucket, card_ids in self.buckets.items():
+            self.buckets[bucket] = [cid for cid in card_ids if cid in kept]
+
+    def in_decks(self, card_ids: Iterable[int], deck_ids: Container[int]) -> List[int]:
+        card_ids = list(card_ids)
+        self._load_missing(card_ids)
+        result = []
+        for cid in card_ids:
+            did, odid = self._card_decks.get(cid, (0, 0))
+            if did in deck_ids or (odid != 0 and odid in deck_ids):
+                result.append(cid)
+        return result
+
+    def preload(self, card_ids: Iterable[int]) -> None:
+        """Reads the cards that aren't in the snapshot yet, e.g. predicted new cards, and their notes."""
+        self._load_missing(list(card_ids))
+
+    def load_cards(self, card_ids: Iterable[int]) -> List[int]:
+        card_ids = list(card_ids)
+        self._load_missing(card_ids)
+        loaded = [cid for cid in card_ids if cid in self._card_notes]
+        if not self.collapse_siblings:
+            return loaded
+
+        representatives = []
+        for cid in loaded:
+            if self._note_cards.setdefault(self._card_notes[cid], cid) == cid:
+                representatives.append(cid)
+        return representatives
+
+    def row(self, card_id: int) -> Row:
+        nid = self._card_notes[card_id]
+        row = self._note_rows.get(nid)
+        if row is None:
+            with self._lock:
+                row = self._note_rows.get(nid)
+                if row is None:
+                    row = self._build_row(nid)
+        return row
+
+    def _build_row(self, nid: int) -> Row:
+        mid, flds = self._notes.pop(nid)
+        values = flds.split(FIELD_SEPARATOR)
+        count = len(values)
+        row = tuple(values[index] if index is not None and index < count else "" for index in self._field_index(mid))
+        self._note_rows[nid] = row
+        return row
+
+    def _assign(self, card_buckets: Dict[int, Optional[str]]) -> None:
+        if self.collapse_siblings:
+            card_buckets = self._collapse_siblings(card_buckets)
+
+        for cid, bucket in card_buckets.items():
+            self.card_ids.append(cid)
+            if bucket is not None:
+                self.buckets[bucket].append(cid)
+
+    def _collapse_siblings(self, card_buckets: Dict[int, Optional[str]]) -> Dict[int, Optional[str]]:
+        # keep the least mature card of each note so a word is listed where it is weakest
+        ranks = self.intervals.rank
+        unclassified = len(ranks)
+
+        def rank(cid: int) -> int:
+            return ranks.get(card_buckets[cid], unclassified)
+
+        for cid in card_buckets:
+            nid = self._card_notes[cid]
+            current = self._note_cards.get(nid)
+            if current is None or rank(cid) < rank(current):
+                self._note_cards[nid] = cid
+        return {cid: card_buckets[cid] for cid in self._note_cards.values()}
+
+    def _load_missing(self, card_ids: List[int]) -> None:
+        missing = [cid for cid in card_ids if cid not in self._card_notes]
+        if not missing:
+            return
+        with self._lock:
+            if self.cache is not None:
+                rows = self.cache.cards_by_id(missing)
+                self._store_missing_cards(rows)
+                self._store_notes(self.cache.note_rows({row[1] for row in rows}))
+                # cards added since the cache's last refresh are read from the collection
+                missing = [cid for cid in missing if cid not in self._card_notes]
+                if not missing:
+                    return
+
+            where = f"c.id IN {ids_to_sql(missing)}"
+            self._store_missing_cards(self.col.db.all(SNAPSHOT_QUERY.format(where=where)))
+            self._store_notes(self.col.db.all(NOTES_QUERY.format(where=where)))
+
+    def _store_missing_cards(self, rows: List[tuple]) -> None:
+        for cid, nid, _ivl, _queue, _type, did, odid in rows:
+            self._card_notes[cid] = nid
+            if self._card_decks is not None:
+                self._card_decks[cid] = (did, odid)
+
+    def _store_notes(self, rows: Iterable[tuple]) -> None:
+        notes = [(nid, mid, mod, flds) for nid, mid, mod, flds in rows if nid not in self._note_rows]
+        # rows may be built on the threads writing day files, which mustn't ask the collection for field names
+        for mid in {mid for _nid, mid, _mod, _flds in notes}:
+            self._field_index(mid)
+        if self.normalizer is None:
+            for nid, mid, _mod, flds in notes:
+                self._notes[nid] = (mid, flds)
+            return
+
+        cleaned = self.normalizer.normalize_notes([(nid, mod, flds) for nid, _mid, mod, flds in notes])
+        for (nid, mid, _mod, _flds), flds in zip(notes, cleaned):
+            self._notes[nid] = (mid, flds)
+
+    def _field_index(self, mid: int) -> List[Optional[int]]:
+        index = self._field_indexes.get(mid)
+        if index is None:
+            ords = {name.lower(): ord for ord, name in enumerate(self.col.field_names(mid))}
+            index = [ords.get(field.lower()) for field in self.fields]
+            self._field_indexes[mid] = index
+        return index
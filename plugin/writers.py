@@ -0,0 +1,178 @@
+import csv
+import hashlib
+import io
+import json
+import os
+from contextlib import contextmanager
+from itertools import islice
+from typing import IO, TYPE_CHECKING, BinaryIO, Hashable, Iterable, Iterator, List, Optional, TextIO
+
+if TYPE_CHECKING:
+    from .exporter import Section
+    from .snapshot import Row
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+CSV_CHUNK_ROWS = 1000
+
+
+class HashingFile(io.RawIOBase):
+    """Passes the bytes written to it on to `f`, keeping their SHA-256 and count."""
+
+    def __init__(self, f: BinaryIO):
+        super().__init__()
+        self._f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._f.write(data)
+        self.sha256.update(data)
+        self.size += len(data)
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            super().close()
+            self._f.close()
+
+
+@contextmanager
+def atomic_write(path: str, newline: Optional[str] = None, binary: bool = False) -> Iterator[IO]:
+    directory, filename = os.path.split(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{filename}.{os.getpid()}.tmp")
+    try:
+        if binary:
+            f = open(tmp_path, "wb", buffering=WRITE_BUFFER_SIZE)
+        else:
+            f = open(tmp_path, "w", encoding="utf-8", newline=newline, buffering=WRITE_BUFFER_SIZE)
+        with f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def escape_csv(value: str) -> str:
+    value = value.replace("\n", " ")
+    if any(ch in value for ch in [",", '"', "\n"]):
+        value = '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def render_row(row: "Row") -> str:
+    return ",".join(map(escape_csv, row)) + "\n"
+
+
+class Writer:
+    """Writes an export's sections to one file. Row blocks ask the writer to render their rows (tuples of the
+    values of `fieldnames`, in order)."""
+
+    name = ""
+    extension = ""
+    file_filter = ""
+    # as for open(): None writes the platform's line endings
+    newline: Optional[str] = None
+
+    def render(self, sections: List["Section"], fieldnames: List[str]) -> str:
+        """The file's text with "\n" line endings, for short previews; files are streamed by write()."""
+        f = io.StringIO()
+        self.write(f, sections, fieldnames)
+        return f.getvalue()
+
+    def write(self, f: TextIO, sections: List["Section"], fieldnames: List[str]) -> None:
+        raise NotImplementedError
+
+    def render_rows(self, rows: Iterable["Row"], fieldnames: List[str], title: str) -> Iterable[str]:
+        raise NotImplementedError
+
+    def cache_key(self, title: str) -> Hashable:
+        # blocks rendered for several day files are cached under this key
+        return self.name
+
+
+class MarkdownWriter(Writer):
+    name = "markdown"
+    extension = ".md"
+    file_filter = "Markdown Files (*.md)"
+
+    def write(self, f: TextIO, sections: List["Section"], fieldnames: List[str]) -> None:
+        for idx, (title, blocks) in enumerate(sections):
+            if idx > 0:
+                f.write("\n\n")
+            f.write(f"## {title}\n\n")
+            if any(blocks):
+                f.write(",".join(fieldnames) + "\n")
+                for block in blocks:
+                    f.writelines(block.render(self, fieldnames, title))
+
+    def render_rows(self, rows: Iterable["Row"], fieldnames: List[str], title: str) -> Iterable[str]:
+        return map(render_row, rows)
+
+
+class CsvWriter(Writer):
+    """Plain CSV with the section as the first column, quoted by the C csv module."""
+
+    name = "csv"
+    extension = ".csv"
+    file_filter = "CSV Files (*.csv)"
+    newline = ""
+
+    def write(self, f: TextIO, sections: List["Section"], fieldnames: List[str]) -> None:
+        csv.writer(f, lineterminator="\n").writerow(["Section"] + fieldnames)
+        for title, blocks in sections:
+            for block in blocks:
+                f.writelines(block.render(self, fieldnames, title))
+
+    def render_rows(self, rows: Iterable["Row"], fieldnames: List[str], title: str) -> Iterable[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        rows = iter(rows)
+        while True:
+            chunk = [(title, *row) for row in islice(rows, CSV_CHUNK_ROWS)]
+            if not chunk:
+                return
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    def cache_key(self, title: str) -> Hashable:
+        return self.name, title
+
+
+class JsonlWriter(Writer):
+    """One JSON object per card: {"section": ..., "<field>": ...}."""
+
+    name = "jsonl"
+    extension = ".jsonl"
+    file_filter = "JSON Lines Files (*.jsonl)"
+
+    def __init__(self):
+        self._encode = json.JSONEncoder(ensure_ascii=False).encode
+
+    def write(self, f: TextIO, sections: List["Section"], fieldnames: List[str]) -> None:
+        for title, blocks in sections:
+            for block in blocks:
+                f.writelines(block.render(self, fieldnames, title))
+
+    def render_rows(self, rows: Iterable["Row"], fieldnames: List[str], title: str) -> Iterable[str]:
+        encode = self._encode
+        keys = ["section", *fieldnames]
+        for row in rows:
+            yield encode(dict(zip(keys, (title, *row)))) + "\n"
+
+    def cache_key(self, title: str) -> Hashable:
+        return self.name, title
+
+
+WRITERS = {writer.name: writer for writer in (MarkdownWriter, CsvWriter, JsonlWriter)}
+
+
+def get_writer(name: str) -> Writer:
+    # formats this version doesn't know (older configs said "json") keep the original markdown output
+    return WRITERS.get(name, MarkdownWriter)()
@@ -0,0 +1,44 @@
+import sqlite3
+from typing import List, Tuple
+
+import pytest
+
+from benchmarks.synth import generate_collection
+from plugin.collection import SqliteCollection
+
+DECK = "Languages"
+VOCAB_MID = 1_000
+# review cards in the first bucket
+FRESH = "c.type = 2 AND c.queue = 2 AND c.ivl < 7"
+
+
+@pytest.fixture
+def col(tmp_path):
+    path = generate_collection(str(tmp_path / "collection.anki2"), notes=400, revlog=4000, deck_depth=2)
+    col = SqliteCollection(path)
+    yield col
+    col.close()
+
+
+def modify(path: str, *statements) -> None:
+    """Runs (sql, args) statements in one transaction and bumps the collection's mod, as Anki does."""
+    db = sqlite3.connect(path)
+    with db:
+        for sql, args in statements:
+            db.execute(sql, args)
+        db.execute("UPDATE col SET mod = mod + 1")
+    db.close()
+
+
+def vocab_cards(col: SqliteCollection, where: str, limit: int = 1) -> List[Tuple[int, str]]:
+    """(card id, word) of deck cards whose note has no other card; synth gives them the note's id."""
+    deck_ids = ",".join(map(str, col.deck_and_child_ids(col.deck_id(DECK))))
+    rows = col.db.all(
+        f"""
+        SELECT c.id, n.flds FROM cards c JOIN notes n ON n.id = c.nid
+        WHERE n.mid = {VOCAB_MID} AND c.did IN ({deck_ids}) AND {where}
+        ORDER BY c.id LIMIT ?
+        """,
+        limit,
+    )
+    return [(cid, flds.split("\x1f")[0]) for cid, flds in rows]
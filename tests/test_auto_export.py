@@ -0,0 +1,120 @@
+import json
+
+from conftest import DECK, modify
+from plugin import auto_export, metrics
+from plugin.auto_export import AutoExporter, AutoExportState
+
+
+class FakeSignal:
+    def connect(self, callback) -> None:
+        self.callback = callback
+
+
+class FakeTimer:
+    def __init__(self, parent):
+        self.timeout = FakeSignal()
+        self.started = 0
+
+    def setSingleShot(self, single_shot: bool) -> None:
+        pass
+
+    def start(self, msec: int) -> None:
+        self.started += 1
+
+    def stop(self) -> None:
+        pass
+
+
+class FakeQueryOp:
+    """Runs the op right away on the calling thread; `ops` collects them when held back."""
+
+    held = False
+    ops = []
+
+    def __init__(self, parent, op, success):
+        self.parent, self.op, self.success = parent, op, success
+
+    def failure(self, callback) -> "FakeQueryOp":
+        self.on_failure = callback
+        return self
+
+    def run_in_background(self) -> None:
+        if self.held:
+            self.ops.append(self)
+        else:
+            self.finish()
+
+    def finish(self) -> None:
+        try:
+            result = self.op(self.parent.col)
+        except Exception as e:
+            self.on_failure(e)
+        else:
+            self.success(result)
+
+
+class FakeMainWindow:
+    def __init__(self, col):
+        self.col = col
+
+
+def setup_auto_exporter(col, tmp_path, monkeypatch, config: dict) -> AutoExporter:
+    monkeypatch.setattr(auto_export, "QTimer", FakeTimer)
+    monkeypatch.setattr(auto_export, "QueryOp", FakeQueryOp)
+    monkeypatch.setattr(FakeQueryOp, "ops", [])
+    monkeypatch.setattr(auto_export, "tooltip", lambda message: None)
+    monkeypatch.setattr(auto_export, "get_config", lambda: config)
+    monkeypatch.setattr(auto_export, "AnkiCollection", lambda col: col)
+    monkeypatch.setattr(auto_export, "AutoExportState", lambda: AutoExportState(str(tmp_path / "state.json")))
+    monkeypatch.setattr(metrics, "METRICS_LOG", str(tmp_path / "metrics.jsonl"))
+    return AutoExporter(FakeMainWindow(col))
+
+
+def review(col) -> None:
+    modify(col.path, ("UPDATE cards SET ivl = ivl + 1 WHERE id = (SELECT MIN(id) FROM cards WHERE type = 2)", ()))
+
+
+def test_reviews_without_a_sync_are_exported_at_close(col, tmp_path, monkeypatch):
+    config = {"fields": ["Word"], "last_deck": DECK, "auto_export_dir": str(tmp_path / "out")}
+    config["log_metrics"] = True
+    exporter = setup_auto_exporter(col, tmp_path, monkeypatch, config)
+    exporter.export_on_close()
+    assert len(list((tmp_path / "out").iterdir())) == 1
+
+    # nothing changed since: closing again exports nothing
+    (tmp_path / "metrics.jsonl").unlink()
+    exporter.export_on_close()
+    assert not (tmp_path / "metrics.jsonl").exists()
+
+    review(col)
+    exporter.export_on_close()
+    with open(tmp_path / "metrics.jsonl", encoding="utf-8") as f:
+        (entry,) = map(json.loads, f)
+    assert entry["trigger"] == "auto_export_close" and entry["close_delay"] >= 0 and entry["total_cards"] > 0
+
+
+def test_close_waits_for_the_running_export_without_blocking(col, tmp_path, monkeypatch):
+    config = {"fields": ["Word"], "last_deck": DECK, "auto_export_dir": str(tmp_path / "out")}
+    exporter = setup_auto_exporter(col, tmp_path, monkeypatch, config)
+    monkeypatch.setattr(FakeQueryOp, "held", True)
+    exporter._start()
+    # the sync's export still runs when the profile starts closing, so the close export follows it directly
+    exporter.export_on_close()
+    (sync_op,) = FakeQueryOp.ops
+    sync_op.finish()
+    sync_op, close_op = FakeQueryOp.ops
+    close_op.finish()
+    assert exporter._closing_since is None and exporter._timer.started == 0
+
+
+def test_a_failed_export_schedules_the_trigger_that_arrived_meanwhile(col, tmp_path, monkeypatch):
+    config = {"fields": ["Word"], "last_deck": DECK, "auto_export_dir": str(tmp_path / "out")}
+    exporter = setup_auto_exporter(col, tmp_path, monkeypatch, config)
+    monkeypatch.setattr(FakeQueryOp, "held", True)
+    exporter._start()
+    (failing_op,) = FakeQueryOp.ops
+    failing_op.op = lambda col: 1 / 0
+    exporter._start()
+    assert exporter._again
+    failing_op.finish()
+    assert exporter._timer.started == 1 and not exporter._again and not exporter._running
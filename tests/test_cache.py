@@ -0,0 +1,139 @@
+import os
+import time
+
+import pytest
+
+from conftest import DECK, FRESH, VOCAB_MID, modify, vocab_cards
+from plugin import cache as cache_module
+from plugin.cache import ExportCache
+from plugin.collection import SqliteCollection
+from plugin.exporter import VocabularyExporter
+from plugin.models import ExportSettings
+from plugin.writers import escape_csv
+
+FIELDS = ["Word", "Word Meaning", "Front"]
+
+
+def export_text(col: SqliteCollection, out_dir, use_cache: bool) -> str:
+    out_dir.mkdir(exist_ok=True)
+    output_path = out_dir / "vocab.md"
+    settings = ExportSettings(deck=DECK, fields=FIELDS, use_cache=use_cache)
+    result = VocabularyExporter(settings, col).export(str(out_dir), str(output_path))
+    assert result.success, result.error_message
+    return output_path.read_text(encoding="utf-8")
+
+
+def lists_word(text: str, word: str) -> bool:
+    return any(line.startswith(escape_csv(word) + ",") for line in text.splitlines())
+
+
+@pytest.mark.parametrize("reopen", [False, True], ids=["same_session", "new_session"])
+def test_cached_export_matches_uncached_export_after_changes(col, tmp_path, monkeypatch, reopen):
+    cache_path = str(tmp_path / "export_cache.bin")
+    now = int(time.time())
+
+    def assert_same_export() -> str:
+        # a new session starts from the sidecar file instead of the in-memory copy
+        if reopen or col.path not in cache_module._caches:
+            monkeypatch.setitem(cache_module._caches, col.path, ExportCache(cache_path, col.path))
+        cached = export_text(col, tmp_path / "cached", use_cache=True)
+        assert cached == export_text(col, tmp_path / "uncached", use_cache=False)
+        return cached
+
+    first = assert_same_export()
+    (edited_card, _), (deleted_card, deleted_word), (synced_card, _) = vocab_cards(col, FRESH, 3)
+
+    # a field edit and a card moving from Fresh to Mastered
+    modify(
+        col.path,
+        ("UPDATE notes SET flds = 'edited ' || flds, mod = ?, usn = -1 WHERE id = ?", (now, edited_card)),
+        ("UPDATE cards SET ivl = 200, mod = ?, usn = -1 WHERE id = ?", (now, edited_card)),
+    )
+    edited = assert_same_export()
+    assert edited != first and "edited " in edited
+
+    # one card deleted and another added, which leaves the row counts as they were
+    added_id = min(col.db.list("SELECT id FROM cards")) - 1
+    modify(
+        col.path,
+        ("DELETE FROM cards WHERE id = ?", (deleted_card,)),
+        ("DELETE FROM notes WHERE id = ?", (deleted_card,)),
+        (
+            "INSERT INTO notes VALUES (?, 'added', ?, ?, -1, '', ?, 'added_word', 0, 0, '')",
+            (added_id, VOCAB_MID, now, "added_word\x1fadded meaning\x1f\x1f"),
+        ),
+        (
+            "INSERT INTO cards VALUES (?, ?, ?, 0, ?, -1, 2, 2, 0, 5, 2500, 1, 0, 0, 0, 0, 0, '')",
+            (added_id, added_id, col.deck_id(DECK), now),
+        ),
+        (
+            "INSERT INTO revlog VALUES ((SELECT MAX(id) + 1 FROM revlog), ?, -1, 3, 5, 0, 2500, 5000, 1)",
+            (added_id,),
+        ),
+    )
+    assert lists_word(edited, deleted_word)
+    replaced = assert_same_export()
+    assert lists_word(replaced, "added_word") and not lists_word(replaced, deleted_word)
+
+    # another device's review, older than every review seen so far but synced in with a newer usn
+    modify(
+        col.path,
+        (
+            "INSERT INTO revlog VALUES ((SELECT MIN(id) - 1000 FROM revlog), ?, "
+            "(SELECT MAX(usn) + 1 FROM revlog), 3, 1, 0, 2500, 5000, 1)",
+            (synced_card,),
+        ),
+    )
+    synced = assert_same_export()
+    assert synced != replaced
+
+
+def test_review_then_sync_keeps_the_refresh_incremental(col, tmp_path, monkeypatch):
+    cache = ExportCache(str(tmp_path / "export_cache.bin"), col.path)
+    cache.refresh(col)
+    ((card, _),) = vocab_cards(col, FRESH)
+
+    queries = []
+    all_rows = col.db.all
+    monkeypatch.setattr(col.db, "all", lambda sql, *args: queries.append(sql) or all_rows(sql, *args))
+    # a review on this device, then a sync that stamps it with the server's usn
+    modify(
+        col.path,
+        ("INSERT INTO revlog VALUES ((SELECT MAX(id) + 1 FROM revlog), ?, -1, 3, 5, 0, 2500, 5000, 1)", (card,)),
+    )
+    cache.refresh(col)
+    modify(col.path, ("UPDATE revlog SET usn = (SELECT MAX(usn) + 1 FROM revlog) WHERE usn = -1", ()))
+    cache.refresh(col)
+
+    assert cache_module.CACHE_FIRST_REVIEWS_QUERY not in queries
+    assert cache.first_reviews == dict(all_rows(cache_module.CACHE_FIRST_REVIEWS_QUERY))
+    assert cache.revlog_marks.count == col.db.scalar("SELECT COUNT(*) FROM revlog")
+
+
+def test_changes_are_appended_to_the_sidecar_until_it_is_rewritten(col, tmp_path, monkeypatch):
+    cache_path = str(tmp_path / "export_cache.bin")
+    cache = ExportCache(cache_path, col.path)
+    cache.refresh(col)
+    full_size = os.path.getsize(cache_path)
+    now = int(time.time())
+
+    def edit(card: int) -> None:
+        modify(
+            col.path,
+            ("UPDATE notes SET flds = 'edited ' || flds, mod = ?, usn = -1 WHERE id = ?", (now, card)),
+            ("UPDATE cards SET ivl = 200, mod = ?, usn = -1 WHERE id = ?", (now, card)),
+        )
+        cache.refresh(col)
+        reopened = ExportCache(cache_path, col.path)
+        reopened.refresh(col)
+        assert reopened.cards == cache.cards and list(reopened.cards) == list(cache.cards)
+        assert reopened.notes == cache.notes and reopened.first_reviews == cache.first_reviews
+
+    (first, _), (second, _) = vocab_cards(col, FRESH, 2)
+    edit(first)
+    appended_size = os.path.getsize(cache_path)
+    assert full_size < appended_size < full_size + 1_000
+    # once the appended segments outgrow their share, the file is written whole again
+    monkeypatch.setattr(cache_module, "APPEND_LIMIT", 0)
+    edit(second)
+    assert os.path.getsize(cache_path) < appended_size
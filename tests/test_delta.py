@@ -0,0 +1,51 @@
+import json
+from datetime import date, timedelta
+
+from conftest import DECK, modify, vocab_cards
+from plugin import exporter as exporter_module
+from plugin.collection import SqliteCollection
+from plugin.delta import LAPSED, NEWLY_LEARNED, PROMOTED
+from plugin.exporter import VocabularyExporter
+from plugin.models import ExportSettings
+
+
+def export_delta(col: SqliteCollection, out_dir, monkeypatch, day: date) -> list:
+    """(section, word) of every row in the day's delta file."""
+
+    class ExportDay(date):
+        @classmethod
+        def today(cls):
+            return day
+
+    monkeypatch.setattr(exporter_module, "date", ExportDay)
+    settings = ExportSettings(deck=DECK, fields=["Word"], format="jsonl", delta_export=True)
+    result = VocabularyExporter(settings, col).export(str(out_dir))
+    assert result.success, result.error_message
+    with open(result.output_path, encoding="utf-8") as f:
+        return [(row["section"], row["Word"]) for row in map(json.loads, f)]
+
+
+def test_next_day_delta_lists_promoted_lapsed_and_newly_learned_cards(col, tmp_path, monkeypatch):
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    today = date.today()
+
+    # the first delta into a folder lists every card in a bucket as newly learned
+    first = export_delta(col, out_dir, monkeypatch, today)
+    assert first and {section for section, _ in first} == {NEWLY_LEARNED}
+
+    ((promoted, promoted_word),) = vocab_cards(col, "c.type = 2 AND c.queue = 2 AND c.ivl BETWEEN 1 AND 7")
+    ((lapsed, lapsed_word),) = vocab_cards(col, "c.type = 2 AND c.queue = 2 AND c.ivl BETWEEN 21 AND 89")
+    ((learned, learned_word),) = vocab_cards(col, "c.type = 0")
+    statements = []
+    for cid, card_type, queue, ivl in ((promoted, 2, 2, 30), (lapsed, 3, 1, 1), (learned, 2, 2, 1)):
+        statements.append(("UPDATE cards SET type = ?, queue = ?, ivl = ? WHERE id = ?", (card_type, queue, ivl, cid)))
+        statements.append(
+            ("INSERT INTO revlog VALUES ((SELECT MAX(id) + 1 FROM revlog), ?, -1, 3, ?, 0, 2500, 5000, 1)", (cid, ivl))
+        )
+    modify(col.path, *statements)
+
+    changes = export_delta(col, out_dir, monkeypatch, today + timedelta(days=1))
+    assert sorted(changes) == sorted([(PROMOTED, promoted_word), (LAPSED, lapsed_word), (NEWLY_LEARNED, learned_word)])
+    # a second delta the same day still compares against the previous day's export
+    assert export_delta(col, out_dir, monkeypatch, today + timedelta(days=1)) == changes
@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from plugin.forecast import BucketForecast, forecast_buckets
+from plugin.models import Bucket
+
+BUCKETS = [Bucket("Fresh", 1, 6), Bucket("Young", 7, 20), Bucket("Mature", 21)]
+TODAY = 1_000
+
+
+def test_projected_buckets_by_hand():
+    cards = [
+        # reviewed today: 5 * 2.0 = 10 days, Young from tomorrow
+        (1, 5, TODAY, 2000, 0),
+        # due tomorrow: 0.5 * 21 * 1.3 + 0.5 * 1 = 14.15 -> 14 days, Young from day 2
+        (2, 21, TODAY + 1, 1300, 0),
+        # four lapses recall with 0.5 ** 2: 0.25 * 8 * 2.5 + 0.75 * 1 = 5.75 -> 6 days, Fresh from day 4
+        (3, 8, TODAY + 3, 2500, 4),
+        # overdue and without an ease (FSRS): reviewed today at 2.5, 3 -> 8 days
+        (4, 3, TODAY - 2, 0, 0),
+        # due after the forecast's last day
+        (5, 3, TODAY + 5, 2500, 0),
+    ]
+    rates = {1: 1.0, 2: 0.5, 3: 0.5, 4: 1.0, 5: 1.0}
+    changes = {}
+    for card in cards:
+        forecast = forecast_buckets([card], TODAY, 5, BUCKETS, rates[card[0]], use_numpy=False)
+        for day in range(6):
+            changes.setdefault(day, []).extend(forecast.changes(day))
+    assert changes == {
+        0: [],
+        1: [(1, "Fresh", "Young"), (4, "Fresh", "Young")],
+        2: [(1, "Fresh", "Young"), (2, "Mature", "Young"), (4, "Fresh", "Young")],
+        3: [(1, "Fresh", "Young"), (2, "Mature", "Young"), (4, "Fresh", "Young")],
+        4: [(1, "Fresh", "Young"), (2, "Mature", "Young"), (3, "Young", "Fresh"), (4, "Fresh", "Young")],
+        5: [(1, "Fresh", "Young"), (2, "Mature", "Young"), (3, "Young", "Fresh"), (4, "Fresh", "Young")],
+    }
+
+
+def test_array_and_list_forecasts_agree():
+    pytest.importorskip("numpy")
+    rng = random.Random(7)
+    cards = [
+        (cid, rng.randint(1, 400), TODAY + rng.randint(-30, 60), rng.choice([0, 1300, 2500, 3100]), rng.randint(0, 6))
+        for cid in range(1, 5_001)
+    ]
+    arrays = forecast_buckets(cards, TODAY, 30, BUCKETS, 0.9, use_numpy=True)
+    lists = forecast_buckets(cards, TODAY, 30, BUCKETS, 0.9, use_numpy=False)
+    assert arrays.card_count == lists.card_count == len(cards)
+    for day in range(31):
+        assert arrays.changes(day) == lists.changes(day)
+
+
+def test_forecast_base_is_abstract():
+    with pytest.raises(TypeError):
+        BucketForecast(BUCKETS, 5)
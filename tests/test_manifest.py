@@ -0,0 +1,49 @@
+import os
+
+from plugin import manifest as manifest_module
+from plugin.manifest import CREATED, MANIFEST_NAME, UNCHANGED, UPDATED, ExportManifest
+
+
+def write_text(manifest: ExportManifest, path: str, text: str) -> tuple:
+    return manifest.write(path, lambda f: f.write(text))
+
+
+def test_created_updated_and_unchanged_files(tmp_path):
+    path = str(tmp_path / "vocab.md")
+    manifest = ExportManifest(str(tmp_path))
+    assert write_text(manifest, path, "a\n") == (CREATED, 2)
+    assert write_text(manifest, path, "a\n") == (UNCHANGED, 2)
+    assert write_text(manifest, path, "ab\n") == (UPDATED, 3)
+    manifest.save()
+    assert (tmp_path / "vocab.md").read_text() == "ab\n"
+
+    # a new export reads the fingerprints back, and a file edited by hand is compared by content
+    assert write_text(ExportManifest(str(tmp_path)), path, "ab\n")[0] == UNCHANGED
+    (tmp_path / "vocab.md").write_text("edited\n")
+    assert write_text(ExportManifest(str(tmp_path)), path, "ab\n")[0] == UPDATED
+
+
+def test_unchanged_files_leave_the_folder_alone(tmp_path, monkeypatch):
+    path = str(tmp_path / "vocab.md")
+    manifest = ExportManifest(str(tmp_path))
+    write_text(manifest, path, "a\n" * 100_000)
+    stat = os.stat(path)
+
+    opened = []
+    monkeypatch.setattr(manifest_module, "atomic_write", lambda *args, **kwargs: opened.append(args))
+    assert write_text(ExportManifest(str(tmp_path)), path, "a\n" * 100_000)[0] == UNCHANGED
+    assert opened == [] and os.listdir(tmp_path) == ["vocab.md"]
+    assert os.stat(path).st_mtime_ns == stat.st_mtime_ns
+
+
+def test_manifest_is_only_kept_for_folders_the_exporter_owns(tmp_path):
+    for persistent in (False, True):
+        folder = tmp_path / str(persistent)
+        folder.mkdir()
+        manifest = ExportManifest(str(folder), persistent=persistent)
+        assert write_text(manifest, str(folder / "vocab.md"), "a\n")[0] == CREATED
+        manifest.save()
+        assert os.path.exists(folder / MANIFEST_NAME) == persistent
+        # without a manifest the existing file's content still decides
+        reopened = ExportManifest(str(folder), persistent=persistent)
+        assert write_text(reopened, str(folder / "vocab.md"), "a\n")[0] == UNCHANGED
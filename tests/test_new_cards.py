@@ -0,0 +1,58 @@
+import sqlite3
+
+from benchmarks.synth import SCHEMA, _proto_field
+from plugin.collection import SqliteCollection
+from plugin.exporter import get_new_cards_by_day
+
+# deck name -> new cards per day
+DECK_LIMITS = {"Parent": 3, "Parent::A": 2, "Parent::B": 5}
+# deck name -> new cards in due order; a2s is suspended
+DECK_CARDS = {"Parent": ["p1"], "Parent::A": ["a1", "a2s", "a2", "a3", "a4"], "Parent::B": ["b1", "b2", "b3", "b4"]}
+SUSPENDED = {"a2s"}
+
+
+def build_collection(path: str) -> dict:
+    """A collection with DECK_CARDS as new cards; returns card name -> id."""
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    db.execute("INSERT INTO col VALUES (1, 0, 0, 0, 18, 0, 0, 0, '', '', '', '', '')")
+    card_ids = {}
+    for did, (name, limit) in enumerate(DECK_LIMITS.items(), start=1):
+        db.execute("INSERT INTO deck_config VALUES (?, ?, 0, 0, ?)", (did, name, _proto_field(9, limit)))
+        kind = _proto_field(1, _proto_field(1, did))
+        db.execute("INSERT INTO decks VALUES (?, ?, 0, 0, x'', ?)", (did, name.replace("::", "\x1f"), kind))
+        for due, card in enumerate(DECK_CARDS[name]):
+            cid = card_ids[card] = len(card_ids) + 1
+            queue = -1 if card in SUSPENDED else 0
+            db.execute(
+                "INSERT INTO cards VALUES (?, ?, ?, 0, 0, 0, 0, ?, ?, 0, 0, 0, 0, 0, 0, 0, 0, '')",
+                (cid, cid, did, queue, due),
+            )
+    db.commit()
+    db.close()
+    return card_ids
+
+
+def new_cards_by_day(tmp_path, deck_name, days_ahead):
+    card_ids = build_collection(str(tmp_path / "collection.anki2"))
+    names = {cid: card for card, cid in card_ids.items()}
+    col = SqliteCollection(str(tmp_path / "collection.anki2"))
+    try:
+        result = get_new_cards_by_day(col, deck_name, days_ahead)
+    finally:
+        col.close()
+    return {day: [names[cid] for cid in cids] for day, cids in result.items()}
+
+
+def test_subdeck_limits_are_capped_by_the_parent(tmp_path):
+    # the parent's 3 cards a day are shared by its own card and both subdecks, parents first; A stops at 2 a day
+    assert new_cards_by_day(tmp_path, "Parent", 3) == {
+        0: ["p1", "a1", "a2"],
+        1: ["a3", "a4", "b1"],
+        2: ["b2", "b3", "b4"],
+    }
+
+
+def test_exported_subdeck_only_applies_its_own_limit(tmp_path):
+    # ancestors outside the exported tree don't cap it
+    assert new_cards_by_day(tmp_path, "Parent::B", 2) == {0: ["b1", "b2", "b3", "b4"]}
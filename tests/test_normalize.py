@@ -0,0 +1,106 @@
+import pytest
+
+from plugin import normalize
+from plugin.normalize import (
+    CHUNK_NOTES,
+    FIELD_SEPARATOR,
+    FURIGANA_BRACKETS,
+    FURIGANA_KANJI,
+    FURIGANA_READING,
+    NOTE_SEPARATOR,
+    FieldNormalizer,
+    normalize_text,
+)
+
+
+@pytest.mark.parametrize(
+    "furigana, expected",
+    [
+        (FURIGANA_BRACKETS, "日本語[にほんご]を 勉強[べんきょう]する"),
+        (FURIGANA_KANJI, "日本語を勉強する"),
+        (FURIGANA_READING, "にほんごをべんきょうする"),
+    ],
+)
+def test_furigana_modes(furigana, expected):
+    assert normalize_text("日本語[にほんご]を 勉強[べんきょう]する", furigana) == expected
+
+
+def test_furigana_base_starts_after_a_tag_or_space():
+    assert normalize_text("<b>漢字[かんじ]</b>です", FURIGANA_KANJI) == "漢字です"
+    assert normalize_text("私は 学生[がくせい]", FURIGANA_READING) == "私はがくせい"
+    # brackets without a base are left alone
+    assert normalize_text("a [b]", FURIGANA_KANJI) == "a [b]"
+
+
+def test_long_runs_without_a_reading():
+    text = "漢" * 50_000 + "[x"
+    assert normalize_text(text, FURIGANA_KANJI) == text
+
+
+@pytest.mark.parametrize(
+    "html, expected",
+    [
+        ("<ruby>漢字<rt>かんじ</rt></ruby>", "漢字[かんじ]"),
+        ("<ruby><rb>漢</rb><rp>(</rp><rt>かん</rt><rp>)</rp></ruby>", "漢[かん]"),
+    ],
+)
+def test_ruby_becomes_anki_furigana(html, expected):
+    assert normalize_text(html) == expected
+    assert normalize_text(html, FURIGANA_KANJI) == expected.split("[")[0]
+
+
+def test_cloze_sound_and_hidden_content():
+    assert normalize_text("{{c1::猫::animal}} and {{c2::犬}}") == "猫 and 犬"
+    assert normalize_text("[sound:word.mp3]word<style>b {}</style><script>x()</script>") == "word"
+
+
+def test_line_breaks_tags_and_spaces():
+    assert normalize_text("a<br>b<BR />c<div>d</div>e") == "a\nb\ncd\ne"
+    assert normalize_text("  <b>bold</b> \t text  <br>  next ") == "bold text\nnext"
+
+
+def test_entities():
+    assert normalize_text("to&nbsp;believe &amp; &lt;x&gt; &#x65e5;") == "to believe & <x> 日"
+
+
+def test_fields_are_cleaned_one_by_one():
+    assert normalize_text(f" a <br>{FIELD_SEPARATOR}<b>b</b> ") == f"a{FIELD_SEPARATOR}b"
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        f"<b{FIELD_SEPARATOR}x>",
+        f"{{{{c1::a{NOTE_SEPARATOR}b}}}}",
+        f"<ruby>a{FIELD_SEPARATOR}<rt>b</rt></ruby>",
+        f"[sound:a{NOTE_SEPARATOR}b]",
+        f"a{FIELD_SEPARATOR}[b]",
+    ],
+)
+def test_patterns_never_match_across_separators(text):
+    assert normalize_text(text, FURIGANA_KANJI).count(FIELD_SEPARATOR) == text.count(FIELD_SEPARATOR)
+    assert normalize_text(text, FURIGANA_KANJI).count(NOTE_SEPARATOR) == text.count(NOTE_SEPARATOR)
+
+
+def test_entities_cannot_produce_separators():
+    assert normalize_text("a&#30;b&#x1f;c&#31;d") == "abcd"
+
+
+def test_normalizer_cleans_notes_in_chunks_and_reuses_unchanged_ones(monkeypatch):
+    monkeypatch.setattr(normalize, "_normalized_cache", {})
+    notes = [(nid, 1, f"<b>word{nid}</b>{FIELD_SEPARATOR}語[ご]{nid}") for nid in range(CHUNK_NOTES * 2 + 7)]
+    expected = [normalize_text(flds, FURIGANA_READING) for _, _, flds in notes]
+    assert FieldNormalizer("collection", FURIGANA_READING).normalize_notes(notes) == expected
+
+    calls = []
+    monkeypatch.setattr(normalize, "normalize_text", lambda text, furigana: calls.append(text) or text)
+    changed = [(nid, mod + 1 if nid == 3 else mod, flds) for nid, mod, flds in notes]
+    cleaned = FieldNormalizer("collection", FURIGANA_READING).normalize_notes(changed)
+    # only the note whose mod changed is cleaned again
+    assert calls == [notes[3][2]]
+    assert cleaned[:3] == expected[:3] and cleaned[4:] == expected[4:]
+
+
+def test_unknown_furigana_mode():
+    with pytest.raises(ValueError):
+        FieldNormalizer("collection", "romaji")